@@ -0,0 +1,113 @@
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+# Words of the synthetic corpus: Zipf-distributed over a random lexicon, like natural-language text.
+SYNTHETIC_LEXICON_SIZE = 200000
+SYNTHETIC_LETTERS = "etaoinshrdlcumwfgypbvkjxqz"
+# A few multi-byte UTF-8 characters, so byte-level merges see non-ASCII input.
+SYNTHETIC_ACCENTS = "éüñçøå"
+
+
+def peak_rss_bytes(children: bool = False) -> int:
+    """Peak resident set size of the current process so far, or of its largest terminated child process."""
+    max_rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes.
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def time_call(fn: Callable[[], Any], warmup: int = 1, repeats: int = 5) -> list[float]:
+    """Wall-clock seconds of `repeats` calls to `fn` after `warmup` untimed calls."""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run_isolated(fn: Callable[..., Any], *args: Any) -> Any:
+    """Run `fn(*args)` in a fresh spawned process and return its result.
+
+    `ru_maxrss` never decreases, so each measurement that reports a memory
+    high-water mark needs a process of its own. `fn` must be importable.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(fn, *args).result()
+
+
+def run_script_metrics(script: str | os.PathLike, arguments: list[str]) -> list[dict]:
+    """Run a script that takes `--metrics` (such as train_lm.py) in a fresh interpreter and return its JSONL records."""
+    with tempfile.TemporaryDirectory() as tmp:
+        metrics_path = Path(tmp) / "metrics.jsonl"
+        command = [sys.executable, str(script), *arguments, f"--metrics={metrics_path}"]
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        return [json.loads(line) for line in metrics_path.read_text().splitlines()]
+
+
+def git_revision(path: str | os.PathLike = ".") -> str | None:
+    """`git describe --always --dirty` of the checkout containing `path`, to tag benchmark records with."""
+    try:
+        result = subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=path, capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def _synthetic_lexicon(rng: np.random.Generator) -> np.ndarray:
+    letter_weights = 1.0 / np.arange(1, len(SYNTHETIC_LETTERS) + 1)
+    letters = np.array(list(SYNTHETIC_LETTERS))
+    words = []
+    for length in 1 + rng.poisson(4.0, SYNTHETIC_LEXICON_SIZE):
+        word = "".join(rng.choice(letters, size=length, p=letter_weights / letter_weights.sum()))
+        if rng.random() < 0.02:
+            position = rng.integers(len(word))
+            word = word[:position] + SYNTHETIC_ACCENTS[rng.integers(len(SYNTHETIC_ACCENTS))] + word[position + 1 :]
+        words.append(word)
+    # Frequent words are short, as in natural language.
+    return np.array(sorted(dict.fromkeys(words), key=len), dtype=object)
+
+
+def write_synthetic_corpus(
+    path: str | os.PathLike, num_bytes: int, seed: int = 0, special_token: str = "<|endoftext|>"
+) -> None:
+    """Write about `num_bytes` of English-like text to `path`.
+
+    Words come from a fixed random lexicon with Zipfian frequencies, grouped
+    into sentences (some with commas and numbers) and into documents that end
+    with `special_token`, so pre-token and pair statistics behave like a real
+    corpus. The same `seed` always gives the same text.
+    """
+    rng = np.random.default_rng(seed)
+    lexicon = _synthetic_lexicon(rng)
+    word_weights = 1.0 / np.arange(1, len(lexicon) + 1)
+    word_weights /= word_weights.sum()
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < num_bytes:
+            words = lexicon[rng.choice(len(lexicon), size=1 << 16, p=word_weights)]
+            draws = rng.random(len(words))
+            numbers = draws < 0.01
+            words[numbers] = rng.integers(0, 2000, numbers.sum()).astype(str)
+            words[(draws >= 0.01) & (draws < 0.05)] += ","
+            sentence_ends = draws >= 0.92
+            words[sentence_ends] += rng.choice(np.array([".", ".", ".", "!", "?"], dtype=object), sentence_ends.sum())
+            words[draws >= 0.995] += f"\n{special_token}\n"
+            text = " ".join(words) + " "
+            f.write(text)
+            written += len(text.encode("utf-8"))
@@ -0,0 +1,169 @@
+import math
+
+import torch
+from jaxtyping import Bool, Float
+from torch import Tensor
+
+DEFAULT_QUERY_TILE_SIZE = 128
+DEFAULT_KEY_TILE_SIZE = 128
+
+
+def _tile_scores(
+    q_tile: Tensor,
+    k_tile: Tensor,
+    scale: float,
+    mask: Tensor | None,
+    is_causal: bool,
+    q_start: int,
+    k_start: int,
+    causal_offset: int,
+) -> Tensor:
+    """Scaled scores of one (query tile, key tile) block with masking applied."""
+    scores = (q_tile @ k_tile.transpose(-2, -1)) * scale
+    q_end = q_start + q_tile.shape[-2]
+    k_end = k_start + k_tile.shape[-2]
+    if mask is not None:
+        scores = scores.masked_fill(~mask[..., q_start:q_end, k_start:k_end], float("-inf"))
+    # Only tiles that straddle the diagonal need an explicit causal mask.
+    if is_causal and k_end - 1 > q_start + causal_offset:
+        query_positions = torch.arange(q_start, q_end, device=scores.device) + causal_offset
+        key_positions = torch.arange(k_start, k_end, device=scores.device)
+        scores = scores.masked_fill(key_positions > query_positions.unsqueeze(-1), float("-inf"))
+    return scores
+
+
+def _key_limit(num_keys: int, is_causal: bool, q_end: int, causal_offset: int) -> int:
+    """Number of leading keys that the queries of a tile ending at `q_end` may attend to."""
+    if not is_causal:
+        return num_keys
+    return min(num_keys, q_end + causal_offset)
+
+
+class _BlockwiseAttention(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, Q, K, V, mask, is_causal, q_tile_size, k_tile_size):
+        num_queries, num_keys = Q.shape[-2], K.shape[-2]
+        scale = 1.0 / math.sqrt(Q.shape[-1])
+        # Causal attention is bottom-right aligned so queries can be the suffix of the keys (KV cache).
+        causal_offset = num_keys - num_queries
+        # Softmax statistics and accumulators are kept in at least fp32.
+        compute_dtype = torch.promote_types(Q.dtype, torch.float32)
+        batch_shape = torch.broadcast_shapes(
+            Q.shape[:-2], K.shape[:-2], V.shape[:-2], *([mask.shape[:-2]] if mask is not None else [])
+        )
+
+        out = torch.empty((*batch_shape, num_queries, V.shape[-1]), dtype=Q.dtype, device=Q.device)
+        log_sum_exp = torch.empty((*batch_shape, num_queries), dtype=compute_dtype, device=Q.device)
+
+        for q_start in range(0, num_queries, q_tile_size):
+            q_end = min(q_start + q_tile_size, num_queries)
+            q_tile = Q[..., q_start:q_end, :]
+            row_max = torch.full((*batch_shape, q_end - q_start), float("-inf"), dtype=compute_dtype, device=Q.device)
+            row_sum = torch.zeros_like(row_max)
+            acc = torch.zeros((*batch_shape, q_end - q_start, V.shape[-1]), dtype=compute_dtype, device=Q.device)
+
+            for k_start in range(0, _key_limit(num_keys, is_causal, q_end, causal_offset), k_tile_size):
+                k_end = min(k_start + k_tile_size, num_keys)
+                scores = _tile_scores(
+                    q_tile, K[..., k_start:k_end, :], scale, mask, is_causal, q_start, k_start, causal_offset
+                ).to(compute_dtype)
+
+                new_max = torch.maximum(row_max, scores.amax(dim=-1))
+                # Rows that have seen only masked keys keep a -inf max; shift them by 0 to avoid inf - inf.
+                safe_max = new_max.masked_fill(new_max == float("-inf"), 0.0)
+                probs = (scores - safe_max.unsqueeze(-1)).exp()
+                correction = (row_max - safe_max).exp()
+                row_sum = row_sum * correction + probs.sum(dim=-1)
+                acc = acc * correction.unsqueeze(-1) + probs @ V[..., k_start:k_end, :].to(compute_dtype)
+                row_max = new_max
+
+            out[..., q_start:q_end, :] = acc / row_sum.unsqueeze(-1)
+            log_sum_exp[..., q_start:q_end] = row_max + row_sum.log()
+
+        ctx.save_for_backward(Q, K, V, out, log_sum_exp, mask)
+        ctx.is_causal = is_causal
+        ctx.tile_sizes = (q_tile_size, k_tile_size)
+        return out
+
+    @staticmethod
+    def backward(ctx, grad_out):
+        Q, K, V, out, log_sum_exp, mask = ctx.saved_tensors
+        is_causal = ctx.is_causal
+        q_tile_size, k_tile_size = ctx.tile_sizes
+        num_queries, num_keys = Q.shape[-2], K.shape[-2]
+        scale = 1.0 / math.sqrt(Q.shape[-1])
+        causal_offset = num_keys - num_queries
+        compute_dtype = log_sum_exp.dtype
+
+        grad_out = grad_out.to(compute_dtype)
+        # D_i = sum_j dO_ij * O_ij, the softmax-jacobian correction per query row.
+        row_dot = (grad_out * out.to(compute_dtype)).sum(dim=-1)
+        batch_shape = row_dot.shape[:-1]
+        grad_q = torch.zeros((*batch_shape, *Q.shape[-2:]), dtype=compute_dtype, device=Q.device)
+        grad_k = torch.zeros((*batch_shape, *K.shape[-2:]), dtype=compute_dtype, device=K.device)
+        grad_v = torch.zeros((*batch_shape, *V.shape[-2:]), dtype=compute_dtype, device=V.device)
+
+        for q_start in range(0, num_queries, q_tile_size):
+            q_end = min(q_start + q_tile_size, num_queries)
+            q_tile = Q[..., q_start:q_end, :]
+            grad_out_tile = grad_out[..., q_start:q_end, :]
+            lse_tile = log_sum_exp[..., q_start:q_end].unsqueeze(-1)
+            row_dot_tile = row_dot[..., q_start:q_end].unsqueeze(-1)
+
+            for k_start in range(0, _key_limit(num_keys, is_causal, q_end, causal_offset), k_tile_size):
+                k_end = min(k_start + k_tile_size, num_keys)
+                k_tile = K[..., k_start:k_end, :]
+                v_tile = V[..., k_start:k_end, :].to(compute_dtype)
+                scores = _tile_scores(q_tile, k_tile, scale, mask, is_causal, q_start, k_start, causal_offset).to(
+                    compute_dtype
+                )
+                probs = (scores - lse_tile).exp()
+
+                grad_v[..., k_start:k_end, :] += probs.transpose(-2, -1) @ grad_out_tile
+                grad_scores = probs * (grad_out_tile @ v_tile.transpose(-2, -1) - row_dot_tile) * scale
+                grad_q[..., q_start:q_end, :] += grad_scores @ k_tile.to(compute_dtype)
+                grad_k[..., k_start:k_end, :] += grad_scores.transpose(-2, -1) @ q_tile.to(compute_dtype)
+
+        return (
+            _reduce_to_shape(grad_q, Q).to(Q.dtype),
+            _reduce_to_shape(grad_k, K).to(K.dtype),
+            _reduce_to_shape(grad_v, V).to(V.dtype),
+            None,
+            None,
+            None,
+            None,
+        )
+
+
+def _reduce_to_shape(grad: Tensor, like: Tensor) -> Tensor:
+    """Sum a gradient over the batch dimensions that were broadcast in the forward pass."""
+    if grad.shape == like.shape:
+        return grad
+    extra_dims = grad.dim() - like.dim()
+    if extra_dims > 0:
+        grad = grad.sum(dim=tuple(range(extra_dims)))
+    broadcast_dims = tuple(i for i, size in enumerate(like.shape) if size == 1 and grad.shape[i] != 1)
+    return grad.sum(dim=broadcast_dims, keepdim=True) if broadcast_dims else grad
+
+
+def blockwise_attention(
+    Q: Float[Tensor, " ... queries d_k"],
+    K: Float[Tensor, " ... keys d_k"],
+    V: Float[Tensor, " ... keys d_v"],
+    mask: Bool[Tensor, " ... queries keys"] | None = None,
+    is_causal: bool = False,
+    q_tile_size: int = DEFAULT_QUERY_TILE_SIZE,
+    k_tile_size: int = DEFAULT_KEY_TILE_SIZE,
+) -> Float[Tensor, " ... queries d_v"]:
+    """Scaled dot-product attention computed tile by tile with an online softmax.
+
+    Only a `(q_tile_size, k_tile_size)` block of scores exists at any time, in
+    both the forward pass and the backward pass (which recomputes the scores of
+    each tile from the saved per-row log-sum-exp). With `is_causal`, key tiles
+    past the diagonal are skipped and the causal mask is generated per tile from
+    indices, aligned so that the queries are the last `queries` of the `keys`
+    positions. An explicit boolean `mask` (True = attend) may be combined with it.
+    """
+    if q_tile_size <= 0 or k_tile_size <= 0:
+        raise ValueError(f"tile sizes must be positive, got {q_tile_size} and {k_tile_size}")
+    return _BlockwiseAttention.apply(Q, K, V, mask, is_causal, q_tile_size, k_tile_size)
@@ -1,9 +1,17 @@
 import os
 import heapq
-from functools import lru_cache
+import math
+import random
+import time
+from array import array
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from itertools import pairwise
 from concurrent.futures import ProcessPoolExecutor
 from cs336_basics.pretokenization_example import find_chunk_boundaries
 import regex as re
+from tqdm import tqdm
 
 
 PRE_TPKEN_PAT = (
@@ -11,6 +19,13 @@ PRE_TPKEN_PAT = (
 )
 PRE_TOKEN_RE = re.compile(PRE_TPKEN_PAT)
 SINGLE_BYTE_TOKENS = tuple(bytes([i]) for i in range(256))
+# Merges between two "merges" profile events, unless kwargs["profile_interval"] says otherwise.
+DEFAULT_PROFILE_INTERVAL = 100
+# With kwargs["sample_rate"] < 1, the file is cut into this many candidate chunks (fewer if the
+# special-token boundaries collapse) and that fraction of them is pre-tokenized.
+SAMPLE_NUM_CHUNKS = 1024
+# Leading fractions of the merge list that merge_overlap compares separately.
+OVERLAP_FRACTIONS = (0.1, 0.5, 1.0)
 
 
 class _ReversePairOrder:
@@ -65,6 +80,96 @@ def _count_chunk_pretokens(
     return counts
 
 
+def _iter_chunk_pretokens(chunk: str, special_tokens: tuple[str, ...]) -> Iterator[bytes]:
+    """The pre-tokens `_count_chunk_pretokens` counts in `chunk`, special tokens included, in order."""
+    last_index = 0
+    if special_tokens:
+        for match in get_special_token_re(special_tokens).finditer(chunk):
+            start_index, end_index = match.span()
+            if start_index > last_index:
+                for pre in PRE_TOKEN_RE.finditer(chunk[last_index:start_index]):
+                    yield pre.group(0).encode("utf-8")
+            yield match.group(0).encode("utf-8")
+            last_index = end_index
+    if last_index < len(chunk):
+        for pre in PRE_TOKEN_RE.finditer(chunk[last_index:]):
+            yield pre.group(0).encode("utf-8")
+
+
+def _add_lost_pairs(lost_pairs: dict[int, int], pre_bytes: bytes, count: int) -> None:
+    """Record `count` dropped occurrences of `pre_bytes` by the byte pairs (`left << 8 | right`) in it."""
+    for left, right in pairwise(pre_bytes):
+        key = left << 8 | right
+        lost_pairs[key] = lost_pairs.get(key, 0) + count
+
+
+def _prune_pre_token_counts(
+    counts: dict[bytes, int], capacity: int, lost_pairs: dict[int, int], special_tokens: frozenset[bytes]
+) -> None:
+    """Keep the `capacity` most counted pre-tokens, breaking ties by their bytes so the result is deterministic.
+
+    Special tokens are always kept (and take up capacity): they never
+    contribute pairs, so dropping them would only inflate `lost_pairs`.
+    A pre-token that comes back after being dropped starts counting from zero
+    again, so its final count is short by what was dropped; `lost_pairs`
+    records those drops by byte pair. The survivors keep their counts rather
+    than having a threshold subtracted as in Misra-Gries, which loses less of
+    the frequent pre-tokens that decide the merges.
+    """
+    if len(counts) <= capacity:
+        return
+    kept = {pre_bytes: count for pre_bytes, count in counts.items() if pre_bytes in special_tokens}
+    candidates = (item for item in counts.items() if item[0] not in kept)
+    kept.update(heapq.nsmallest(max(0, capacity - len(kept)), candidates, key=lambda item: (-item[1], item[0])))
+    for pre_bytes, count in counts.items():
+        if pre_bytes not in kept:
+            _add_lost_pairs(lost_pairs, pre_bytes, count)
+    counts.clear()
+    counts.update(kept)
+
+
+def _count_chunk_pretokens_bounded(
+    chunk_spec: tuple[str, int, int, tuple[str, ...]],
+    max_pre_tokens: int,
+) -> tuple[dict[bytes, int], dict[int, int]]:
+    """`_count_chunk_pretokens` as a bounded counter of at most `max_pre_tokens` pre-tokens.
+
+    Up to twice that many counters are alive between prunes. Also returns the
+    byte pair occurrences lost to `_prune_pre_token_counts`.
+    """
+    input_path, start, end, special_tokens = chunk_spec
+    with open(input_path, "rb") as f:
+        f.seek(start)
+        chunk = f.read(end - start).decode("utf-8", errors="ignore")
+
+    special_token_bytes = frozenset(token.encode("utf-8") for token in special_tokens)
+    counts: dict[bytes, int] = {}
+    lost_pairs: dict[int, int] = {}
+    limit = 2 * max_pre_tokens
+    for pre_bytes in _iter_chunk_pretokens(chunk, special_tokens):
+        count = counts.get(pre_bytes)
+        if count is not None:
+            counts[pre_bytes] = count + 1
+            continue
+        if len(counts) >= limit:
+            _prune_pre_token_counts(counts, max_pre_tokens, lost_pairs, special_token_bytes)
+        counts[pre_bytes] = 1
+    _prune_pre_token_counts(counts, max_pre_tokens, lost_pairs, special_token_bytes)
+    return counts, lost_pairs
+
+
+def _count_chunk_pretokens_timed(
+    chunk_spec: tuple[str, int, int, tuple[str, ...]],
+    max_pre_tokens: int | None = None,
+) -> tuple[dict[bytes, int], dict[int, int], float]:
+    start = time.perf_counter()
+    if max_pre_tokens is None:
+        counts, lost_pairs = _count_chunk_pretokens(chunk_spec), {}
+    else:
+        counts, lost_pairs = _count_chunk_pretokens_bounded(chunk_spec, max_pre_tokens)
+    return counts, lost_pairs, time.perf_counter() - start
+
+
 @lru_cache(maxsize=32)
 def get_special_token_re(special_tokens: tuple[str, ...]) -> re.Pattern:
     escaped_specials = "|".join(
@@ -101,6 +206,93 @@ def _merge_pair_in_sequence(
     return tuple(out)
 
 
+def _count_shard_pairs(
+    shard_spec: tuple[bytes, array, array, int, frozenset[bytes]],
+) -> tuple[array, array, array, array, float]:
+    """Pair statistics of one shard of the unique pre-tokens, as flat arrays that pickle compactly.
+
+    Every token is still a single byte here, so each pair is packed into an int as `left << 8 | right`.
+    Returns the sorted pair keys, their weighted counts, and a CSR index into the global pre-token
+    order (pre_token_indices[offsets[k]:offsets[k + 1]] contain pair_keys[k]), plus the seconds spent.
+    """
+    blob, lengths, counts, first_index, special_tokens = shard_spec
+    start = time.perf_counter()
+    pair_counts: dict[int, int] = {}
+    pair_members: dict[int, list[int]] = {}
+    position = 0
+    for index, (length, count) in enumerate(zip(lengths, counts), first_index):
+        pre_bytes = blob[position : position + length]
+        position += length
+        if length < 2 or pre_bytes in special_tokens:
+            continue
+        keys = [left << 8 | right for left, right in pairwise(pre_bytes)]
+        for key in keys:
+            pair_counts[key] = pair_counts.get(key, 0) + count
+        for key in set(keys):
+            members = pair_members.get(key)
+            if members is None:
+                pair_members[key] = [index]
+            else:
+                members.append(index)
+
+    pair_keys = array("H", sorted(pair_counts))
+    pair_totals = array("Q", [pair_counts[key] for key in pair_keys])
+    offsets = array("Q", [0])
+    pre_token_indices = array("I")
+    for key in pair_keys:
+        pre_token_indices.extend(pair_members[key])
+        offsets.append(len(pre_token_indices))
+    return pair_keys, pair_totals, offsets, pre_token_indices, time.perf_counter() - start
+
+
+def _build_pair_index(
+    pre_token_map: dict[tuple[bytes, ...], int],
+    special_token_tuples: set[tuple[bytes, ...]],
+    executor: ProcessPoolExecutor | None = None,
+    num_shards: int = 1,
+) -> tuple[dict[tuple[bytes, bytes], int], dict[tuple[bytes, bytes], set[tuple[bytes, ...]]], list[float]]:
+    """Initial pair_counts and pair_to_pre_tokens of single-byte pre-tokens, built shard by shard.
+
+    The shards run on `executor` if given, else in this process; the per-shard tables are then
+    summed here. Also returns the seconds each shard took.
+    """
+    pre_tokens = list(pre_token_map)
+    counts = list(pre_token_map.values())
+    special_tokens = frozenset(b"".join(token) for token in special_token_tuples)
+    bounds = [len(pre_tokens) * i // num_shards for i in range(num_shards + 1)]
+    shard_specs = [
+        (
+            b"".join(b"".join(pre_token) for pre_token in pre_tokens[lo:hi]),
+            array("I", map(len, pre_tokens[lo:hi])),
+            array("Q", counts[lo:hi]),
+            lo,
+            special_tokens,
+        )
+        for lo, hi in pairwise(bounds)
+    ]
+    del counts
+    if executor is None:
+        shard_results = map(_count_shard_pairs, shard_specs)
+    else:
+        shard_results = executor.map(_count_shard_pairs, shard_specs)
+
+    pair_counts: dict[tuple[bytes, bytes], int] = {}
+    pair_to_pre_tokens: dict[tuple[bytes, bytes], set[tuple[bytes, ...]]] = {}
+    shard_seconds: list[float] = []
+    for pair_keys, pair_totals, offsets, pre_token_indices, seconds in shard_results:
+        shard_seconds.append(seconds)
+        for k, (key, total) in enumerate(zip(pair_keys, pair_totals)):
+            pair = (SINGLE_BYTE_TOKENS[key >> 8], SINGLE_BYTE_TOKENS[key & 0xFF])
+            pair_counts[pair] = pair_counts.get(pair, 0) + total
+            members = map(pre_tokens.__getitem__, pre_token_indices[offsets[k] : offsets[k + 1]])
+            pre_tokens_for_pair = pair_to_pre_tokens.get(pair)
+            if pre_tokens_for_pair is None:
+                pair_to_pre_tokens[pair] = set(members)
+            else:
+                pre_tokens_for_pair.update(members)
+    return pair_counts, pair_to_pre_tokens, shard_seconds
+
+
 def _push_pair_heap_entry(
     pair_heap: list[tuple[int, _ReversePairOrder, tuple[bytes, bytes]]],
     pair: tuple[bytes, bytes],
@@ -124,112 +316,70 @@ def _pop_best_pair(
     return None
 
 
-def my_run_train_bpe(
-    input_path: str | os.PathLike,
-    vocab_size: int,
-    special_tokens: list[str],
-    kwargs: dict | None = None,
-) -> tuple[dict[int, bytes], list[tuple[bytes, bytes]]]:
-    """Given the path to an input corpus, run train a BPE tokenizer and
-    output its vocabulary and merges.
+class _MergeState:
+    """Incremental pair statistics over the unique pre-tokens, updated in place by each merge.
 
-    Args:
-        input_path (str | os.PathLike): Path to BPE tokenizer training data.
-        vocab_size (int): Total number of items in the tokenizer's vocabulary (including special tokens).
-        special_tokens (list[str]): A list of string special tokens to be added to the tokenizer vocabulary.
-            These strings will never be split into multiple tokens, and will always be
-            kept as a single token. If these special tokens occur in the `input_path`,
-            they are treated as any other string.
-
-    Returns:
-        tuple[dict[int, bytes], list[tuple[bytes, bytes]]]:
-            vocab:
-                The trained tokenizer vocabulary, a mapping from int (token ID in the vocabulary)
-                to bytes (token bytes)
-            merges:
-                BPE merges. Each list item is a tuple of bytes (<token1>, <token2>),
-                representing that <token1> was merged with <token2>.
-                Merges are ordered by order of creation.
+    - pair_counts: global weighted pair frequency across all pre-tokens
+    - pair_to_pre_tokens: reverse index of which pre-tokens contain each pair
+    - pre_token_pair_occurrences: pair multiplicities inside each unique pre-token, filled in lazily
+    - pair_heap: lazily invalidated max-heap of (count, pair); stale entries are skipped on pop
     """
-    kwargs = kwargs or {}
-
-    vocab: dict[int, bytes] = {i: SINGLE_BYTE_TOKENS[i] for i in range(256)}
-
-    cur_token_id = 256
-
-    for special in special_tokens:
-        vocab[cur_token_id] = special.encode("utf-8")
-        cur_token_id += 1
-
-    merges: list[tuple[bytes, bytes]] = []
-
-    # pre-token -> frequency
-    pre_token_map: dict[tuple[bytes, ...], int] = {}
 
-    # initial pair count for pre-tokens
-    num_processes = max(1, int(kwargs.get("num_processes", min(8, os.cpu_count() or 1))))
-    input_path_str = os.fspath(input_path)
-
-    with open(input_path, "rb") as f:
-        boundaries = find_chunk_boundaries(f, num_processes, b"<|endoftext|>")
-    special_tokens_tuple = tuple(special_tokens)
-    chunk_specs = [
-        (input_path_str, start, end, special_tokens_tuple)
-        for start, end in zip(boundaries[:-1], boundaries[1:])
-        if end > start
-    ]
-
-    pre_token_bytes_counts: dict[bytes, int] = {}
-    # Always process chunks via multiprocessing.
-    with ProcessPoolExecutor(max_workers=num_processes) as executor:
-        for chunk_counts in executor.map(_count_chunk_pretokens, chunk_specs):
-            for pre_bytes, count in chunk_counts.items():
-                pre_token_bytes_counts[pre_bytes] = (
-                    pre_token_bytes_counts.get(pre_bytes, 0) + count
-                )
-
-    for pre_bytes, count in pre_token_bytes_counts.items():
-        pre_tuple = tuple(SINGLE_BYTE_TOKENS[b] for b in pre_bytes)
-        pre_token_map[pre_tuple] = count
-
-    special_token_tuples = {
-        tuple(SINGLE_BYTE_TOKENS[b] for b in s.encode("utf-8"))
-        for s in special_tokens
-    }
-
-    # Incremental merge state:
-    # - pair_counts: global weighted pair frequency across all pre-tokens
-    # - pair_to_pre_tokens: reverse index of which pre-tokens contain each pair
-    # - pre_token_pair_occurrences: pair multiplicities inside each unique pre-token
-    pair_counts: dict[tuple[bytes, bytes], int] = {}
-    pair_to_pre_tokens: dict[tuple[bytes, bytes], set[tuple[bytes, ...]]] = {}
-    pre_token_pair_occurrences: dict[tuple[bytes, ...], dict[tuple[bytes, bytes], int]] = {}
-    pair_heap: list[tuple[int, _ReversePairOrder, tuple[bytes, bytes]]] = []
-
-    for pre_token_bytes, pre_token_count in pre_token_map.items():
-        if pre_token_bytes in special_token_tuples or len(pre_token_bytes) < 2:
-            pre_token_pair_occurrences[pre_token_bytes] = {}
-            continue
-        occurrence_map = _pair_occurrences(pre_token_bytes)
-        pre_token_pair_occurrences[pre_token_bytes] = occurrence_map
-        for pair, pair_occurrence_count in occurrence_map.items():
-            pair_counts[pair] = pair_counts.get(pair, 0) + (pair_occurrence_count * pre_token_count)
-            pair_to_pre_tokens.setdefault(pair, set()).add(pre_token_bytes)
-
-    for pair, count in pair_counts.items():
-        _push_pair_heap_entry(pair_heap, pair, count)
-
-    while len(vocab) < vocab_size:
-        max_pair = _pop_best_pair(pair_heap, pair_counts)
-        if max_pair is None:
-            break
-
-        merges.append(max_pair)
-        merged_token = max_pair[0] + max_pair[1]
+    __slots__ = (
+        "pair_counts",
+        "pair_heap",
+        "pair_to_pre_tokens",
+        "pre_token_map",
+        "pre_token_pair_occurrences",
+        "special_token_tuples",
+    )
 
-        # add to vocab
-        vocab[cur_token_id] = merged_token
-        cur_token_id += 1
+    def __init__(
+        self,
+        pre_token_map: dict[tuple[bytes, ...], int],
+        special_token_tuples: set[tuple[bytes, ...]],
+        pair_index: tuple[
+            dict[tuple[bytes, bytes], int], dict[tuple[bytes, bytes], set[tuple[bytes, ...]]]
+        ] | None = None,
+    ):
+        """`pair_index` is the (pair_counts, pair_to_pre_tokens) of `_build_pair_index`, built here if None."""
+        self.pre_token_map = pre_token_map
+        self.special_token_tuples = special_token_tuples
+        if pair_index is None:
+            pair_index = _build_pair_index(pre_token_map, special_token_tuples)[:2]
+        self.pair_counts, self.pair_to_pre_tokens = pair_index
+        self.pre_token_pair_occurrences: dict[tuple[bytes, ...], dict[tuple[bytes, bytes], int]] = {}
+        self.pair_heap: list[tuple[int, _ReversePairOrder, tuple[bytes, bytes]]] = []
+
+        for pair, count in self.pair_counts.items():
+            _push_pair_heap_entry(self.pair_heap, pair, count)
+
+    def _occurrences(self, pre_token_bytes: tuple[bytes, ...]) -> dict[tuple[bytes, bytes], int]:
+        if pre_token_bytes not in self.pre_token_pair_occurrences:
+            if pre_token_bytes in self.special_token_tuples or len(pre_token_bytes) < 2:
+                self.pre_token_pair_occurrences[pre_token_bytes] = {}
+            else:
+                self.pre_token_pair_occurrences[pre_token_bytes] = _pair_occurrences(pre_token_bytes)
+        return self.pre_token_pair_occurrences[pre_token_bytes]
+
+    def pop_best_pair(self) -> tuple[bytes, bytes] | None:
+        return _pop_best_pair(self.pair_heap, self.pair_counts)
+
+    def peek_best_count(self) -> int:
+        """Count of the pair pop_best_pair would return next, or 0; drops the stale entries above it."""
+        pair_heap = self.pair_heap
+        while pair_heap:
+            neg_count, _, pair = pair_heap[0]
+            if self.pair_counts.get(pair, 0) == -neg_count:
+                return -neg_count
+            heapq.heappop(pair_heap)
+        return 0
+
+    def apply_merge(self, max_pair: tuple[bytes, bytes], merged_token: bytes) -> int:
+        """Merge `max_pair` everywhere and return the number of unique pre-tokens that contained it."""
+        pre_token_map = self.pre_token_map
+        pair_counts = self.pair_counts
+        pair_to_pre_tokens = self.pair_to_pre_tokens
 
         affected_pre_tokens = list(pair_to_pre_tokens.get(max_pair, ()))
         merged_pre_token_deltas: dict[tuple[bytes, ...], int] = {}
@@ -241,7 +391,10 @@ def my_run_train_bpe(
             if pre_token_count <= 0:
                 continue
 
-            old_occurrence_map = pre_token_pair_occurrences.pop(pre_token_bytes, {})
+            # Pre-tokens untouched by earlier merges have no cached occurrences yet.
+            old_occurrence_map = self.pre_token_pair_occurrences.pop(pre_token_bytes, None) or _pair_occurrences(
+                pre_token_bytes
+            )
             for pair, pair_occurrence_count in old_occurrence_map.items():
                 updated_count = pair_counts[pair] - (pair_occurrence_count * pre_token_count)
                 if updated_count > 0:
@@ -263,17 +416,8 @@ def my_run_train_bpe(
 
         # Add contributions for updated pre-tokens after applying the selected merge.
         for pre_token_bytes, delta_count in merged_pre_token_deltas.items():
-            previous_count = pre_token_map.get(pre_token_bytes, 0)
-            pre_token_map[pre_token_bytes] = previous_count + delta_count
-
-            if pre_token_bytes not in pre_token_pair_occurrences:
-                if pre_token_bytes in special_token_tuples or len(pre_token_bytes) < 2:
-                    pre_token_pair_occurrences[pre_token_bytes] = {}
-                else:
-                    pre_token_pair_occurrences[pre_token_bytes] = _pair_occurrences(pre_token_bytes)
-
-            occurrence_map = pre_token_pair_occurrences[pre_token_bytes]
-            for pair, pair_occurrence_count in occurrence_map.items():
+            pre_token_map[pre_token_bytes] = pre_token_map.get(pre_token_bytes, 0) + delta_count
+            for pair, pair_occurrence_count in self._occurrences(pre_token_bytes).items():
                 pair_counts[pair] = pair_counts.get(pair, 0) + (pair_occurrence_count * delta_count)
                 pair_to_pre_tokens.setdefault(pair, set()).add(pre_token_bytes)
                 changed_pairs.add(pair)
@@ -281,7 +425,369 @@ def my_run_train_bpe(
         for pair in changed_pairs:
             updated_count = pair_counts.get(pair, 0)
             if updated_count > 0:
-                _push_pair_heap_entry(pair_heap, pair, updated_count)
+                _push_pair_heap_entry(self.pair_heap, pair, updated_count)
+
+        return len(affected_pre_tokens)
+
+
+class _Profiler:
+    """Adds phase timings to `phase_seconds` and passes every event dict to `callback`, if given."""
+
+    __slots__ = ("callback", "phase_seconds")
+
+    def __init__(
+        self,
+        phase_seconds: dict[str, float],
+        callback: Callable[[dict], None] | None,
+    ):
+        self.phase_seconds = phase_seconds
+        self.callback = callback
+
+    def emit(self, event: dict) -> None:
+        if self.callback is not None:
+            self.callback(event)
+
+    def add(self, phase: str, seconds: float, **fields) -> None:
+        self.phase_seconds[phase] = self.phase_seconds.get(phase, 0.0) + seconds
+        self.emit({"event": "phase", "phase": phase, "seconds": seconds, **fields})
+
+    def merges(self, num_merges: int, affected: list[int], seconds: float, state: _MergeState) -> None:
+        """Snapshot of the merge loop after `num_merges` merges; `affected` covers the merges since the last one."""
+        self.emit(
+            {
+                "event": "merges",
+                "num_merges": num_merges,
+                "merges_per_second": len(affected) / max(seconds, 1e-9),
+                "mean_affected_pre_tokens": sum(affected) / len(affected),
+                "max_affected_pre_tokens": max(affected),
+                "heap_size": len(state.pair_heap),
+                "pair_counts_size": len(state.pair_counts),
+            }
+        )
+
+    @contextmanager
+    def phase(self, phase: str) -> Iterator[None]:
+        start = time.perf_counter()
+        yield
+        self.add(phase, time.perf_counter() - start)
+
+
+def _count_pre_tokens(
+    input_path: str | os.PathLike,
+    special_tokens: list[str],
+    executor: ProcessPoolExecutor,
+    num_processes: int,
+    profiler: _Profiler,
+    sample_rate: float = 1.0,
+    seed: int = 0,
+    min_count: int = 1,
+    max_pre_tokens: int | None = None,
+) -> tuple[dict[bytes, int], int]:
+    """Count the pre-tokens of the corpus, pre-tokenizing its chunks in the `num_processes` workers of `executor`.
+
+    With `sample_rate` < 1 only a seeded random subset of the chunks is
+    pre-tokenized, and the counts are scaled up by the file's size over the
+    sampled bytes (rounding, but never below 1).
+
+    With `max_pre_tokens` set, every worker and then the merged table keep at
+    most that many pre-tokens (see `_prune_pre_token_counts`); pre-tokens
+    counted fewer than `min_count` times are dropped at the end. Special
+    tokens are never dropped by either. Also
+    returns how much any pair count can be too low because of either: a
+    merged pair (a, b) can only be missing where the byte pair (a[-1], b[0])
+    was dropped, so this is the largest count of a dropped byte pair (0 when
+    nothing was pruned).
+
+    Time spent waiting on the workers goes to the "pretokenize" phase and
+    time spent folding their per-chunk counts together to "merge_counts".
+    The "pretokenize" event also lists the seconds each worker spent on its
+    chunk; the rest of the wait is pool start-up and pickling of the counts.
+    """
+    input_path_str = os.fspath(input_path)
+    num_chunks = num_processes if sample_rate >= 1.0 else max(num_processes, SAMPLE_NUM_CHUNKS)
+    with profiler.phase("chunking"), open(input_path, "rb") as f:
+        boundaries = find_chunk_boundaries(f, num_chunks, b"<|endoftext|>")
+    special_tokens_tuple = tuple(special_tokens)
+    special_token_bytes = frozenset(token.encode("utf-8") for token in special_tokens)
+    chunk_specs = [
+        (input_path_str, start, end, special_tokens_tuple)
+        for start, end in pairwise(boundaries)
+        if end > start
+    ]
+    total_bytes = boundaries[-1] - boundaries[0]
+    if sample_rate < 1.0:
+        num_sampled = max(1, round(sample_rate * len(chunk_specs)))
+        chunk_specs = sorted(random.Random(seed).sample(chunk_specs, num_sampled))
+    sampled_bytes = sum(end - start for _, start, end, _ in chunk_specs)
+
+    pre_token_bytes_counts: dict[bytes, int] = {}
+    worker_seconds: list[float] = []
+    lost_pairs: dict[int, int] = {}
+    merge_seconds = 0.0
+    start = time.perf_counter()
+    count_chunk = partial(_count_chunk_pretokens_timed, max_pre_tokens=max_pre_tokens)
+    # Always process chunks via multiprocessing.
+    for chunk_counts, chunk_lost_pairs, chunk_seconds in executor.map(count_chunk, chunk_specs):
+        worker_seconds.append(chunk_seconds)
+        merge_start = time.perf_counter()
+        for pre_bytes, count in chunk_counts.items():
+            pre_token_bytes_counts[pre_bytes] = (
+                pre_token_bytes_counts.get(pre_bytes, 0) + count
+            )
+        # Bounded counters merge by adding counts and pruning again; their losses add up.
+        for key, count in chunk_lost_pairs.items():
+            lost_pairs[key] = lost_pairs.get(key, 0) + count
+        if max_pre_tokens is not None and len(pre_token_bytes_counts) > 2 * max_pre_tokens:
+            _prune_pre_token_counts(pre_token_bytes_counts, max_pre_tokens, lost_pairs, special_token_bytes)
+        merge_seconds += time.perf_counter() - merge_start
+    elapsed = time.perf_counter() - start
+
+    merge_start = time.perf_counter()
+    if max_pre_tokens is not None:
+        _prune_pre_token_counts(pre_token_bytes_counts, max_pre_tokens, lost_pairs, special_token_bytes)
+    if sampled_bytes < total_bytes:
+        scale = total_bytes / sampled_bytes
+        for pre_bytes, count in pre_token_bytes_counts.items():
+            pre_token_bytes_counts[pre_bytes] = max(1, round(count * scale))
+        for key, count in lost_pairs.items():
+            lost_pairs[key] = math.ceil(count * scale)
+    if min_count > 1:
+        for pre_bytes, count in list(pre_token_bytes_counts.items()):
+            if count < min_count and pre_bytes not in special_token_bytes:
+                _add_lost_pairs(lost_pairs, pre_bytes, count)
+                del pre_token_bytes_counts[pre_bytes]
+    merge_seconds += time.perf_counter() - merge_start
+    profiler.add(
+        "pretokenize",
+        elapsed - merge_seconds,
+        num_chunks=len(chunk_specs),
+        num_bytes=sampled_bytes,
+        sampled_fraction=sampled_bytes / total_bytes if total_bytes else 1.0,
+        worker_seconds=worker_seconds,
+    )
+    profiler.add("merge_counts", merge_seconds)
+    return pre_token_bytes_counts, max(lost_pairs.values(), default=0)
+
+
+def my_run_train_bpe(
+    input_path: str | os.PathLike,
+    vocab_size: int,
+    special_tokens: list[str],
+    kwargs: dict | None = None,
+) -> tuple[dict[int, bytes], list[tuple[bytes, bytes]]]:
+    """Given the path to an input corpus, run train a BPE tokenizer and
+    output its vocabulary and merges.
+
+    Args:
+        input_path (str | os.PathLike): Path to BPE tokenizer training data.
+        vocab_size (int): Total number of items in the tokenizer's vocabulary (including special tokens).
+        special_tokens (list[str]): A list of string special tokens to be added to the tokenizer vocabulary.
+            These strings will never be split into multiple tokens, and will always be
+            kept as a single token. If these special tokens occur in the `input_path`,
+            they are treated as any other string.
+        kwargs (dict | None): Optional settings.
+            "num_processes": number of worker processes, shared by pre-tokenization and, when
+                above 1, the initial pair count build (one shard of the unique pre-tokens each).
+            "phase_seconds": a dict that the wall-clock seconds of each phase ("chunking",
+                "pretokenize", "merge_counts", "pair_counts", "replay" when extending a vocab,
+                "merge_loop") are added to.
+            "profile": a callable that receives an event dict whenever a phase finishes
+                ({"event": "phase", "phase", "seconds", ...}) and, every "profile_interval"
+                merges (default 100) and after the last one, a snapshot of the merge loop
+                ({"event": "merges", "num_merges", "merges_per_second",
+                "mean_affected_pre_tokens", "max_affected_pre_tokens", "heap_size",
+                "pair_counts_size"}).
+            "progress": show a tqdm progress bar over the merges.
+            "sample_rate": fraction in (0, 1] of the corpus chunks to pre-tokenize (default 1.0).
+                Below 1, the counts of the sampled chunks are extrapolated to the whole file;
+                the result approximates a full run, see merge_overlap.
+            "seed": seed of the chunk sample (default 0).
+            "min_count": drop pre-tokens counted fewer times than this (default 1, keep all).
+            "max_pre_tokens": keep at most this many unique pre-tokens, the most counted ones
+                (ties broken by their bytes), in each worker and over their merged counts
+                (default None, unbounded). Neither option drops special tokens.
+                With either set, "profile" also receives {"event": "pruning", "min_count",
+                "max_pre_tokens", "num_pre_tokens", "pair_count_error_bound",
+                "guaranteed_merges"} after the merge loop: no pair count is low by more
+                than the bound, so the first "guaranteed_merges" merges, each of which won
+                by a larger margin, are the ones training without pruning would produce.
+                The bound only covers pruning, not sampling error, so with "sample_rate" < 1
+                "guaranteed_merges" is None.
+            "initial_vocab", "initial_merges": extend this vocab and its merges (e.g. a
+                Tokenizer's .vocab and .merges) instead of starting from bytes. The merges are
+                replayed over the corpus's pre-tokens (the "replay" phase) and learning goes on
+                until `vocab_size`. Existing IDs are kept, special tokens already in the vocab
+                are not added again, and new tokens get IDs after the largest one.
+
+    Returns:
+        tuple[dict[int, bytes], list[tuple[bytes, bytes]]]:
+            vocab:
+                The trained tokenizer vocabulary, a mapping from int (token ID in the vocabulary)
+                to bytes (token bytes)
+            merges:
+                BPE merges. Each list item is a tuple of bytes (<token1>, <token2>),
+                representing that <token1> was merged with <token2>.
+                Merges are ordered by order of creation.
+    """
+    kwargs = kwargs or {}
+    phase_seconds = kwargs.get("phase_seconds")
+    profiler = _Profiler(phase_seconds if phase_seconds is not None else {}, kwargs.get("profile"))
+
+    initial_vocab = kwargs.get("initial_vocab")
+    initial_merges = kwargs.get("initial_merges")
+    if (initial_vocab is None) != (initial_merges is None):
+        raise ValueError("initial_vocab and initial_merges must be given together")
+
+    if initial_vocab is None:
+        vocab: dict[int, bytes] = {i: SINGLE_BYTE_TOKENS[i] for i in range(256)}
+    else:
+        vocab = dict(initial_vocab)
+    # Tokens of the vocab being extended; merges that rebuild one of them keep its ID.
+    existing_tokens = set(vocab.values()) if initial_vocab is not None else set()
 
+    cur_token_id = max(vocab) + 1
+
+    for special in special_tokens:
+        if special.encode("utf-8") in existing_tokens:
+            continue
+        vocab[cur_token_id] = special.encode("utf-8")
+        cur_token_id += 1
 
+    merges: list[tuple[bytes, bytes]] = list(initial_merges or [])
+
+    num_processes = max(1, int(kwargs.get("num_processes", min(8, os.cpu_count() or 1))))
+    sample_rate = float(kwargs.get("sample_rate", 1.0))
+    if not 0.0 < sample_rate <= 1.0:
+        raise ValueError(f"sample_rate must be in (0, 1], got {sample_rate!r}")
+    min_count = int(kwargs.get("min_count", 1))
+    max_pre_tokens = kwargs.get("max_pre_tokens")
+    if max_pre_tokens is not None and max_pre_tokens < 1:
+        raise ValueError(f"max_pre_tokens must be at least 1, got {max_pre_tokens!r}")
+    pruning = min_count > 1 or max_pre_tokens is not None
+    with ProcessPoolExecutor(max_workers=num_processes) as executor:
+        pre_token_bytes_counts, pair_count_error_bound = _count_pre_tokens(
+            input_path,
+            special_tokens,
+            executor,
+            num_processes,
+            profiler,
+            sample_rate,
+            int(kwargs.get("seed", 0)),
+            min_count,
+            max_pre_tokens,
+        )
+
+        with profiler.phase("merge_counts"):
+            # pre-token -> frequency
+            pre_token_map: dict[tuple[bytes, ...], int] = {
+                tuple(SINGLE_BYTE_TOKENS[b] for b in pre_bytes): count
+                for pre_bytes, count in pre_token_bytes_counts.items()
+            }
+            del pre_token_bytes_counts
+
+        special_token_tuples = {
+            tuple(SINGLE_BYTE_TOKENS[b] for b in s.encode("utf-8"))
+            for s in special_tokens
+        }
+
+        # A single shard is cheaper to build here than to pickle to the one worker and back.
+        start = time.perf_counter()
+        pair_counts, pair_to_pre_tokens, shard_seconds = _build_pair_index(
+            pre_token_map, special_token_tuples, executor if num_processes > 1 else None, num_processes
+        )
+        state = _MergeState(pre_token_map, special_token_tuples, (pair_counts, pair_to_pre_tokens))
+        profiler.add(
+            "pair_counts", time.perf_counter() - start, num_shards=len(shard_seconds), worker_seconds=shard_seconds
+        )
+
+    if initial_merges:
+        # Merges learned in order only ever use tokens made by earlier ones, so applying each to
+        # every pre-token in rank order segments them exactly as encoding with the merges would.
+        start = time.perf_counter()
+        num_applied = 0
+        for pair in initial_merges:
+            if pair in state.pair_counts:
+                state.apply_merge(pair, pair[0] + pair[1])
+                num_applied += 1
+        profiler.add("replay", time.perf_counter() - start, num_merges=len(initial_merges), num_applied=num_applied)
+
+    profile_interval = max(1, int(kwargs.get("profile_interval", DEFAULT_PROFILE_INTERVAL)))
+    progress = tqdm(
+        total=max(0, vocab_size - len(vocab)), desc="BPE merges", unit="merge", disable=not kwargs.get("progress")
+    )
+    interval_affected: list[int] = []
+    interval_start = time.perf_counter()
+    # Index of the first merge that pruning may have changed, once one is found.
+    first_uncertain_merge: int | None = None
+    with profiler.phase("merge_loop"), progress:
+        while len(vocab) < vocab_size:
+            max_pair = state.pop_best_pair()
+            if max_pair is None:
+                break
+
+            if (
+                pair_count_error_bound
+                and first_uncertain_merge is None
+                and state.pair_counts[max_pair] - state.peek_best_count() <= pair_count_error_bound
+            ):
+                first_uncertain_merge = len(merges)
+            merges.append(max_pair)
+            merged_token = max_pair[0] + max_pair[1]
+
+            # add to vocab
+            if merged_token not in existing_tokens:
+                vocab[cur_token_id] = merged_token
+                cur_token_id += 1
+
+            interval_affected.append(state.apply_merge(max_pair, merged_token))
+            progress.update()
+            if profiler.callback is not None and len(interval_affected) == profile_interval:
+                now = time.perf_counter()
+                profiler.merges(len(merges), interval_affected, now - interval_start, state)
+                interval_affected.clear()
+                interval_start = now
+
+        if profiler.callback is not None and interval_affected:
+            profiler.merges(len(merges), interval_affected, time.perf_counter() - interval_start, state)
+
+    if pruning:
+        # The error bound says nothing about sampling, so a sampled run guarantees no merges.
+        guaranteed_merges = None
+        if sample_rate >= 1.0:
+            guaranteed_merges = len(merges) if first_uncertain_merge is None else first_uncertain_merge
+        profiler.emit(
+            {
+                "event": "pruning",
+                "min_count": min_count,
+                "max_pre_tokens": max_pre_tokens,
+                "num_pre_tokens": len(pre_token_map),
+                "pair_count_error_bound": pair_count_error_bound,
+                "guaranteed_merges": guaranteed_merges,
+            }
+        )
     return (vocab, merges)
+
+
+def merge_overlap(
+    merges: list[tuple[bytes, bytes]],
+    reference_merges: list[tuple[bytes, bytes]],
+) -> dict[str, float]:
+    """How closely `merges` (e.g. from a sampled run) agree with `reference_merges` (e.g. a full run).
+
+    "common_prefix" is the number of leading merges that are identical. Each
+    "overlap_top_<p>pct" is the fraction of the reference's first p% of merges
+    that also appear among the first p% of `merges`, ignoring order.
+    """
+    common_prefix = 0
+    for merge, reference_merge in zip(merges, reference_merges):
+        if merge != reference_merge:
+            break
+        common_prefix += 1
+
+    overlap: dict[str, float] = {"common_prefix": common_prefix}
+    for fraction in OVERLAP_FRACTIONS:
+        k = max(1, round(fraction * len(reference_merges)))
+        reference_top = set(reference_merges[:k])
+        shared = len(reference_top & set(merges[:k]))
+        overlap[f"overlap_top_{round(100 * fraction)}pct"] = shared / len(reference_top) if reference_top else 1.0
+    return overlap
@@ -0,0 +1,192 @@
+import os
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import IO, Any, BinaryIO, Self
+
+import torch
+
+from cs336_basics.tensor_archive import is_tensor_archive, read_tensor_archive, write_tensor_archive
+
+# "torch" is torch.save's pickle format; "mmap" is a tensor archive that loads by memory-mapping.
+CHECKPOINT_FORMATS = ("torch", "mmap")
+CHECKPOINT_PREFIX = "checkpoint_"
+CHECKPOINT_SUFFIX = ".pt"
+
+
+def snapshot_to_cpu(obj: Any) -> Any:
+    """A copy of a (nested) state dict whose tensors are detached CPU clones.
+
+    Training can keep mutating parameters and optimizer state in place while
+    the snapshot is being written. Dicts, lists and tuples keep their types.
+    """
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {key: snapshot_to_cpu(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot_to_cpu(value) for value in obj)
+    return obj
+
+
+def checkpoint_state(model: torch.nn.Module, optimizer: torch.optim.Optimizer, iteration: int) -> dict[str, Any]:
+    return snapshot_to_cpu({"model": model.state_dict(), "optimizer": optimizer.state_dict(), "iteration": iteration})
+
+
+def write_checkpoint(
+    state: dict[str, Any], out: str | os.PathLike | BinaryIO | IO[bytes], format: str = "torch"
+) -> None:
+    """Serialize `state` to `out` in one of `CHECKPOINT_FORMATS`.
+
+    A path is written atomically: the data goes to a temporary file in the
+    same directory, is flushed to disk, and is then renamed over `out`, so a
+    crash mid-write never leaves a truncated checkpoint behind.
+    """
+    if format not in CHECKPOINT_FORMATS:
+        raise ValueError(f"Invalid checkpoint format: {format!r}, expected one of {CHECKPOINT_FORMATS}")
+    serialize = write_tensor_archive if format == "mmap" else torch.save
+    if not isinstance(out, (str, os.PathLike)):
+        serialize(state, out)
+        return
+    path = Path(out)
+    tmp_name = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    # Unlike tempfile.mkstemp (0600), this leaves the final file with the usual umask-based mode.
+    fd = os.open(tmp_name, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            serialize(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+def save_checkpoint(
+    model: torch.nn.Module,
+    optimizer: torch.optim.Optimizer,
+    iteration: int,
+    out: str | os.PathLike | BinaryIO | IO[bytes],
+    format: str = "torch",
+) -> None:
+    write_checkpoint(checkpoint_state(model, optimizer, iteration), out, format)
+
+
+def read_checkpoint(src: str | os.PathLike | BinaryIO | IO[bytes]) -> dict[str, Any]:
+    """Load a checkpoint in either format; "mmap" checkpoints given by path are memory-mapped."""
+    if is_tensor_archive(src):
+        return read_tensor_archive(src)
+    return torch.load(src, map_location="cpu")
+
+
+def load_checkpoint(
+    src: str | os.PathLike | BinaryIO | IO[bytes],
+    model: torch.nn.Module,
+    optimizer: torch.optim.Optimizer,
+) -> int:
+    """Restore `model` and `optimizer` from `src` and return the saved iteration."""
+    state = read_checkpoint(src)
+    model.load_state_dict(state["model"])
+    optimizer.load_state_dict(state["optimizer"])
+    return state["iteration"]
+
+
+class CheckpointManager:
+    """Writes checkpoints from a background thread and keeps the newest `keep_last` of them.
+
+    `save()` only blocks for the CPU snapshot (and for the previous write, if
+    it is still running, so at most one snapshot waits in memory). Checkpoints
+    without an explicit `out` go to `directory/checkpoint_<iteration>.pt` and
+    take part in rotation; files already there from an earlier run count too.
+    A failed write is re-raised by the next `save()` or `wait()`.
+    """
+
+    def __init__(
+        self, directory: str | os.PathLike | None = None, keep_last: int | None = 3, format: str = "torch"
+    ) -> None:
+        if keep_last is not None and keep_last < 1:
+            raise ValueError(f"keep_last must be at least 1, got {keep_last}")
+        if format not in CHECKPOINT_FORMATS:
+            raise ValueError(f"Invalid checkpoint format: {format!r}, expected one of {CHECKPOINT_FORMATS}")
+        self.directory = Path(directory) if directory is not None else None
+        self.keep_last = keep_last
+        self.format = format
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint-writer")
+        self._pending: Future | None = None
+        # Guards `_written`, which the writer thread rotates while `latest()` may read it.
+        self._written_lock = threading.Lock()
+        self._written: deque[Path] = deque()
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            existing = [
+                path
+                for path in self.directory.glob(f"{CHECKPOINT_PREFIX}*{CHECKPOINT_SUFFIX}")
+                if _checkpoint_iteration(path) is not None
+            ]
+            self._written.extend(sorted(existing, key=_checkpoint_iteration))
+
+    def path_for(self, iteration: int) -> Path:
+        if self.directory is None:
+            raise ValueError("CheckpointManager needs a directory to name checkpoints")
+        return self.directory / f"{CHECKPOINT_PREFIX}{iteration:08d}{CHECKPOINT_SUFFIX}"
+
+    def latest(self) -> Path | None:
+        """The newest managed checkpoint that has been completely written, if any."""
+        with self._written_lock:
+            return self._written[-1] if self._written else None
+
+    def save(
+        self,
+        model: torch.nn.Module,
+        optimizer: torch.optim.Optimizer,
+        iteration: int,
+        out: str | os.PathLike | BinaryIO | IO[bytes] | None = None,
+    ) -> Future:
+        """Snapshot the state now and write it in the background; returns the write's future."""
+        state = checkpoint_state(model, optimizer, iteration)
+        self.wait()
+        managed = out is None
+        target = self.path_for(iteration) if managed else out
+        self._pending = self._executor.submit(self._write, state, target, managed)
+        return self._pending
+
+    def wait(self) -> None:
+        """Block until the pending write (if any) has finished, re-raising its error."""
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            pending.result()
+
+    def close(self) -> None:
+        try:
+            self.wait()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _write(self, state: dict[str, Any], target: str | os.PathLike | BinaryIO | IO[bytes], managed: bool) -> None:
+        write_checkpoint(state, target, self.format)
+        if not managed:
+            return
+        path = Path(target)
+        stale = []
+        with self._written_lock:
+            if path in self._written:
+                self._written.remove(path)
+            self._written.append(path)
+            while self.keep_last is not None and len(self._written) > self.keep_last:
+                stale.append(self._written.popleft())
+        for old_path in stale:
+            old_path.unlink(missing_ok=True)
+
+
+def _checkpoint_iteration(path: Path) -> int | None:
+    digits = path.name[len(CHECKPOINT_PREFIX) : -len(CHECKPOINT_SUFFIX)]
+    return int(digits) if digits.isdigit() else None
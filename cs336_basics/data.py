@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+import numpy.typing as npt
+import torch
+from jaxtyping import Int
+from torch import Tensor
+
+
+def load_tokens(path: str | os.PathLike, dtype: npt.DTypeLike = np.uint16) -> npt.NDArray:
+    """Memory-map a token file: a `.npy` array, or raw token IDs of `dtype` otherwise."""
+    if os.fspath(path).endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+def get_batch(
+    dataset: npt.NDArray,
+    batch_size: int,
+    context_length: int,
+    device: str | torch.device,
+    generator: np.random.Generator | None = None,
+) -> tuple[Int[Tensor, " batch_size context_length"], Int[Tensor, " batch_size context_length"]]:
+    """Sample `batch_size` random windows of `dataset` and their next-token labels.
+
+    Only the sampled windows are read, so `dataset` can be a memory-mapped
+    token file much larger than RAM.
+    """
+    if len(dataset) <= context_length:
+        raise ValueError(f"dataset of {len(dataset)} tokens is too short for context_length {context_length}")
+    rng = generator if generator is not None else np.random.default_rng()
+    starts = rng.integers(0, len(dataset) - context_length, size=batch_size)
+    windows = np.asarray(dataset[starts[:, None] + np.arange(context_length + 1)], dtype=np.int64)
+    tokens = torch.from_numpy(windows)
+    if torch.device(device).type == "cuda":
+        tokens = tokens.pin_memory().to(device, non_blocking=True)
+    else:
+        tokens = tokens.to(device)
+    return tokens[:, :-1], tokens[:, 1:]
+
+
+def skip_batches(
+    dataset: npt.NDArray,
+    batch_size: int,
+    context_length: int,
+    num_batches: int,
+    generator: np.random.Generator,
+) -> None:
+    """Advance `generator` past `num_batches` calls of `get_batch`, without reading any tokens.
+
+    A resumed run calls this with the batches it has already trained on, so it
+    continues with the batches an uninterrupted run would have drawn next.
+    """
+    for _ in range(num_batches):
+        generator.integers(0, len(dataset) - context_length, size=batch_size)
@@ -0,0 +1,106 @@
+import time
+from dataclasses import dataclass
+
+import torch
+from jaxtyping import Float, Int
+from torch import Tensor
+
+from cs336_basics.model import TransformerLM
+from cs336_basics.nn_utils import softmax
+
+
+@dataclass
+class GenerationOutput:
+    token_ids: list[int]
+    num_prompt_tokens: int
+    prefill_seconds: float
+    decode_seconds: float
+
+    @property
+    def num_new_tokens(self) -> int:
+        return len(self.token_ids) - self.num_prompt_tokens
+
+    @property
+    def tokens_per_second(self) -> float:
+        """Decode throughput; the prefill is excluded."""
+        if self.decode_seconds <= 0:
+            return 0.0
+        return self.num_new_tokens / self.decode_seconds
+
+
+def sample_next_token(
+    logits: Float[Tensor, " ... vocab_size"],
+    temperature: float = 1.0,
+    top_p: float = 1.0,
+    generator: torch.Generator | None = None,
+) -> Int[Tensor, " ..."]:
+    """Pick the next token from `logits`.
+
+    A temperature of 0 means greedy decoding. Otherwise the logits are divided by
+    `temperature` and sampling is restricted to the smallest set of tokens whose
+    cumulative probability reaches `top_p` (nucleus sampling).
+    """
+    if temperature < 0:
+        raise ValueError(f"temperature must be non-negative, got {temperature}")
+    if not 0.0 < top_p <= 1.0:
+        raise ValueError(f"top_p must be in (0, 1], got {top_p}")
+    if temperature == 0:
+        return logits.argmax(dim=-1)
+
+    probs = softmax(logits.float() / temperature, dim=-1)
+    if top_p < 1.0:
+        sorted_probs, sorted_ids = probs.sort(dim=-1, descending=True)
+        # Drop a token once the tokens ranked above it already cover top_p; the top token always survives.
+        exceeded = (sorted_probs.cumsum(dim=-1) - sorted_probs) >= top_p
+        sorted_probs = sorted_probs.masked_fill(exceeded, 0.0)
+        probs = torch.zeros_like(probs).scatter_(-1, sorted_ids, sorted_probs)
+
+    flat_probs = probs.reshape(-1, probs.shape[-1])
+    next_ids = torch.multinomial(flat_probs, num_samples=1, generator=generator)
+    return next_ids.reshape(probs.shape[:-1])
+
+
+@torch.no_grad()
+def generate(
+    model: TransformerLM,
+    prompt_ids: list[int],
+    max_new_tokens: int,
+    temperature: float = 1.0,
+    top_p: float = 1.0,
+    eos_token_id: int | None = None,
+    generator: torch.Generator | None = None,
+) -> GenerationOutput:
+    """Extend `prompt_ids` by up to `max_new_tokens` tokens with KV-cached decoding.
+
+    The prompt is run through the model once to fill the cache; every following
+    step feeds only the newest token. Generation stops early at `eos_token_id`
+    (which is kept in the output) or when the model's context length is reached.
+    """
+    if not prompt_ids:
+        raise ValueError("prompt_ids must contain at least one token")
+    if len(prompt_ids) > model.context_length:
+        raise ValueError(f"prompt has {len(prompt_ids)} tokens, context length is {model.context_length}")
+
+    device = next(model.parameters()).device
+    kv_cache = model.new_kv_cache(batch_size=1, max_seq_len=len(prompt_ids) + max_new_tokens)
+    token_ids = list(prompt_ids)
+
+    start_time = time.perf_counter()
+    logits = model(torch.tensor([prompt_ids], device=device), kv_cache=kv_cache)[0, -1]
+    prefill_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    for step in range(max_new_tokens):
+        next_id = int(sample_next_token(logits, temperature, top_p, generator))
+        token_ids.append(next_id)
+        if step + 1 == max_new_tokens or next_id == eos_token_id or kv_cache.seq_len >= kv_cache.max_seq_len:
+            break
+        logits = model(torch.tensor([[next_id]], device=device), kv_cache=kv_cache)[0, -1]
+    decode_seconds = time.perf_counter() - start_time
+
+    return GenerationOutput(
+        token_ids=token_ids,
+        num_prompt_tokens=len(prompt_ids),
+        prefill_seconds=prefill_seconds,
+        decode_seconds=decode_seconds,
+    )
@@ -0,0 +1,624 @@
+import math
+from itertools import repeat
+
+import torch
+import torch.utils.checkpoint
+from jaxtyping import Bool, Float, Int
+from torch import Tensor, nn
+
+from cs336_basics.blockwise_attention import blockwise_attention
+from cs336_basics.nn_utils import fused_rms_norm, lm_head_cross_entropy, rms_norm, silu_gate, softmax
+
+# "dense" materializes the full score matrix; "blockwise" tiles it with an online softmax.
+ATTENTION_IMPLS = ("dense", "blockwise")
+# "eager" is plain autograd; "fused" uses the hand-fused RMSNorm and SiLU-gate ops from nn_utils;
+# "compiled" runs each block through torch.compile (one graph per block, no graph breaks).
+BLOCK_IMPLS = ("eager", "fused", "compiled")
+
+
+class Linear(nn.Module):
+    def __init__(
+        self,
+        in_features: int,
+        out_features: int,
+        device: torch.device | None = None,
+        dtype: torch.dtype | None = None,
+    ) -> None:
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        std = math.sqrt(2.0 / (in_features + out_features))
+        weight = torch.empty(out_features, in_features, device=device, dtype=dtype)
+        self.weight = nn.Parameter(nn.init.trunc_normal_(weight, mean=0.0, std=std, a=-3 * std, b=3 * std))
+
+    def forward(self, x: Float[Tensor, " ... d_in"]) -> Float[Tensor, " ... d_out"]:
+        return x @ self.weight.T
+
+
+class Embedding(nn.Module):
+    def __init__(
+        self,
+        num_embeddings: int,
+        embedding_dim: int,
+        device: torch.device | None = None,
+        dtype: torch.dtype | None = None,
+    ) -> None:
+        super().__init__()
+        self.num_embeddings = num_embeddings
+        self.embedding_dim = embedding_dim
+        weight = torch.empty(num_embeddings, embedding_dim, device=device, dtype=dtype)
+        self.weight = nn.Parameter(nn.init.trunc_normal_(weight, mean=0.0, std=1.0, a=-3.0, b=3.0))
+
+    def forward(self, token_ids: Int[Tensor, " ..."]) -> Float[Tensor, " ... d_model"]:
+        return self.weight[token_ids]
+
+
+class RMSNorm(nn.Module):
+    def __init__(
+        self,
+        d_model: int,
+        eps: float = 1e-5,
+        fused: bool = False,
+        device: torch.device | None = None,
+        dtype: torch.dtype | None = None,
+    ) -> None:
+        super().__init__()
+        self.eps = eps
+        self.fused = fused
+        self.weight = nn.Parameter(torch.ones(d_model, device=device, dtype=dtype))
+
+    def forward(self, x: Float[Tensor, " ... d_model"]) -> Float[Tensor, " ... d_model"]:
+        if self.fused:
+            return fused_rms_norm(x, self.weight, self.eps)
+        return rms_norm(x, self.weight, self.eps)
+
+
+def silu(x: Float[Tensor, " ..."]) -> Float[Tensor, " ..."]:
+    return x * torch.sigmoid(x)
+
+
+class SwiGLU(nn.Module):
+    def __init__(
+        self,
+        d_model: int,
+        d_ff: int,
+        fused: bool = False,
+        device: torch.device | None = None,
+        dtype: torch.dtype | None = None,
+    ) -> None:
+        super().__init__()
+        self.fused = fused
+        self.w1 = Linear(d_model, d_ff, device=device, dtype=dtype)
+        self.w2 = Linear(d_ff, d_model, device=device, dtype=dtype)
+        self.w3 = Linear(d_model, d_ff, device=device, dtype=dtype)
+
+    def forward(self, x: Float[Tensor, " ... d_model"]) -> Float[Tensor, " ... d_model"]:
+        if self.fused:
+            return self.w2(silu_gate(self.w1(x), self.w3(x)))
+        return self.w2(silu(self.w1(x)) * self.w3(x))
+
+
+def get_rope_tables(
+    d_k: int,
+    theta: float,
+    max_seq_len: int,
+    dtype: torch.dtype = torch.float32,
+    device: torch.device | str | None = None,
+) -> tuple[Float[Tensor, " max_seq_len half_d_k"], Float[Tensor, " max_seq_len half_d_k"]]:
+    """cos/sin tables for every (position, frequency) pair.
+
+    The angles are computed in fp32 and only the finished tables are cast to `dtype`.
+    The tables are built anew on every call; `TransformerLM` builds them once and
+    shares them across its layers.
+    """
+    if d_k % 2 != 0:
+        raise ValueError(f"RoPE needs an even d_k, got {d_k}")
+    inv_freq = theta ** (-torch.arange(0, d_k, 2, device=device, dtype=torch.float32) / d_k)
+    angles = torch.outer(torch.arange(max_seq_len, device=device, dtype=torch.float32), inv_freq)
+    return angles.cos().to(dtype), angles.sin().to(dtype)
+
+
+def apply_rotary(
+    x: Float[Tensor, " ... seq_len d_k"],
+    cos: Float[Tensor, " ... seq_len half_d_k"],
+    sin: Float[Tensor, " ... seq_len half_d_k"],
+) -> Float[Tensor, " ... seq_len d_k"]:
+    x_even = x[..., 0::2]
+    x_odd = x[..., 1::2]
+    rotated = torch.stack((x_even * cos - x_odd * sin, x_even * sin + x_odd * cos), dim=-1)
+    return rotated.flatten(-2)
+
+
+class RotaryPositionalEmbedding(nn.Module):
+    def __init__(
+        self,
+        theta: float,
+        d_k: int,
+        max_seq_len: int,
+        device: torch.device | None = None,
+        dtype: torch.dtype = torch.float32,
+    ) -> None:
+        super().__init__()
+        cos, sin = get_rope_tables(d_k, theta, max_seq_len, dtype, device)
+        self.register_buffer("cos", cos, persistent=False)
+        self.register_buffer("sin", sin, persistent=False)
+
+    def angles(
+        self,
+        token_positions: Int[Tensor, " ... seq_len"],
+        dtype: torch.dtype | None = None,
+    ) -> tuple[Float[Tensor, " ... seq_len half_d_k"], Float[Tensor, " ... seq_len half_d_k"]]:
+        """Look up the cos/sin rows for `token_positions` (no trig is evaluated)."""
+        cos = self.cos[token_positions]
+        sin = self.sin[token_positions]
+        if dtype is not None:
+            cos, sin = cos.to(dtype), sin.to(dtype)
+        return cos, sin
+
+    def forward(
+        self,
+        x: Float[Tensor, " ... seq_len d_k"],
+        token_positions: Int[Tensor, " ... seq_len"],
+    ) -> Float[Tensor, " ... seq_len d_k"]:
+        return apply_rotary(x, *self.angles(token_positions, x.dtype))
+
+
+def scaled_dot_product_attention(
+    Q: Float[Tensor, " ... queries d_k"],
+    K: Float[Tensor, " ... keys d_k"],
+    V: Float[Tensor, " ... keys d_v"],
+    mask: Bool[Tensor, " ... queries keys"] | None = None,
+) -> Float[Tensor, " ... queries d_v"]:
+    scores = (Q @ K.transpose(-2, -1)) / math.sqrt(Q.shape[-1])
+    if mask is not None:
+        scores = scores.masked_fill(~mask, float("-inf"))
+    return softmax(scores, dim=-1) @ V
+
+
+class LayerKVCache:
+    """Preallocated key/value buffers of one attention layer.
+
+    `keys` and `values` have shape (batch_size, num_heads, max_seq_len, d_head);
+    only the first `length` positions hold valid entries.
+    """
+
+    __slots__ = ("keys", "length", "values")
+
+    def __init__(self, keys: Tensor, values: Tensor) -> None:
+        self.keys = keys
+        self.values = values
+        self.length = 0
+
+    def update(
+        self,
+        new_keys: Float[Tensor, " batch heads seq_len d_head"],
+        new_values: Float[Tensor, " batch heads seq_len d_head"],
+    ) -> tuple[Tensor, Tensor]:
+        start = self.length
+        end = start + new_keys.shape[-2]
+        if end > self.keys.shape[-2]:
+            raise ValueError(f"KV cache overflow: {end} positions requested, capacity is {self.keys.shape[-2]}")
+        self.keys[..., start:end, :] = new_keys
+        self.values[..., start:end, :] = new_values
+        self.length = end
+        return self.keys[..., :end, :], self.values[..., :end, :]
+
+    def positions(self, seq_len: int, device: torch.device | None = None) -> Int[Tensor, " seq_len"]:
+        """Positions of the next `seq_len` tokens."""
+        return torch.arange(self.length, self.length + seq_len, device=device)
+
+
+class KVCache:
+    def __init__(
+        self,
+        num_layers: int,
+        batch_size: int,
+        num_heads: int,
+        max_seq_len: int,
+        d_head: int,
+        device: torch.device | None = None,
+        dtype: torch.dtype = torch.float32,
+    ) -> None:
+        shape = (batch_size, num_heads, max_seq_len, d_head)
+        self.layers = [
+            LayerKVCache(
+                torch.zeros(shape, device=device, dtype=dtype),
+                torch.zeros(shape, device=device, dtype=dtype),
+            )
+            for _ in range(num_layers)
+        ]
+        self.max_seq_len = max_seq_len
+
+    @property
+    def seq_len(self) -> int:
+        return self.layers[0].length if self.layers else 0
+
+    def positions(self, seq_len: int, device: torch.device | None = None) -> Int[Tensor, " seq_len"]:
+        return torch.arange(self.seq_len, self.seq_len + seq_len, device=device)
+
+
+class LayerSlotKVCache:
+    """Key/value buffers of one attention layer for independent sequences ("slots") of different lengths.
+
+    `keys` and `values` have shape (num_slots, num_heads, max_seq_len, d_head);
+    slot i holds `lengths[i]` valid positions. A forward pass covers the slots
+    in `rows` (batch row j is slot `rows[j]`), so sequences can join and leave
+    a running batch independently.
+    """
+
+    __slots__ = ("index", "keys", "lengths", "rows", "values")
+
+    def __init__(self, keys: Tensor, values: Tensor) -> None:
+        self.keys = keys
+        self.values = values
+        self.lengths = torch.zeros(keys.shape[0], dtype=torch.long, device=keys.device)
+        self.select(None)
+
+    def select(self, slots: list[int] | None) -> None:
+        """Cover `slots` (all of them, in order, if None) in the next forward pass."""
+        if slots is None:
+            self.rows = torch.arange(self.keys.shape[0], device=self.keys.device)
+            # Selecting every slot in order can use views of the buffers instead of gathered copies.
+            self.index = slice(None)
+        else:
+            self.rows = torch.tensor(slots, dtype=torch.long, device=self.keys.device)
+            self.index = self.rows
+
+    def positions(self, seq_len: int, device: torch.device | None = None) -> Int[Tensor, " rows seq_len"]:
+        """Positions of the next `seq_len` tokens of each selected slot."""
+        return self.lengths[self.rows].unsqueeze(-1) + torch.arange(seq_len, device=device)
+
+    def causal_mask(self, seq_len: int, device: torch.device | None = None) -> Bool[Tensor, " rows 1 seq_len keys"]:
+        """Which cached and new keys each of the next `seq_len` queries may attend to (call before `update`)."""
+        query_positions = self.positions(seq_len, device)
+        key_positions = torch.arange(int(query_positions[:, -1].max()) + 1, device=device)
+        # Keys past a slot's own length are stale entries of an earlier sequence; the causal condition hides them.
+        return (key_positions <= query_positions.unsqueeze(-1)).unsqueeze(1)
+
+    def update(
+        self,
+        new_keys: Float[Tensor, " rows heads seq_len d_head"],
+        new_values: Float[Tensor, " rows heads seq_len d_head"],
+    ) -> tuple[Tensor, Tensor]:
+        positions = self.positions(new_keys.shape[-2], self.keys.device)
+        end = int(positions[:, -1].max()) + 1
+        if end > self.keys.shape[-2]:
+            raise ValueError(f"KV cache overflow: {end} positions requested, capacity is {self.keys.shape[-2]}")
+        # Advanced indices on slots and positions put those dims first: (rows, seq_len, heads, d_head).
+        self.keys[self.rows.unsqueeze(-1), :, positions] = new_keys.transpose(-3, -2)
+        self.values[self.rows.unsqueeze(-1), :, positions] = new_values.transpose(-3, -2)
+        self.lengths[self.rows] = positions[:, -1] + 1
+        return self.keys[self.index, :, :end], self.values[self.index, :, :end]
+
+
+class SlotKVCache:
+    """A `LayerSlotKVCache` per layer, for continuous batching.
+
+    Call `select(slots)` before each forward pass to choose the sequences it
+    extends, and `reset(slot)` to hand a finished sequence's slot to a new one.
+    """
+
+    def __init__(
+        self,
+        num_layers: int,
+        num_slots: int,
+        num_heads: int,
+        max_seq_len: int,
+        d_head: int,
+        device: torch.device | None = None,
+        dtype: torch.dtype = torch.float32,
+    ) -> None:
+        shape = (num_slots, num_heads, max_seq_len, d_head)
+        self.layers = [
+            LayerSlotKVCache(
+                torch.zeros(shape, device=device, dtype=dtype),
+                torch.zeros(shape, device=device, dtype=dtype),
+            )
+            for _ in range(num_layers)
+        ]
+        self.num_slots = num_slots
+        self.max_seq_len = max_seq_len
+
+    def select(self, slots: list[int] | None) -> None:
+        for layer in self.layers:
+            layer.select(slots)
+
+    def reset(self, slot: int) -> None:
+        for layer in self.layers:
+            layer.lengths[slot] = 0
+
+    def length(self, slot: int) -> int:
+        return int(self.layers[0].lengths[slot]) if self.layers else 0
+
+    def positions(self, seq_len: int, device: torch.device | None = None) -> Int[Tensor, " rows seq_len"]:
+        return self.layers[0].positions(seq_len, device)
+
+
+def _fuse_qkv_state_dict(module: nn.Module, state_dict: dict[str, Tensor], prefix: str, *args) -> None:
+    """Load-state-dict pre-hook that folds separate q/k/v projection weights into `qkv_proj`."""
+    keys = [f"{prefix}{name}_proj.weight" for name in ("q", "k", "v")]
+    if all(key in state_dict for key in keys):
+        state_dict[f"{prefix}qkv_proj.weight"] = torch.cat([state_dict.pop(key) for key in keys], dim=0)
+
+
+class MultiHeadSelfAttention(nn.Module):
+    """Causal multi-head self-attention with a single fused QKV projection.
+
+    The q, k and v weights live in one `(3 * d_model, d_model)` matrix, rows
+    ordered [q; k; v], so all projections are one GEMM and the heads are split
+    off with views. State dicts with separate `q_proj`/`k_proj`/`v_proj` weights
+    are converted on load.
+    """
+
+    def __init__(
+        self,
+        d_model: int,
+        num_heads: int,
+        rope: RotaryPositionalEmbedding | None = None,
+        attention_impl: str = "dense",
+        device: torch.device | None = None,
+        dtype: torch.dtype | None = None,
+    ) -> None:
+        super().__init__()
+        if d_model % num_heads != 0:
+            raise ValueError(f"d_model ({d_model}) must be divisible by num_heads ({num_heads})")
+        if attention_impl not in ATTENTION_IMPLS:
+            raise ValueError(f"attention_impl must be one of {ATTENTION_IMPLS}, got {attention_impl!r}")
+        self.attention_impl = attention_impl
+        self.d_model = d_model
+        self.num_heads = num_heads
+        self.d_head = d_model // num_heads
+        self.rope = rope
+        self.qkv_proj = Linear(d_model, 3 * d_model, device=device, dtype=dtype)
+        # Initialize as three independent d_model -> d_model projections.
+        std = math.sqrt(1.0 / d_model)
+        nn.init.trunc_normal_(self.qkv_proj.weight.data, mean=0.0, std=std, a=-3 * std, b=3 * std)
+        self.output_proj = Linear(d_model, d_model, device=device, dtype=dtype)
+        self.register_load_state_dict_pre_hook(_fuse_qkv_state_dict)
+
+    def forward(
+        self,
+        x: Float[Tensor, " ... seq_len d_model"],
+        token_positions: Int[Tensor, " ... seq_len"] | None = None,
+        kv_cache: LayerKVCache | LayerSlotKVCache | None = None,
+    ) -> Float[Tensor, " ... seq_len d_model"]:
+        seq_len = x.shape[-2]
+        start = kv_cache.length if isinstance(kv_cache, LayerKVCache) else 0
+
+        # (..., seq_len, 3 * d_model) -> three (..., heads, seq_len, d_head) views.
+        qkv = self.qkv_proj(x).unflatten(-1, (3, self.num_heads, self.d_head))
+        q, k, v = qkv.movedim(-3, 0).transpose(-3, -2).unbind(0)
+
+        if self.rope is not None:
+            if token_positions is None:
+                token_positions = (
+                    kv_cache.positions(seq_len, x.device)
+                    if kv_cache is not None
+                    else torch.arange(seq_len, device=x.device)
+                )
+            # Add a head axis so positions broadcast over (..., heads, seq_len, d_head).
+            cos, sin = self.rope.angles(token_positions.unsqueeze(-2), q.dtype)
+            q = apply_rotary(q, cos, sin)
+            k = apply_rotary(k, cos, sin)
+
+        # The slots of a slotted cache are at different lengths, so its causal mask differs per row.
+        slot_mask = kv_cache.causal_mask(seq_len, x.device) if isinstance(kv_cache, LayerSlotKVCache) else None
+        if kv_cache is not None:
+            k, v = kv_cache.update(k, v)
+
+        if self.attention_impl == "blockwise":
+            out = blockwise_attention(q, k, v, mask=slot_mask, is_causal=slot_mask is None)
+        else:
+            mask = slot_mask
+            if mask is None and seq_len > 1:
+                query_positions = torch.arange(start, start + seq_len, device=x.device)
+                key_positions = torch.arange(start + seq_len, device=x.device)
+                mask = key_positions <= query_positions.unsqueeze(-1)
+            out = scaled_dot_product_attention(q, k, v, mask)
+        return self.output_proj(out.transpose(-3, -2).flatten(-2))
+
+
+class TransformerBlock(nn.Module):
+    def __init__(
+        self,
+        d_model: int,
+        num_heads: int,
+        d_ff: int,
+        max_seq_len: int,
+        theta: float,
+        rope: RotaryPositionalEmbedding | None = None,
+        attention_impl: str = "dense",
+        block_impl: str = "eager",
+        device: torch.device | None = None,
+        dtype: torch.dtype | None = None,
+    ) -> None:
+        super().__init__()
+        if block_impl not in BLOCK_IMPLS:
+            raise ValueError(f"block_impl must be one of {BLOCK_IMPLS}, got {block_impl!r}")
+        if rope is None:
+            rope = RotaryPositionalEmbedding(theta, d_model // num_heads, max_seq_len, device=device)
+        fused = block_impl == "fused"
+        self.ln1 = RMSNorm(d_model, fused=fused, device=device, dtype=dtype)
+        self.attn = MultiHeadSelfAttention(
+            d_model, num_heads, rope=rope, attention_impl=attention_impl, device=device, dtype=dtype
+        )
+        self.ln2 = RMSNorm(d_model, fused=fused, device=device, dtype=dtype)
+        self.ffn = SwiGLU(d_model, d_ff, fused=fused, device=device, dtype=dtype)
+        if block_impl == "compiled":
+            # Compiles lazily on the first call; parameter names and the state dict are unchanged.
+            self.compile()
+
+    def forward(
+        self,
+        x: Float[Tensor, " ... seq_len d_model"],
+        token_positions: Int[Tensor, " ... seq_len"] | None = None,
+        kv_cache: LayerKVCache | LayerSlotKVCache | None = None,
+    ) -> Float[Tensor, " ... seq_len d_model"]:
+        x = x + self.attn(self.ln1(x), token_positions, kv_cache)
+        return x + self.ffn(self.ln2(x))
+
+
+def _drop_tied_lm_head(module: nn.Module, state_dict: dict[str, Tensor], prefix: str, *args) -> None:
+    """State-dict post-hook: a tied embedding/LM-head matrix is saved once, as `token_embeddings.weight`."""
+    if module.tie_embeddings:
+        state_dict.pop(f"{prefix}lm_head.weight", None)
+
+
+def _match_lm_head_tying(module: nn.Module, state_dict: dict[str, Tensor], prefix: str, *args) -> None:
+    """Load-state-dict pre-hook that lets tied and untied models load each other's state dicts."""
+    embedding_key, lm_head_key = f"{prefix}token_embeddings.weight", f"{prefix}lm_head.weight"
+    # A quantized LM head (see cs336_basics.quantization) has its own keys and never shares a matrix.
+    if embedding_key not in state_dict or not isinstance(module.lm_head, Linear):
+        return
+    if module.tie_embeddings:
+        # An untied state dict has two matrices for the one shared parameter; the embedding is kept.
+        state_dict[lm_head_key] = state_dict[embedding_key]
+    else:
+        state_dict.setdefault(lm_head_key, state_dict[embedding_key])
+
+
+class TransformerLM(nn.Module):
+    """Decoder-only Transformer language model.
+
+    With `tie_embeddings`, the token embedding and the LM head share one
+    `(vocab_size, d_model)` parameter, which saves that matrix's memory, its
+    gradient and its optimizer state. The shared matrix gets the LM head's
+    initialization (the embedding's unit variance would make the initial
+    logits sqrt(d_model) times too large). Tied models save it once; tied and
+    untied models load each other's state dicts.
+    """
+
+    def __init__(
+        self,
+        vocab_size: int,
+        context_length: int,
+        d_model: int,
+        num_layers: int,
+        num_heads: int,
+        d_ff: int,
+        rope_theta: float,
+        attention_impl: str = "dense",
+        block_impl: str = "eager",
+        activation_checkpointing: bool = False,
+        tie_embeddings: bool = False,
+        device: torch.device | None = None,
+        dtype: torch.dtype | None = None,
+    ) -> None:
+        super().__init__()
+        self.vocab_size = vocab_size
+        self.context_length = context_length
+        self.d_model = d_model
+        self.num_heads = num_heads
+        # Keep only each block's input during training and recompute the block in backward.
+        self.activation_checkpointing = activation_checkpointing
+        self.token_embeddings = Embedding(vocab_size, d_model, device=device, dtype=dtype)
+        # One RoPE module (and one set of cos/sin tables) is shared by every block.
+        self.rope = RotaryPositionalEmbedding(rope_theta, d_model // num_heads, context_length, device=device)
+        self.layers = nn.ModuleList(
+            TransformerBlock(
+                d_model,
+                num_heads,
+                d_ff,
+                context_length,
+                rope_theta,
+                rope=self.rope,
+                attention_impl=attention_impl,
+                block_impl=block_impl,
+                device=device,
+                dtype=dtype,
+            )
+            for _ in range(num_layers)
+        )
+        self.ln_final = RMSNorm(d_model, device=device, dtype=dtype)
+        self.lm_head = Linear(d_model, vocab_size, device=device, dtype=dtype)
+        self.tie_embeddings = tie_embeddings
+        if tie_embeddings:
+            self.token_embeddings.weight = self.lm_head.weight
+        self.register_state_dict_post_hook(_drop_tied_lm_head)
+        self.register_load_state_dict_pre_hook(_match_lm_head_tying)
+
+    def new_kv_cache(self, batch_size: int, max_seq_len: int | None = None) -> KVCache:
+        """Allocate an empty cache for `batch_size` sequences of up to `max_seq_len` tokens."""
+        max_seq_len = self.context_length if max_seq_len is None else min(max_seq_len, self.context_length)
+        # A float parameter, read instead of lm_head.weight, which a QuantizedLinear would dequantize.
+        weight = next(self.parameters())
+        return KVCache(
+            len(self.layers),
+            batch_size,
+            self.num_heads,
+            max_seq_len,
+            self.d_model // self.num_heads,
+            device=weight.device,
+            dtype=weight.dtype,
+        )
+
+    def new_slot_kv_cache(self, num_slots: int, max_seq_len: int | None = None) -> SlotKVCache:
+        """Allocate an empty cache for up to `num_slots` concurrent sequences of up to `max_seq_len` tokens each."""
+        max_seq_len = self.context_length if max_seq_len is None else min(max_seq_len, self.context_length)
+        weight = next(self.parameters())
+        return SlotKVCache(
+            len(self.layers),
+            num_slots,
+            self.num_heads,
+            max_seq_len,
+            self.d_model // self.num_heads,
+            device=weight.device,
+            dtype=weight.dtype,
+        )
+
+    def hidden_states(
+        self,
+        in_indices: Int[Tensor, " batch_size seq_len"],
+        token_positions: Int[Tensor, " ... seq_len"] | None = None,
+        kv_cache: KVCache | SlotKVCache | None = None,
+    ) -> Float[Tensor, " batch_size seq_len d_model"]:
+        """Output of the last block, before the final norm and the LM head."""
+        if token_positions is None:
+            seq_len = in_indices.shape[-1]
+            token_positions = (
+                kv_cache.positions(seq_len, in_indices.device)
+                if kv_cache is not None
+                else torch.arange(seq_len, device=in_indices.device)
+            )
+
+        x = self.token_embeddings(in_indices)
+        if self.activation_checkpointing and kv_cache is None and torch.is_grad_enabled():
+            for layer in self.layers:
+                x = torch.utils.checkpoint.checkpoint(layer, x, token_positions, use_reentrant=False)
+            return x
+        layer_caches = kv_cache.layers if kv_cache is not None else repeat(None)
+        for layer, layer_cache in zip(self.layers, layer_caches):
+            x = layer(x, token_positions, layer_cache)
+        return x
+
+    def forward(
+        self,
+        in_indices: Int[Tensor, " batch_size seq_len"],
+        token_positions: Int[Tensor, " ... seq_len"] | None = None,
+        kv_cache: KVCache | SlotKVCache | None = None,
+    ) -> Float[Tensor, " batch_size seq_len vocab_size"]:
+        """Return next-token logits for `in_indices`.
+
+        With a `kv_cache`, `in_indices` holds only the tokens that follow the
+        `kv_cache.seq_len` tokens already cached, and their keys and values are
+        appended to the cache. With a `SlotKVCache`, batch row j continues the
+        sequence in the j-th selected slot, from that slot's own length.
+        """
+        return self.lm_head(self.ln_final(self.hidden_states(in_indices, token_positions, kv_cache)))
+
+    def loss(
+        self, in_indices: Int[Tensor, " batch_size seq_len"], targets: Int[Tensor, " batch_size seq_len"]
+    ) -> Float[Tensor, ""]:
+        """Mean next-token cross-entropy, computed without materializing the full logits."""
+        return self.head_loss(self.hidden_states(in_indices), targets)
+
+    def head_loss(
+        self, hidden: Float[Tensor, " batch_size seq_len d_model"], targets: Int[Tensor, " batch_size seq_len"]
+    ) -> Float[Tensor, ""]:
+        """`loss` from the output of `hidden_states`.
+
+        When gradients are needed, this also computes the final norm's and the
+        LM head's gradients (see `lm_head_cross_entropy`), so it does their
+        backward work up front.
+        """
+        return lm_head_cross_entropy(hidden, self.ln_final.weight, self.lm_head.weight, targets, self.ln_final.eps)
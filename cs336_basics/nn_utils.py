@@ -0,0 +1,267 @@
+from collections.abc import Iterable
+
+import torch
+from jaxtyping import Float, Int
+from torch import Tensor
+
+DEFAULT_LM_HEAD_CHUNK_SIZE = 1024
+# Added to the global norm before dividing, so all-zero gradients stay finite.
+GRADIENT_CLIP_EPS = 1e-6
+
+
+def softmax(in_features: Float[Tensor, " ..."], dim: int) -> Float[Tensor, " ..."]:
+    """Numerically stable softmax over `dim`, computed in at least fp32 and returned in the input dtype."""
+    x = in_features.to(torch.promote_types(in_features.dtype, torch.float32))
+    shifted = x - x.amax(dim=dim, keepdim=True)
+    exp = shifted.exp()
+    return (exp / exp.sum(dim=dim, keepdim=True)).to(in_features.dtype)
+
+
+def cross_entropy(
+    inputs: Float[Tensor, " ... vocab_size"],
+    targets: Int[Tensor, " ..."],
+) -> Float[Tensor, ""]:
+    """Average cross-entropy of `targets` under the unnormalized logits `inputs`."""
+    inputs = inputs.float()
+    max_logits = inputs.amax(dim=-1, keepdim=True)
+    log_sum_exp = (inputs - max_logits).exp().sum(dim=-1).log() + max_logits.squeeze(-1)
+    target_logits = inputs.gather(-1, targets.unsqueeze(-1)).squeeze(-1)
+    return (log_sum_exp - target_logits).mean()
+
+
+def rms_norm(
+    in_features: Float[Tensor, " ... d_model"],
+    weight: Float[Tensor, " d_model"],
+    eps: float = 1e-5,
+) -> Float[Tensor, " ... d_model"]:
+    """RMSNorm with the reduction done in fp32; the result is cast back to the input dtype."""
+    in_dtype = in_features.dtype
+    x = in_features.float()
+    normed = x * torch.rsqrt(x.pow(2).mean(dim=-1, keepdim=True) + eps)
+    return (normed * weight.float()).to(in_dtype)
+
+
+class _FusedRMSNorm(torch.autograd.Function):
+    """`rms_norm` with a hand-written backward.
+
+    Autograd through `rms_norm` keeps every fp32 intermediate (the upcast
+    input, its square, the normalized rows) alive until backward; this saves
+    only the input and one reciprocal RMS per row and recomputes the rest.
+    """
+
+    @staticmethod
+    def forward(ctx, x, weight, eps):
+        compute_dtype = torch.promote_types(x.dtype, torch.float32)
+        x_up = x.to(compute_dtype)
+        rstd = torch.rsqrt(x_up.square().mean(dim=-1, keepdim=True).add_(eps))
+        ctx.save_for_backward(x, weight, rstd)
+        return (x_up * rstd).mul_(weight.to(compute_dtype)).to(x.dtype)
+
+    @staticmethod
+    def backward(ctx, grad_out):
+        x, weight, rstd = ctx.saved_tensors
+        normed = x.to(rstd.dtype) * rstd
+        grad_out = grad_out.to(rstd.dtype)
+        grad_weight = (grad_out * normed).reshape(-1, normed.shape[-1]).sum(dim=0)
+        grad_normed = grad_out * weight.to(rstd.dtype)
+        # d/dx of x * rstd(x): rstd * (g - normed * mean(g * normed)).
+        projection = (grad_normed * normed).mean(dim=-1, keepdim=True)
+        grad_x = grad_normed.sub_(normed.mul_(projection)).mul_(rstd)
+        return grad_x.to(x.dtype), grad_weight.to(weight.dtype), None
+
+
+def fused_rms_norm(
+    in_features: Float[Tensor, " ... d_model"],
+    weight: Float[Tensor, " d_model"],
+    eps: float = 1e-5,
+) -> Float[Tensor, " ... d_model"]:
+    """Same result as `rms_norm`, with less activation memory and fewer kernels in backward."""
+    return _FusedRMSNorm.apply(in_features, weight, eps)
+
+
+class _SiLUGate(torch.autograd.Function):
+    """silu(gate) * up, saving only the two inputs for backward instead of four tensors."""
+
+    @staticmethod
+    def forward(ctx, gate, up):
+        ctx.save_for_backward(gate, up)
+        return torch.nn.functional.silu(gate).mul_(up)
+
+    @staticmethod
+    def backward(ctx, grad_out):
+        gate, up = ctx.saved_tensors
+        sigmoid = torch.sigmoid(gate)
+        silu = gate * sigmoid
+        grad_up = grad_out * silu
+        # silu'(x) = sigmoid(x) * (1 + x * (1 - sigmoid(x))) = sigmoid(x) + silu(x) * (1 - sigmoid(x)).
+        grad_gate = silu.mul_(1 - sigmoid).add_(sigmoid).mul_(grad_out).mul_(up)
+        return grad_gate, grad_up
+
+
+def silu_gate(gate: Float[Tensor, " ..."], up: Float[Tensor, " ..."]) -> Float[Tensor, " ..."]:
+    """The SwiGLU gating `silu(gate) * up` as one autograd node."""
+    return _SiLUGate.apply(gate, up)
+
+
+def _chunked_lm_head_loss(
+    hidden: Tensor,
+    norm_weight: Tensor,
+    lm_head_weight: Tensor,
+    targets: Tensor,
+    eps: float,
+    chunk_size: int,
+    matmul_dtype: torch.dtype,
+    needs_grad: tuple[bool, bool, bool],
+) -> tuple[Tensor, Tensor | None, Tensor | None, Tensor | None]:
+    """The loss and, for each of hidden, norm_weight and lm_head_weight flagged in `needs_grad`, its gradient.
+
+    Gradients that are not asked for are returned as None and cost neither a GEMM nor a buffer.
+    """
+    need_x, need_g, need_w = needs_grad
+    d_model = hidden.shape[-1]
+    x_all = hidden.reshape(-1, d_model)
+    targets_all = targets.reshape(-1)
+    num_rows = x_all.shape[0]
+
+    g = norm_weight.float()
+    w = lm_head_weight.to(matmul_dtype)
+    grad_x_all = torch.empty(x_all.shape, dtype=torch.float32, device=x_all.device) if need_x else None
+    grad_g = torch.zeros_like(g) if need_g else None
+    grad_w = torch.zeros(w.shape, dtype=torch.float32, device=w.device) if need_w else None
+    loss = torch.zeros((), dtype=torch.float32, device=x_all.device)
+
+    for start in range(0, num_rows, chunk_size):
+        end = min(start + chunk_size, num_rows)
+        x = x_all[start:end].float()
+        t = targets_all[start:end]
+
+        inv_rms = torch.rsqrt(x.pow(2).mean(dim=-1, keepdim=True) + eps)
+        x_hat = x * inv_rms
+        y = x_hat * g
+        y_mm = y.to(matmul_dtype)
+        logits = (y_mm @ w.T).float()
+
+        max_logits = logits.amax(dim=-1, keepdim=True)
+        logits.sub_(max_logits)
+        log_sum_exp = logits.exp().sum(dim=-1).log()
+        loss += (log_sum_exp - logits.gather(-1, t.unsqueeze(-1)).squeeze(-1)).sum()
+        if not any(needs_grad):
+            continue
+
+        # d(loss)/d(logits) = softmax - one_hot, reusing the logits buffer.
+        grad_logits = logits.sub_(log_sum_exp.unsqueeze(-1)).exp_()
+        grad_logits[torch.arange(end - start, device=t.device), t] -= 1.0
+        grad_logits.div_(num_rows)
+
+        if need_w:
+            if matmul_dtype == torch.float32:
+                grad_w.addmm_(grad_logits.T, y)
+            else:
+                grad_w += grad_logits.to(matmul_dtype).T @ y_mm
+        if not (need_x or need_g):
+            continue
+        grad_y = (grad_logits.to(matmul_dtype) @ w).float()
+        if need_g:
+            grad_g += (grad_y * x_hat).sum(dim=0)
+        if need_x:
+            grad_x_hat = grad_y * g
+            grad_x_all[start:end] = inv_rms * (grad_x_hat - x_hat * (grad_x_hat * x_hat).mean(dim=-1, keepdim=True))
+
+    return (
+        loss / num_rows,
+        grad_x_all.to(hidden.dtype).reshape(hidden.shape) if need_x else None,
+        grad_g.to(norm_weight.dtype) if need_g else None,
+        grad_w.to(lm_head_weight.dtype) if need_w else None,
+    )
+
+
+class _ChunkedLMHeadLoss(torch.autograd.Function):
+    """Final RMSNorm + LM head + cross-entropy, evaluated `chunk_size` rows at a time.
+
+    The gradients are produced during the forward pass, so at most one
+    `(chunk_size, vocab_size)` block of logits is alive at any point and nothing
+    has to be saved for a second pass over the vocabulary. The two GEMMs per
+    chunk run in `matmul_dtype`; the norm, softmax, loss and all gradient
+    accumulators stay in fp32.
+    """
+
+    @staticmethod
+    def forward(ctx, hidden, norm_weight, lm_head_weight, targets, eps, chunk_size, matmul_dtype):
+        loss, grad_hidden, grad_norm_weight, grad_lm_head_weight = _chunked_lm_head_loss(
+            hidden, norm_weight, lm_head_weight, targets, eps, chunk_size, matmul_dtype, ctx.needs_input_grad[:3]
+        )
+        ctx.save_for_backward(grad_hidden, grad_norm_weight, grad_lm_head_weight)
+        return loss
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        grads = tuple(None if grad is None else grad * grad_output for grad in ctx.saved_tensors)
+        return (*grads, None, None, None, None)
+
+
+def lm_head_cross_entropy(
+    hidden: Float[Tensor, " ... d_model"],
+    norm_weight: Float[Tensor, " d_model"],
+    lm_head_weight: Float[Tensor, " vocab_size d_model"],
+    targets: Int[Tensor, " ..."],
+    eps: float = 1e-5,
+    chunk_size: int = DEFAULT_LM_HEAD_CHUNK_SIZE,
+) -> Float[Tensor, ""]:
+    """Average next-token loss of `cross_entropy(rms_norm(hidden) @ lm_head_weight.T, targets)`
+    without materializing the full `(..., vocab_size)` logits.
+
+    The returned scalar backpropagates into `hidden`, `norm_weight` and
+    `lm_head_weight`, but the logits themselves are never returned. Under
+    `torch.no_grad()` only the loss is computed.
+    Under autocast the LM-head GEMMs run in the autocast dtype (otherwise in the
+    dtype of `lm_head_weight`); the loss itself is always computed in fp32.
+    """
+    if chunk_size <= 0:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+    device_type = hidden.device.type
+    if torch.is_autocast_enabled(device_type):
+        matmul_dtype = torch.get_autocast_dtype(device_type)
+    else:
+        matmul_dtype = torch.promote_types(lm_head_weight.dtype, hidden.dtype)
+    # The explicit dtype handling above replaces autocast inside the chunked loop.
+    with torch.autocast(device_type, enabled=False):
+        if not (torch.is_grad_enabled() and any(t.requires_grad for t in (hidden, norm_weight, lm_head_weight))):
+            # Loss only, e.g. under torch.no_grad() for evaluation: skip every gradient GEMM and buffer.
+            return _chunked_lm_head_loss(
+                hidden, norm_weight, lm_head_weight, targets, eps, chunk_size, matmul_dtype, (False, False, False)
+            )[0]
+        return _ChunkedLMHeadLoss.apply(hidden, norm_weight, lm_head_weight, targets, eps, chunk_size, matmul_dtype)
+
+
+@torch.no_grad()
+def clip_gradients(
+    parameters: Iterable[torch.nn.Parameter], max_l2_norm: float, eps: float = GRADIENT_CLIP_EPS
+) -> Float[Tensor, ""]:
+    """Scale the gradients in place so that their combined L2 norm is at most `max_l2_norm`.
+
+    The global norm comes from one `_foreach_norm` per (device, dtype) group and
+    the scaling is one `_foreach_mul_` by a tensor coefficient, so nothing waits
+    on an accelerator. Returns the pre-clip global norm as a 0-d tensor, for logging.
+    """
+    grads_by_key: dict[tuple[torch.device, torch.dtype], list[Tensor]] = {}
+    for p in parameters:
+        if p.grad is not None:
+            grads_by_key.setdefault((p.grad.device, p.grad.dtype), []).append(p.grad)
+    if not grads_by_key:
+        return torch.tensor(0.0)
+
+    norm_device = next(iter(grads_by_key))[0]
+    group_norms = [
+        torch.linalg.vector_norm(torch.stack(torch._foreach_norm(grads)).float()).to(norm_device)
+        for grads in grads_by_key.values()
+    ]
+    total_norm = torch.linalg.vector_norm(torch.stack(group_norms))
+    # min(1, max / norm) without branching on the value of the norm.
+    clip_coef = (max_l2_norm / (total_norm + eps)).clamp_(max=1.0)
+    for (device, _), grads in grads_by_key.items():
+        # CPU ops run synchronously, so reading the coefficient there costs nothing and lets
+        # the common no-clip case skip the second pass over the gradients.
+        if device.type == "cpu" and clip_coef.item() == 1.0:
+            continue
+        torch._foreach_mul_(grads, clip_coef.to(device))
+    return total_norm
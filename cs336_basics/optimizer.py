@@ -0,0 +1,521 @@
+import math
+from collections.abc import Callable, Iterable
+
+import torch
+import torch.nn.functional as F
+from torch import Tensor
+
+# Every parameter starts at a multiple of this many elements inside a flat buffer.
+FLAT_BUFFER_ALIGNMENT = 256
+# The update sweeps the flat buffers in slices of this many elements, so that the
+# temporaries stay cache-sized instead of being full-model-sized allocations.
+UPDATE_CHUNK_SIZE = 1 << 18
+
+# How the Adam moments are stored; see `AdamW`.
+STATE_MODES = ("fp32", "bf16", "int8", "factored")
+# One absmax scale per block. Blocks never straddle parameters because offsets are aligned.
+QUANT_BLOCK_SIZE = FLAT_BUFFER_ALIGNMENT
+QUANT_MAX = 127
+# Added to squared gradients before they are averaged into the row/column factors.
+FACTORED_EPS = 1e-30
+
+# Every state key a moment can be stored under, across all modes.
+_MOMENT_KEYS = ("exp_avg", "exp_avg_scale", "exp_avg_sq", "exp_avg_sq_scale", "exp_avg_sq_row", "exp_avg_sq_col")
+# Rows of the per-(device, dtype) scratch buffer: two decoded moments, the sqrt denominator, an upcast gradient.
+_SCRATCH_ROWS = 4
+
+
+def _aligned(numel: int) -> int:
+    return -(-numel // FLAT_BUFFER_ALIGNMENT) * FLAT_BUFFER_ALIGNMENT
+
+
+def _views(buffer: Tensor, params: list[torch.nn.Parameter], offsets: list[int]) -> list[Tensor]:
+    return [buffer[offset : offset + p.numel()].view_as(p) for p, offset in zip(params, offsets)]
+
+
+def _quantize_blocks_(values: Tensor, codes: Tensor, scales: Tensor) -> None:
+    """Write `values` into int8 `codes` and per-block absmax `scales`.
+
+    Codes follow a cubic curve, value = scale * (code / QUANT_MAX) ** 3, which
+    spends most of the 256 levels on small magnitudes; Adam moments within a
+    block routinely span several orders of magnitude.
+    """
+    blocks = values.view(-1, QUANT_BLOCK_SIZE)
+    scales.copy_(blocks.abs().amax(dim=1))
+    normalized = blocks / scales.clamp_min(torch.finfo(values.dtype).tiny).unsqueeze(1)
+    cube_root = normalized.abs().pow_(1 / 3).mul_(normalized.sign())
+    codes.view_as(blocks).copy_(cube_root.mul_(QUANT_MAX).round_())
+
+
+def _dequantize_blocks_(codes: Tensor, scales: Tensor, out: Tensor) -> Tensor:
+    blocks = out.view(-1, QUANT_BLOCK_SIZE)
+    blocks.copy_(codes.view_as(blocks))
+    blocks.div_(QUANT_MAX).pow_(3).mul_(scales.unsqueeze(1))
+    return out
+
+
+class _DenseMoments:
+    """A moment kept as one flat tensor, in the parameters' dtype or a narrower float dtype."""
+
+    __slots__ = ("buffer",)
+
+    def __init__(self, numel: int, dtype: torch.dtype, device: torch.device) -> None:
+        self.buffer = torch.zeros(numel, dtype=dtype, device=device)
+
+    def state_views(self, name: str, params: list[torch.nn.Parameter], offsets: list[int]) -> list[dict[str, Tensor]]:
+        return [{name: view} for view in _views(self.buffer, params, offsets)]
+
+    def load(self, start: int, end: int, out: Tensor) -> Tensor:
+        """The moment values in `[start, end)` in `out`'s dtype; may return a view instead of filling `out`."""
+        chunk = self.buffer[start:end]
+        if chunk.dtype == out.dtype:
+            return chunk
+        return out.copy_(chunk)
+
+    def store(self, start: int, end: int, values: Tensor) -> None:
+        chunk = self.buffer[start:end]
+        if values.data_ptr() != chunk.data_ptr():
+            chunk.copy_(values)
+
+
+class _BlockQuantizedMoments:
+    """A moment kept as int8 codes plus one fp32 scale per `QUANT_BLOCK_SIZE` elements.
+
+    With `sqrt`, the square root of the (non-negative) moment is quantized,
+    which halves the dynamic range the codes have to cover.
+    """
+
+    __slots__ = ("codes", "scales", "sqrt")
+
+    def __init__(self, numel: int, device: torch.device, sqrt: bool) -> None:
+        self.codes = torch.zeros(numel, dtype=torch.int8, device=device)
+        self.scales = torch.zeros(numel // QUANT_BLOCK_SIZE, dtype=torch.float32, device=device)
+        self.sqrt = sqrt
+
+    def state_views(self, name: str, params: list[torch.nn.Parameter], offsets: list[int]) -> list[dict[str, Tensor]]:
+        views = []
+        for p, offset, codes in zip(params, offsets, _views(self.codes, params, offsets)):
+            first_block = offset // QUANT_BLOCK_SIZE
+            views.append({name: codes, f"{name}_scale": self.scales[first_block : first_block + _num_blocks(p)]})
+        return views
+
+    def load(self, start: int, end: int, out: Tensor) -> Tensor:
+        _dequantize_blocks_(
+            self.codes[start:end], self.scales[start // QUANT_BLOCK_SIZE : end // QUANT_BLOCK_SIZE], out
+        )
+        return out.square_() if self.sqrt else out
+
+    def store(self, start: int, end: int, values: Tensor) -> None:
+        """Quantize `values` into `[start, end)`; `values` may be overwritten."""
+        if self.sqrt:
+            values = values.sqrt_()
+        _quantize_blocks_(
+            values, self.codes[start:end], self.scales[start // QUANT_BLOCK_SIZE : end // QUANT_BLOCK_SIZE]
+        )
+
+
+def _num_blocks(p: Tensor) -> int:
+    return _aligned(p.numel()) // QUANT_BLOCK_SIZE
+
+
+def _new_moments(
+    state_mode: str, numel: int, dtype: torch.dtype, device: torch.device
+) -> tuple[_DenseMoments | _BlockQuantizedMoments, _DenseMoments | _BlockQuantizedMoments | None]:
+    """First and second moment stores for a bucket; the second is None when it is factored."""
+    if state_mode == "bf16":
+        return _DenseMoments(numel, torch.bfloat16, device), _DenseMoments(numel, torch.bfloat16, device)
+    if state_mode == "int8":
+        return _BlockQuantizedMoments(numel, device, sqrt=False), _BlockQuantizedMoments(numel, device, sqrt=True)
+    if state_mode == "factored":
+        return _DenseMoments(numel, dtype, device), None
+    return _DenseMoments(numel, dtype, device), _DenseMoments(numel, dtype, device)
+
+
+def _dequantized(codes: Tensor, scales: Tensor) -> Tensor:
+    padded = F.pad(codes.flatten(), (0, scales.numel() * QUANT_BLOCK_SIZE - codes.numel()))
+    out = torch.empty(padded.shape, dtype=scales.dtype, device=scales.device)
+    return _dequantize_blocks_(padded, scales, out)[: codes.numel()].view_as(codes)
+
+
+def _dense_moments(state: dict, p: Tensor, dtype: torch.dtype) -> tuple[Tensor, Tensor] | None:
+    """The moments of `state` as `dtype` tensors shaped like `p`, whatever mode they were stored in."""
+    if "exp_avg" not in state:
+        return None
+    if "exp_avg_scale" in state:
+        exp_avg = _dequantized(state["exp_avg"], state["exp_avg_scale"])
+    else:
+        exp_avg = state["exp_avg"]
+    if "exp_avg_sq_row" in state:
+        row, col = state["exp_avg_sq_row"], state["exp_avg_sq_col"]
+        exp_avg_sq = torch.outer(row, col) / row.mean()
+    elif "exp_avg_sq_scale" in state:
+        exp_avg_sq = _dequantized(state["exp_avg_sq"], state["exp_avg_sq_scale"]).square()
+    else:
+        exp_avg_sq = state["exp_avg_sq"]
+    return exp_avg.to(dtype).view_as(p), exp_avg_sq.to(dtype).view_as(p)
+
+
+def _bucket_mode(state_mode: str, p: Tensor) -> str:
+    # Only matrices have rows and columns to factor; everything else keeps a full second moment.
+    if state_mode == "factored" and p.dim() != 2:
+        return "fp32"
+    return state_mode
+
+
+def _needs_master_weights(master_weights: bool, p: Tensor) -> bool:
+    return master_weights and torch.finfo(p.dtype).bits < 32
+
+
+class _FlatBucket:
+    """Parameters of one param group that share a device, dtype, step count and state mode.
+
+    The parameters, their gradients and both Adam moments each live in one
+    contiguous buffer; the tensors the rest of the program sees (`p.data`,
+    `p.grad`, the per-parameter optimizer state) are views into those buffers.
+    In "factored" mode the second moment is instead a row and a column vector
+    per parameter. With `master_weights`, an fp32 copy of the parameters (the
+    `master_param` state) receives the updates and the moments are fp32 too;
+    the low-precision parameters are refreshed from it after every step.
+    """
+
+    __slots__ = (
+        "exp_avg",
+        "exp_avg_sq",
+        "factors",
+        "grad_buffer",
+        "grad_views",
+        "master_buffer",
+        "offsets",
+        "param_buffer",
+        "param_views",
+        "params",
+        "step",
+    )
+
+    def __init__(
+        self,
+        params: list[torch.nn.Parameter],
+        states: list[dict],
+        step: int,
+        state_mode: str,
+        master_weights: bool = False,
+    ) -> None:
+        first = params[0]
+        compute_dtype = torch.float32 if master_weights else first.dtype
+        offsets = []
+        total = 0
+        for p in params:
+            offsets.append(total)
+            total += _aligned(p.numel())
+
+        def new_buffer() -> Tensor:
+            return torch.zeros(total, dtype=first.dtype, device=first.device)
+
+        self.params = params
+        self.offsets = offsets
+        self.step = step
+        self.param_buffer = new_buffer()
+        self.grad_buffer = new_buffer()
+        self.master_buffer = torch.zeros(total, dtype=compute_dtype, device=first.device) if master_weights else None
+        self.exp_avg, self.exp_avg_sq = _new_moments(state_mode, total, compute_dtype, first.device)
+        self.param_views = _views(self.param_buffer, params, offsets)
+        self.grad_views = _views(self.grad_buffer, params, offsets)
+        exp_avg_views = self.exp_avg.state_views("exp_avg", params, offsets)
+        if self.exp_avg_sq is not None:
+            self.factors = None
+            exp_avg_sq_views = self.exp_avg_sq.state_views("exp_avg_sq", params, offsets)
+        else:
+            self.factors = [
+                (p.new_zeros(p.shape[0], dtype=torch.float32), p.new_zeros(p.shape[1], dtype=torch.float32))
+                for p in params
+            ]
+            exp_avg_sq_views = [{"exp_avg_sq_row": row, "exp_avg_sq_col": col} for row, col in self.factors]
+
+        master_views = _views(self.master_buffer, params, offsets) if master_weights else [None] * len(params)
+
+        for i, (p, state, offset, param_view) in enumerate(zip(params, states, offsets, self.param_views)):
+            master = state.pop("master_param", None)
+            if master_views[i] is not None:
+                # Resume from the saved fp32 weights rather than their rounded low-precision copy.
+                master_views[i].copy_(master if master is not None else p.data)
+                state["master_param"] = master_views[i]
+            param_view.copy_(p.data)
+            p.data = param_view
+            # Carry over existing moments (e.g. restored from a checkpoint, possibly in another mode).
+            moments = _dense_moments(state, p, compute_dtype)
+            if moments is not None:
+                exp_avg, exp_avg_sq = moments
+                end = offset + _aligned(p.numel())
+                self.exp_avg.store(offset, end, _padded(exp_avg, end - offset))
+                if self.exp_avg_sq is not None:
+                    self.exp_avg_sq.store(offset, end, _padded(exp_avg_sq, end - offset))
+                else:
+                    row, col = self.factors[i]
+                    row.copy_(exp_avg_sq.mean(dim=1))
+                    col.copy_(exp_avg_sq.mean(dim=0))
+            for key in _MOMENT_KEYS:
+                state.pop(key, None)
+            state["step"] = step
+            state.update(exp_avg_views[i])
+            state.update(exp_avg_sq_views[i])
+
+    def is_current(self) -> bool:
+        """Whether every parameter still aliases this bucket's buffer (e.g. not moved by `.to()`)."""
+        return all(p.data_ptr() == view.data_ptr() for p, view in zip(self.params, self.param_views))
+
+    def gather_grads(self) -> Tensor:
+        """Move the parameters' gradients into the flat gradient buffer and return it."""
+        stale = [(p, view) for p, view in zip(self.params, self.grad_views) if p.grad is not view]
+        if stale:
+            torch._foreach_copy_([view for _, view in stale], [p.grad for p, _ in stale])
+            # Point .grad at the flat buffer so the separate gradient tensors can be freed, and
+            # so that zero_grad(set_to_none=False) + backward accumulates straight into it.
+            for p, view in stale:
+                p.grad = view
+        return self.grad_buffer
+
+
+def _padded(values: Tensor, numel: int) -> Tensor:
+    return F.pad(values.flatten(), (0, numel - values.numel()))
+
+
+def _adamw_update_(
+    param: Tensor,
+    grad: Tensor,
+    exp_avg: Tensor,
+    exp_avg_sq: Tensor,
+    denom: Tensor,
+    lr: float,
+    beta1: float,
+    beta2: float,
+    eps: float,
+    weight_decay: float,
+    step: int,
+) -> None:
+    """One in-place AdamW update of a flat slice; `denom` is scratch space of the same size."""
+    bias_correction1 = 1 - beta1**step
+    bias_correction2 = 1 - beta2**step
+    param.mul_(1 - lr * weight_decay)
+    exp_avg.lerp_(grad, 1 - beta1)
+    exp_avg_sq.mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
+    torch.sqrt(exp_avg_sq, out=denom)
+    denom.div_(math.sqrt(bias_correction2)).add_(eps)
+    param.addcdiv_(exp_avg, denom, value=-lr / bias_correction1)
+
+
+class AdamW(torch.optim.Optimizer):
+    """AdamW (decoupled weight decay) that updates each param group with a few vectorized ops.
+
+    On the first step the parameters of a group are copied into contiguous
+    per-(device, dtype) buffers, and `p.data`, `p.grad` and the `exp_avg` /
+    `exp_avg_sq` state become views into them. Each step then costs one
+    gradient gather plus a handful of ops per `UPDATE_CHUNK_SIZE` slice of the
+    buffers, independent of how many tensors the model has. The update itself
+    matches `torch.optim.AdamW`.
+
+    `state_mode` (per param group) trades optimizer-state memory for accuracy:
+      - "fp32": both moments in the parameters' dtype (8 bytes per fp32 parameter).
+      - "bf16": both moments in bfloat16 (4 bytes); the math still runs in fp32.
+      - "int8": both moments as int8 codes with an fp32 scale per block of
+        `QUANT_BLOCK_SIZE` (~2 bytes); the second moment is quantized as its square root.
+      - "factored": full first moment, and for 2-D parameters an Adafactor-style
+        second moment made of row and column averages (~4 bytes).
+    Compressed moments are decompressed one chunk at a time during the update.
+    State saved in any mode can be loaded into an optimizer using any other mode.
+
+    `master_weights` (per param group) is for parameters stored in bf16 or
+    fp16: the update is applied to an fp32 copy kept in the optimizer state,
+    which is then rounded into the parameters, so small updates accumulate
+    instead of being rounded away every step. It has no effect on fp32 parameters.
+    """
+
+    def __init__(
+        self,
+        params: Iterable[torch.nn.Parameter] | Iterable[dict],
+        lr: float = 1e-3,
+        betas: tuple[float, float] = (0.9, 0.999),
+        eps: float = 1e-8,
+        weight_decay: float = 0.01,
+        state_mode: str = "fp32",
+        master_weights: bool = False,
+    ) -> None:
+        if lr < 0:
+            raise ValueError(f"Invalid learning rate: {lr}")
+        if not (0.0 <= betas[0] < 1.0 and 0.0 <= betas[1] < 1.0):
+            raise ValueError(f"Invalid betas: {betas}")
+        if eps < 0:
+            raise ValueError(f"Invalid epsilon: {eps}")
+        if weight_decay < 0:
+            raise ValueError(f"Invalid weight_decay: {weight_decay}")
+        if state_mode not in STATE_MODES:
+            raise ValueError(f"Invalid state_mode: {state_mode!r}, expected one of {STATE_MODES}")
+        # group index -> buckets; filled lazily on the first step of each group.
+        self._buckets: dict[int, list[_FlatBucket]] = {}
+        # (device, dtype) -> reusable (_SCRATCH_ROWS, UPDATE_CHUNK_SIZE) scratch buffer.
+        self._scratch: dict[tuple[torch.device, torch.dtype], Tensor] = {}
+        defaults = {
+            "lr": lr,
+            "betas": betas,
+            "eps": eps,
+            "weight_decay": weight_decay,
+            "state_mode": state_mode,
+            "master_weights": master_weights,
+        }
+        super().__init__(params, defaults)
+
+    def add_param_group(self, param_group: dict) -> None:
+        super().add_param_group(param_group)
+        self._buckets.clear()
+
+    def load_state_dict(self, state_dict: dict) -> None:
+        storage = [(group["state_mode"], group["master_weights"]) for group in self.param_groups]
+        params = [p for group in self.param_groups for p in group["params"]]
+        saved_ids = [param_id for group in state_dict["param_groups"] for param_id in group["params"]]
+        super().load_state_dict(state_dict)
+        # torch casts floating-point state to the parameter's dtype, which would round fp32 master weights
+        # to bf16 and turn int8 codes into floats; keep the saved tensors as they are, only moved.
+        for p, param_id in zip(params, saved_ids):
+            for key, value in state_dict["state"].get(param_id, {}).items():
+                if isinstance(value, Tensor) and key != "step":
+                    self.state[p][key] = value.to(device=p.device)
+        # How state is stored is a choice of this run, not of the checkpoint; keep ours and convert.
+        for group, (state_mode, master_weights) in zip(self.param_groups, storage):
+            group["state_mode"] = state_mode
+            group["master_weights"] = master_weights
+        # The loaded moments are standalone tensors; rebuild the flat buffers around them on the next step.
+        self._buckets.clear()
+
+    def state_memory_bytes(self) -> int:
+        """Bytes held by the per-parameter optimizer state (moments, scales, factors and master weights)."""
+        return sum(
+            value.numel() * value.element_size()
+            for state in self.state.values()
+            for value in state.values()
+            if isinstance(value, Tensor)
+        )
+
+    def _group_buckets(self, group_index: int, params: list[torch.nn.Parameter]) -> list[_FlatBucket]:
+        buckets = self._buckets.get(group_index)
+        if buckets is not None:
+            bucket_params = [p for bucket in buckets for p in bucket.params]
+            if _same_params(bucket_params, params) and all(bucket.is_current() for bucket in buckets):
+                return buckets
+
+        state_mode = self.param_groups[group_index]["state_mode"]
+        master_weights = self.param_groups[group_index]["master_weights"]
+        by_key: dict[tuple, list[torch.nn.Parameter]] = {}
+        for p in params:
+            if p.grad.is_sparse:
+                raise RuntimeError("AdamW does not support sparse gradients")
+            key = (
+                p.device,
+                p.dtype,
+                self.state[p].get("step", 0),
+                _bucket_mode(state_mode, p),
+                _needs_master_weights(master_weights, p),
+            )
+            by_key.setdefault(key, []).append(p)
+        buckets = [
+            _FlatBucket(bucket_params, [self.state[p] for p in bucket_params], step, mode, master)
+            for (_, _, step, mode, master), bucket_params in by_key.items()
+        ]
+        self._buckets[group_index] = buckets
+        return buckets
+
+    def _scratch_buffers(self, like: Tensor) -> Tensor:
+        key = (like.device, like.dtype)
+        if key not in self._scratch:
+            self._scratch[key] = torch.empty(_SCRATCH_ROWS, UPDATE_CHUNK_SIZE, dtype=like.dtype, device=like.device)
+        return self._scratch[key]
+
+    @torch.no_grad()
+    def step(self, closure: Callable[[], float] | None = None) -> float | None:
+        loss = None
+        if closure is not None:
+            with torch.enable_grad():
+                loss = closure()
+
+        for group_index, group in enumerate(self.param_groups):
+            params = [p for p in group["params"] if p.grad is not None]
+            if not params:
+                continue
+            lr = group["lr"]
+            beta1, beta2 = group["betas"]
+            eps = group["eps"]
+            weight_decay = group["weight_decay"]
+
+            for bucket in self._group_buckets(group_index, params):
+                grad = bucket.gather_grads()
+                bucket.step += 1
+                if bucket.factors is not None:
+                    _factored_update_(bucket, lr, beta1, beta2, eps, weight_decay)
+                else:
+                    target = bucket.master_buffer if bucket.master_buffer is not None else bucket.param_buffer
+                    scratch = self._scratch_buffers(target)
+                    for start in range(0, grad.numel(), UPDATE_CHUNK_SIZE):
+                        end = min(start + UPDATE_CHUNK_SIZE, grad.numel())
+                        exp_avg = bucket.exp_avg.load(start, end, scratch[0, : end - start])
+                        exp_avg_sq = bucket.exp_avg_sq.load(start, end, scratch[1, : end - start])
+                        grad_chunk = grad[start:end]
+                        if grad_chunk.dtype != target.dtype:
+                            grad_chunk = scratch[3, : end - start].copy_(grad_chunk)
+                        _adamw_update_(
+                            target[start:end],
+                            grad_chunk,
+                            exp_avg,
+                            exp_avg_sq,
+                            scratch[2, : end - start],
+                            lr,
+                            beta1,
+                            beta2,
+                            eps,
+                            weight_decay,
+                            bucket.step,
+                        )
+                        bucket.exp_avg.store(start, end, exp_avg)
+                        bucket.exp_avg_sq.store(start, end, exp_avg_sq)
+                        if target is not bucket.param_buffer:
+                            bucket.param_buffer[start:end].copy_(target[start:end])
+
+                for p in bucket.params:
+                    self.state[p]["step"] = bucket.step
+
+        return loss
+
+
+def _factored_update_(
+    bucket: _FlatBucket, lr: float, beta1: float, beta2: float, eps: float, weight_decay: float
+) -> None:
+    """AdamW step for a bucket of matrices whose second moment is factored into row and column averages."""
+    bias_correction1 = 1 - beta1**bucket.step
+    bias_correction2 = 1 - beta2**bucket.step
+    target = bucket.master_buffer if bucket.master_buffer is not None else bucket.param_buffer
+    target.mul_(1 - lr * weight_decay)
+    bucket.exp_avg.buffer.lerp_(bucket.grad_buffer.to(target.dtype), 1 - beta1)
+    param_views = _views(target, bucket.params, bucket.offsets)
+    exp_avg_views = _views(bucket.exp_avg.buffer, bucket.params, bucket.offsets)
+    for param, grad, exp_avg, (row, col) in zip(param_views, bucket.grad_views, exp_avg_views, bucket.factors):
+        grad_sq = grad.float().square().add_(FACTORED_EPS)
+        row.lerp_(grad_sq.mean(dim=1), 1 - beta2)
+        col.lerp_(grad_sq.mean(dim=0), 1 - beta2)
+        # v ~= row col^T / mean(row); reuse the grad_sq buffer for the reconstruction.
+        denom = torch.outer(row, col, out=grad_sq).div_(row.mean() * bias_correction2).sqrt_().add_(eps)
+        param.addcdiv_(exp_avg, denom.to(param.dtype), value=-lr / bias_correction1)
+    if target is not bucket.param_buffer:
+        bucket.param_buffer.copy_(target)
+
+
+def get_lr_cosine_schedule(
+    it: int, max_learning_rate: float, min_learning_rate: float, warmup_iters: int, cosine_cycle_iters: int
+) -> float:
+    """Linear warmup to `max_learning_rate`, cosine decay to `min_learning_rate` at `cosine_cycle_iters`, then flat."""
+    if it < warmup_iters:
+        return it / warmup_iters * max_learning_rate
+    if it > cosine_cycle_iters:
+        return min_learning_rate
+    progress = (it - warmup_iters) / (cosine_cycle_iters - warmup_iters)
+    return min_learning_rate + 0.5 * (1 + math.cos(math.pi * progress)) * (max_learning_rate - min_learning_rate)
+
+
+def _same_params(a: list[torch.nn.Parameter], b: list[torch.nn.Parameter]) -> bool:
+    return len(a) == len(b) and {id(p) for p in a} == {id(p) for p in b}
@@ -0,0 +1,113 @@
+import torch
+from jaxtyping import Float, Int8
+from torch import Tensor, nn
+
+from cs336_basics.model import Linear
+
+# "dequant" multiplies by the int8 weights converted on the fly and applies the scales to the
+# output; "int8_gemm" quantizes activations per call and runs an int8 x int8 GEMM (CPU, fp32 only).
+QUANTIZED_BACKENDS = ("dequant", "int8_gemm")
+INT8_MAX = 127
+# Keeps the scale of an all-zero row positive.
+MIN_SCALE = 1e-12
+# Quantize activations to 7 bits in the int8 GEMM, as torch's dynamic quantization does, so the
+# int16 intermediate sums of the non-VNNI x86 kernels cannot saturate.
+INT8_GEMM_REDUCE_RANGE = True
+
+
+def int8_gemm_available() -> bool:
+    """Whether this torch build has a CPU int8 GEMM engine for `torch.ops.quantized.linear_dynamic`."""
+    return any(engine in torch.backends.quantized.supported_engines for engine in ("x86", "fbgemm"))
+
+
+def default_backend() -> str:
+    return "int8_gemm" if int8_gemm_available() else "dequant"
+
+
+def quantize_per_channel(
+    weight: Float[Tensor, " d_out d_in"],
+) -> tuple[Int8[Tensor, " d_out d_in"], Float[Tensor, " d_out"]]:
+    """Symmetric int8 codes and one fp32 scale per output channel, with `weight ≈ codes * scale[:, None]`."""
+    weight = weight.detach().float()
+    scale = weight.abs().amax(dim=1).clamp_(min=MIN_SCALE) / INT8_MAX
+    codes = torch.round(weight / scale[:, None]).clamp_(-INT8_MAX, INT8_MAX).to(torch.int8)
+    return codes, scale
+
+
+class QuantizedLinear(nn.Module):
+    """Inference-only replacement for `Linear` with int8 weights and per-output-channel scales.
+
+    The int8 codes and fp32 scales are buffers, so they go in the state dict;
+    the packed weight of the "int8_gemm" backend is rebuilt when the codes
+    change. Inputs the int8 GEMM cannot take (non-CPU or non-fp32) use "dequant".
+    """
+
+    def __init__(
+        self, in_features: int, out_features: int, backend: str = "dequant", device: torch.device | None = None
+    ) -> None:
+        super().__init__()
+        if backend not in QUANTIZED_BACKENDS:
+            raise ValueError(f"backend must be one of {QUANTIZED_BACKENDS}, got {backend!r}")
+        if backend == "int8_gemm" and not int8_gemm_available():
+            raise ValueError("backend 'int8_gemm' needs a torch build with the x86 or fbgemm quantized engine")
+        self.in_features = in_features
+        self.out_features = out_features
+        self.backend = backend
+        self.register_buffer("weight_int8", torch.zeros(out_features, in_features, dtype=torch.int8, device=device))
+        self.register_buffer("weight_scale", torch.ones(out_features, dtype=torch.float32, device=device))
+        self._packed = None
+        self._packed_key = None
+
+    @classmethod
+    def from_linear(cls, linear: Linear, backend: str = "dequant") -> "QuantizedLinear":
+        quantized = cls(linear.in_features, linear.out_features, backend, device=linear.weight.device)
+        codes, scale = quantize_per_channel(linear.weight)
+        quantized.weight_int8.copy_(codes)
+        quantized.weight_scale.copy_(scale)
+        return quantized
+
+    @property
+    def weight(self) -> Float[Tensor, " d_out d_in"]:
+        """The dequantized fp32 weight, for code that needs the matrix itself (such as `TransformerLM.loss`).
+
+        Each read builds a full float copy, so look up the device through `weight_scale` instead.
+        """
+        return self.weight_int8.float() * self.weight_scale[:, None]
+
+    def _packed_weight(self):
+        # The version counter moves on every in-place write (e.g. load_state_dict), the pointer on `.to()`.
+        key = (self.weight_int8.data_ptr(), self.weight_int8._version, self.weight_scale._version)
+        if self._packed_key != key:
+            zero_points = torch.zeros(self.out_features, dtype=torch.long)
+            qweight = torch._make_per_channel_quantized_tensor(
+                self.weight_int8, self.weight_scale.double(), zero_points, 0
+            )
+            self._packed = torch.ops.quantized.linear_prepack(qweight, None)
+            self._packed_key = key
+        return self._packed
+
+    def forward(self, x: Float[Tensor, " ... d_in"]) -> Float[Tensor, " ... d_out"]:
+        if self.backend == "int8_gemm" and x.device.type == "cpu" and x.dtype == torch.float32:
+            return torch.ops.quantized.linear_dynamic(x, self._packed_weight(), INT8_GEMM_REDUCE_RANGE)
+        # x @ (codes * scale).T == (x @ codes.T) * scale. The cast still copies the codes to x.dtype, but folding
+        # the scale into the output skips the d_out x d_in multiply and the second full-size temporary.
+        return (x @ self.weight_int8.T.to(x.dtype)) * self.weight_scale.to(x.dtype)
+
+    def extra_repr(self) -> str:
+        return f"in_features={self.in_features}, out_features={self.out_features}, backend={self.backend}"
+
+
+@torch.no_grad()
+def quantize_model_(model: nn.Module, backend: str | None = None) -> nn.Module:
+    """Replace every `Linear` in `model` (attention projections, SwiGLU, LM head) with a `QuantizedLinear`.
+
+    Embeddings and norms keep their float weights; a tied embedding keeps the
+    float copy of the shared matrix. `backend` defaults to `default_backend()`.
+    Returns `model`, which is only meant for inference afterwards.
+    """
+    backend = default_backend() if backend is None else backend
+    for module in list(model.modules()):
+        for child_name, child in list(module.named_children()):
+            if isinstance(child, Linear):
+                setattr(module, child_name, QuantizedLinear.from_linear(child, backend))
+    return model
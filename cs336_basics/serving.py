@@ -0,0 +1,226 @@
+import asyncio
+import codecs
+from collections import deque
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from typing import Self
+
+import torch
+
+from cs336_basics.generation import sample_next_token
+from cs336_basics.model import TransformerLM
+from cs336_basics.tokenizer import Tokenizer
+
+
+@dataclass
+class ServerStats:
+    prefill_tokens: int = 0
+    decode_steps: int = 0
+    # Sum of the batch sizes of all decode steps.
+    decoded_tokens: int = 0
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.decoded_tokens / self.decode_steps if self.decode_steps else 0.0
+
+
+@dataclass(eq=False)
+class _Sequence:
+    prompt_ids: list[int]
+    max_new_tokens: int
+    temperature: float
+    top_p: float
+    # Receives each new token id, then None when the sequence is done (or the exception that ended it).
+    queue: asyncio.Queue
+    slot: int = -1
+    last_token: int = -1
+    num_generated: int = 0
+    cancelled: bool = False
+
+
+class GenerationServer:
+    """Serves concurrent generation requests from one model with continuous batching.
+
+    A single scheduler task owns the model and a `SlotKVCache` with
+    `max_batch_size` slots. Every iteration it first admits waiting requests
+    into free slots (prefilling each prompt), then runs one decode step for
+    all active sequences as a single batch and streams every new token to its
+    caller. A sequence that finishes frees its slot for the next waiting
+    request right away, so the batch stays full under load instead of
+    draining down to its slowest member. Model calls run in a worker thread,
+    which keeps the event loop free to accept requests and stream tokens.
+
+    Use it as an async context manager (or call `start()` / `stop()`).
+    """
+
+    def __init__(
+        self,
+        model: TransformerLM,
+        tokenizer: Tokenizer | None = None,
+        max_batch_size: int = 8,
+        max_seq_len: int | None = None,
+        eos_token_id: int | None = None,
+        generator: torch.Generator | None = None,
+    ) -> None:
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be at least 1, got {max_batch_size}")
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.eos_token_id = eos_token_id
+        self.generator = generator
+        self.stats = ServerStats()
+        self._cache = model.new_slot_kv_cache(max_batch_size, max_seq_len)
+        self._device = next(model.parameters()).device
+        self._free_slots = list(range(max_batch_size - 1, -1, -1))
+        self._waiting: deque[_Sequence] = deque()
+        self._active: list[_Sequence] = []
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def max_seq_len(self) -> int:
+        return self._cache.max_seq_len
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the scheduler; requests still in flight end with `asyncio.CancelledError`."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def __aenter__(self) -> Self:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    async def stream_ids(
+        self, prompt_ids: list[int], max_new_tokens: int, temperature: float = 1.0, top_p: float = 1.0
+    ) -> AsyncIterator[int]:
+        """Yield the ids of up to `max_new_tokens` tokens that continue `prompt_ids`, as they are generated.
+
+        Generation stops early at `eos_token_id` (which is yielded) or when the
+        sequence fills its cache slot.
+        """
+        if self._task is None:
+            raise RuntimeError("GenerationServer is not running; use `async with` or call start()")
+        if not prompt_ids:
+            raise ValueError("prompt_ids must contain at least one token")
+        if len(prompt_ids) > self.max_seq_len:
+            raise ValueError(f"prompt has {len(prompt_ids)} tokens, the server's limit is {self.max_seq_len}")
+        if max_new_tokens < 1:
+            raise ValueError(f"max_new_tokens must be at least 1, got {max_new_tokens}")
+        sequence = _Sequence(list(prompt_ids), max_new_tokens, temperature, top_p, asyncio.Queue())
+        self._waiting.append(sequence)
+        self._wakeup.set()
+        try:
+            while True:
+                item = await sequence.queue.get()
+                if item is None:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # A caller that stops listening must not keep occupying a slot.
+            sequence.cancelled = True
+
+    async def stream(
+        self, prompt: str, max_new_tokens: int, temperature: float = 1.0, top_p: float = 1.0
+    ) -> AsyncIterator[str]:
+        """Like `stream_ids`, but text in and text out; multi-byte characters are held back until complete."""
+        if self.tokenizer is None:
+            raise RuntimeError("GenerationServer needs a tokenizer to serve text")
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        async for token_id in self.stream_ids(self.tokenizer.encode(prompt), max_new_tokens, temperature, top_p):
+            text = decoder.decode(self.tokenizer.vocab[token_id])
+            if text:
+                yield text
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield text
+
+    async def complete(self, prompt: str, max_new_tokens: int, temperature: float = 1.0, top_p: float = 1.0) -> str:
+        return "".join([text async for text in self.stream(prompt, max_new_tokens, temperature, top_p)])
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                self._active = [sequence for sequence in self._active if not self._retire_if_cancelled(sequence)]
+                if not self._active and not self._waiting:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                while self._waiting and self._free_slots:
+                    sequence = self._waiting.popleft()
+                    if sequence.cancelled:
+                        continue
+                    sequence.slot = self._free_slots.pop()
+                    token_id = await asyncio.to_thread(self._prefill, sequence)
+                    self.stats.prefill_tokens += len(sequence.prompt_ids)
+                    self._active.append(sequence)
+                    self._emit(sequence, token_id)
+                self._active = [sequence for sequence in self._active if sequence.slot >= 0]
+                if self._active:
+                    batch = list(self._active)
+                    token_ids = await asyncio.to_thread(self._decode, batch)
+                    self.stats.decode_steps += 1
+                    self.stats.decoded_tokens += len(batch)
+                    for sequence, token_id in zip(batch, token_ids):
+                        self._emit(sequence, token_id)
+                    self._active = [sequence for sequence in self._active if sequence.slot >= 0]
+        except BaseException as error:
+            # Fail the requests in flight instead of leaving their callers waiting forever.
+            for sequence in [*self._active, *self._waiting]:
+                sequence.queue.put_nowait(error)
+            raise
+
+    def _sample(self, logits: torch.Tensor, sequence: _Sequence) -> int:
+        return int(sample_next_token(logits, sequence.temperature, sequence.top_p, self.generator))
+
+    @torch.no_grad()
+    def _prefill(self, sequence: _Sequence) -> int:
+        self._cache.reset(sequence.slot)
+        self._cache.select([sequence.slot])
+        logits = self.model(torch.tensor([sequence.prompt_ids], device=self._device), kv_cache=self._cache)
+        return self._sample(logits[0, -1], sequence)
+
+    @torch.no_grad()
+    def _decode(self, batch: list[_Sequence]) -> list[int]:
+        self._cache.select([sequence.slot for sequence in batch])
+        in_indices = torch.tensor([[sequence.last_token] for sequence in batch], device=self._device)
+        logits = self.model(in_indices, kv_cache=self._cache)[:, -1]
+        return [self._sample(row, sequence) for row, sequence in zip(logits, batch)]
+
+    def _emit(self, sequence: _Sequence, token_id: int) -> None:
+        """Hand a new token to the caller and free the slot if the sequence is done."""
+        sequence.queue.put_nowait(token_id)
+        sequence.last_token = token_id
+        sequence.num_generated += 1
+        if (
+            sequence.num_generated >= sequence.max_new_tokens
+            or token_id == self.eos_token_id
+            or self._cache.length(sequence.slot) >= self.max_seq_len
+        ):
+            sequence.queue.put_nowait(None)
+            self._release(sequence)
+
+    def _retire_if_cancelled(self, sequence: _Sequence) -> bool:
+        if sequence.cancelled:
+            self._release(sequence)
+        return sequence.cancelled
+
+    def _release(self, sequence: _Sequence) -> None:
+        self._free_slots.append(sequence.slot)
+        sequence.slot = -1
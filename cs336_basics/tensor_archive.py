@@ -0,0 +1,120 @@
+import json
+import os
+from typing import IO, Any, BinaryIO
+
+import numpy as np
+import torch
+
+# File layout:
+#   ARCHIVE_MAGIC | header length (uint64, little-endian) | JSON header | padding | tensor data
+# The header holds the object tree with tensors replaced by indices into a table of
+# (dtype, shape, offset, nbytes); offsets are relative to the start of the tensor data.
+ARCHIVE_MAGIC = b"CS336TA\x00"
+ARCHIVE_VERSION = 1
+# Tensor data (and the start of the data section) is aligned to this many bytes.
+DATA_ALIGNMENT = 64
+
+_PREFIX_SIZE = len(ARCHIVE_MAGIC) + 8
+_DTYPES = {str(dtype).removeprefix("torch."): dtype for dtype in vars(torch).values() if isinstance(dtype, torch.dtype)}
+
+
+def _align(offset: int) -> int:
+    return -(-offset // DATA_ALIGNMENT) * DATA_ALIGNMENT
+
+
+def _encode(obj: Any, tensors: list[torch.Tensor]) -> Any:
+    """JSON-compatible form of `obj`, with tuples, non-string keys and tensors tagged so they round-trip."""
+    if isinstance(obj, torch.Tensor):
+        tensors.append(obj)
+        return {"tensor": len(tensors) - 1}
+    if isinstance(obj, dict):
+        return {"dict": [[_encode(key, tensors), _encode(value, tensors)] for key, value in obj.items()]}
+    if isinstance(obj, tuple):
+        return {"tuple": [_encode(value, tensors) for value in obj]}
+    if isinstance(obj, list):
+        return {"list": [_encode(value, tensors) for value in obj]}
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    raise TypeError(f"Cannot store object of type {type(obj).__name__} in a tensor archive")
+
+
+def _decode(obj: Any, tensors: list[torch.Tensor]) -> Any:
+    if not isinstance(obj, dict):
+        return obj
+    ((kind, value),) = obj.items()
+    if kind == "tensor":
+        return tensors[value]
+    if kind == "dict":
+        return {_decode(key, tensors): _decode(item, tensors) for key, item in value}
+    if kind == "tuple":
+        return tuple(_decode(item, tensors) for item in value)
+    return [_decode(item, tensors) for item in value]
+
+
+def write_tensor_archive(obj: Any, f: BinaryIO | IO[bytes]) -> None:
+    """Write a (nested) state dict to the binary file object `f`."""
+    tensors: list[torch.Tensor] = []
+    tree = _encode(obj, tensors)
+    contiguous = [t.detach().cpu().contiguous() for t in tensors]
+    table = []
+    offset = 0
+    for t in contiguous:
+        nbytes = t.numel() * t.element_size()
+        dtype = str(t.dtype).removeprefix("torch.")
+        table.append({"dtype": dtype, "shape": list(t.shape), "offset": offset, "nbytes": nbytes})
+        offset = _align(offset + nbytes)
+    header = json.dumps({"version": ARCHIVE_VERSION, "tree": tree, "tensors": table}).encode("utf-8")
+
+    f.write(ARCHIVE_MAGIC)
+    f.write(len(header).to_bytes(8, "little"))
+    f.write(header)
+    position = _PREFIX_SIZE + len(header)
+    data_start = _align(position)
+    f.write(b"\x00" * (data_start - position))
+    position = 0
+    for t, entry in zip(contiguous, table):
+        f.write(b"\x00" * (entry["offset"] - position))
+        if entry["nbytes"]:
+            f.write(t.reshape(-1).view(torch.uint8).numpy())
+        position = entry["offset"] + entry["nbytes"]
+
+
+def is_tensor_archive(src: str | os.PathLike | BinaryIO | IO[bytes]) -> bool:
+    """Whether `src` starts with the archive magic; file objects are left at their current position."""
+    if isinstance(src, (str, os.PathLike)):
+        with open(src, "rb") as f:
+            return f.read(len(ARCHIVE_MAGIC)) == ARCHIVE_MAGIC
+    position = src.tell()
+    try:
+        return src.read(len(ARCHIVE_MAGIC)) == ARCHIVE_MAGIC
+    finally:
+        src.seek(position)
+
+
+def read_tensor_archive(src: str | os.PathLike | BinaryIO | IO[bytes]) -> Any:
+    """Load an archive written by `write_tensor_archive`.
+
+    A path is memory-mapped copy-on-write and every tensor is a view into the
+    mapping, so nothing is read from disk until a tensor is actually used (for
+    example copied by `load_state_dict`), and the pages it occupies belong to
+    the page cache rather than to a second in-memory copy of the checkpoint.
+    A file object is read into memory once.
+    """
+    if isinstance(src, (str, os.PathLike)):
+        data = torch.from_numpy(np.memmap(src, dtype=np.uint8, mode="c"))
+    else:
+        data = torch.frombuffer(bytearray(src.read()), dtype=torch.uint8)
+    if bytes(data[: len(ARCHIVE_MAGIC)].numpy()) != ARCHIVE_MAGIC:
+        raise ValueError("Not a tensor archive (bad magic)")
+    header_size = int.from_bytes(bytes(data[len(ARCHIVE_MAGIC) : _PREFIX_SIZE].numpy()), "little")
+    header = json.loads(bytes(data[_PREFIX_SIZE : _PREFIX_SIZE + header_size].numpy()))
+    if header["version"] != ARCHIVE_VERSION:
+        raise ValueError(f"Unsupported tensor archive version {header['version']}")
+
+    data_start = _align(_PREFIX_SIZE + header_size)
+    tensors = []
+    for entry in header["tensors"]:
+        start = data_start + entry["offset"]
+        raw = data[start : start + entry["nbytes"]]
+        tensors.append(raw.view(_DTYPES[entry["dtype"]]).view(entry["shape"]))
+    return _decode(header["tree"], tensors)
@@ -4,9 +4,20 @@ import json
 from cs336_basics.bpe import PRE_TOKEN_RE, get_special_token_re
 from cs336_basics.gpt2_utils import gpt2_text_to_bytes
 
+# Pre-tokens whose token IDs are remembered. Natural text repeats a small set of words most of the
+# time, so an LRU cache of a few thousand entries (well under 1 MB) keeps those words and gets nearly
+# the hit rate of an unbounded cache.
+DEFAULT_CACHE_SIZE = 1 << 12
+
 
 class Tokenizer:
-    def __init__(self, vocab: dict[int, bytes], merges: list[tuple[bytes, bytes]], special_tokens: list[str] | None = None) -> None:
+    def __init__(
+        self,
+        vocab: dict[int, bytes],
+        merges: list[tuple[bytes, bytes]],
+        special_tokens: list[str] | None = None,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+    ) -> None:
         self.vocab = vocab
         self.vocab_inverse: dict[bytes, int] = {}
         for k,v in vocab.items():
@@ -19,9 +30,21 @@ class Tokenizer:
         for idx, b in vocab.items():
             if b in self.special_tokens:
                 self.special_token_dict[b] = idx
-            
+        # pre-token bytes -> token IDs in least to most recently used order; the least recently used
+        # entry is evicted once `cache_size` are held
+        self.cache_size = cache_size
+        self._cache: dict[bytes, tuple[int, ...]] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+
     @classmethod
-    def from_files(cls, vocab_filepath: str, merges_filepath: str, special_tokens: list[str] | None = None) -> "Tokenizer":
+    def from_files(
+        cls,
+        vocab_filepath: str,
+        merges_filepath: str,
+        special_tokens: list[str] | None = None,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+    ) -> "Tokenizer":
         with open(vocab_filepath, encoding="utf-8") as vocab_f:
             gpt2_vocab: dict[str, int] = json.load(vocab_f)
 
@@ -53,7 +76,7 @@ class Tokenizer:
                 right_bytes = gpt2_text_to_bytes(right)
                 merges.append((left_bytes, right_bytes))
 
-        return cls(vocab, merges, specials)
+        return cls(vocab, merges, specials, cache_size)
 
     def encode(self, text: str) -> list[int]:
         return list(self.encode_iterable([text]))
@@ -63,8 +86,32 @@ class Tokenizer:
             if pre in self.special_tokens:
                 yield self.special_token_dict[pre]
                 continue
+            token_ids = self._cache.pop(pre, None)
+            if token_ids is not None:
+                # Re-inserting moves the entry to the most recently used end.
+                self._cache[pre] = token_ids
+                self.cache_hits += 1
+                yield from token_ids
+                continue
+            self.cache_misses += 1
             pre_bytes = tuple(bytes([i]) for i in pre)
-            yield from self._encode_pre_token(pre_bytes)
+            token_ids = tuple(self._encode_pre_token(pre_bytes))
+            if self.cache_size > 0:
+                if len(self._cache) >= self.cache_size:
+                    del self._cache[next(iter(self._cache))]
+                self._cache[pre] = token_ids
+            yield from token_ids
+
+    @property
+    def cache_hit_rate(self) -> float:
+        """Fraction of non-special pre-tokens encoded from the cache since the last `clear_cache()`."""
+        lookups = self.cache_hits + self.cache_misses
+        return self.cache_hits / lookups if lookups else 0.0
+
+    def clear_cache(self) -> None:
+        self._cache.clear()
+        self.cache_hits = 0
+        self.cache_misses = 0
 
     def decode(self, ids: list[int]) -> str:
         byte_list = [self.vocab[token_id] for token_id in ids]
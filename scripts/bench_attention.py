@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+from pathlib import Path
+
+import torch
+
+from cs336_basics.benchmarking import peak_rss_bytes, run_isolated, time_call
+from cs336_basics.blockwise_attention import blockwise_attention
+from cs336_basics.model import scaled_dot_product_attention
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare peak memory and time of dense vs blockwise causal attention.")
+    parser.add_argument("--seq-lens", type=int, nargs="+", default=[256, 512, 1024, 2048, 4096])
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--num-heads", type=int, default=8)
+    parser.add_argument("--d-head", type=int, default=64)
+    parser.add_argument("--impls", nargs="+", choices=["dense", "blockwise"], default=["dense", "blockwise"])
+    parser.add_argument("--forward-only", action="store_true", help="Skip the backward pass.")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", type=Path, default=None, help="Append one JSON line per configuration here.")
+    return parser.parse_args()
+
+
+def measure(
+    impl: str, seq_len: int, batch_size: int, num_heads: int, d_head: int, backward: bool, repeats: int
+) -> dict:
+    torch.manual_seed(0)
+    shape = (batch_size, num_heads, seq_len, d_head)
+    q, k, v = (torch.randn(shape, requires_grad=backward) for _ in range(3))
+    grad_out = torch.randn(shape)
+
+    def step() -> None:
+        if impl == "dense":
+            mask = torch.ones(seq_len, seq_len, dtype=torch.bool).tril()
+            out = scaled_dot_product_attention(q, k, v, mask)
+        else:
+            out = blockwise_attention(q, k, v, is_causal=True)
+        if backward:
+            out.backward(grad_out)
+
+    baseline = peak_rss_bytes()
+    timings = time_call(step, warmup=1, repeats=repeats)
+    return {
+        "impl": impl,
+        "seq_len": seq_len,
+        "batch_size": batch_size,
+        "num_heads": num_heads,
+        "d_head": d_head,
+        "backward": backward,
+        "median_seconds": statistics.median(timings),
+        "peak_rss_delta_mib": (peak_rss_bytes() - baseline) / 2**20,
+    }
+
+
+def main() -> None:
+    args = parse_args()
+    print(f"{'impl':>10} {'seq_len':>8} {'median ms':>10} {'peak MiB':>10}")
+    for seq_len in args.seq_lens:
+        for impl in args.impls:
+            result = run_isolated(
+                measure,
+                impl,
+                seq_len,
+                args.batch_size,
+                args.num_heads,
+                args.d_head,
+                not args.forward_only,
+                args.repeats,
+            )
+            print(
+                f"{impl:>10} {seq_len:>8} {result['median_seconds'] * 1e3:>10.1f} {result['peak_rss_delta_mib']:>10.1f}"
+            )
+            if args.output is not None:
+                with args.output.open("a", encoding="utf-8") as f:
+                    f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
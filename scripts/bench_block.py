@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+
+import torch
+
+from cs336_basics.benchmarking import time_call
+from cs336_basics.model import BLOCK_IMPLS, TransformerBlock
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Forward + backward time and saved activations of one Transformer block."
+    )
+    parser.add_argument("--impls", nargs="+", choices=BLOCK_IMPLS, default=list(BLOCK_IMPLS))
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--context-length", type=int, default=256)
+    parser.add_argument("--d-model", type=int, default=512)
+    parser.add_argument("--num-heads", type=int, default=16)
+    parser.add_argument("--d-ff", type=int, default=1344)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--output", type=Path, default=None, help="Append one JSON line per implementation here.")
+    return parser.parse_args()
+
+
+def saved_activation_bytes(block: TransformerBlock, x: torch.Tensor) -> int:
+    """Bytes of the tensors autograd keeps for backward (parameters and the input excluded)."""
+    keep = {p.data_ptr() for p in block.parameters()} | {x.data_ptr()}
+    saved = {}
+
+    def pack(t: torch.Tensor) -> torch.Tensor:
+        if t.data_ptr() not in keep:
+            saved[t.data_ptr()] = t.untyped_storage().nbytes()
+        return t
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda t: t):
+        block(x)
+    return sum(saved.values())
+
+
+def main() -> None:
+    args = parse_args()
+    torch.manual_seed(0)
+    reference = TransformerBlock(args.d_model, args.num_heads, args.d_ff, args.context_length, 10000.0)
+    x = torch.randn(args.batch_size, args.context_length, args.d_model, requires_grad=True)
+    grad_output = torch.randn_like(x)
+    expected = reference(x)
+    expected_grad = torch.autograd.grad(expected, x, grad_output)[0]
+
+    print(f"{'impl':>9} {'first call s':>13} {'median ms':>10} {'min ms':>8} {'saved MiB':>10} {'max |dout|':>11}")
+    for impl in args.impls:
+        block = TransformerBlock(args.d_model, args.num_heads, args.d_ff, args.context_length, 10000.0, block_impl=impl)
+        block.load_state_dict(reference.state_dict())
+
+        def step(block: TransformerBlock = block) -> torch.Tensor:
+            out = block(x)
+            torch.autograd.grad(out, [x, *block.parameters()], grad_output)
+            return out
+
+        # The first call includes compilation for "compiled".
+        start = time.perf_counter()
+        out = step()
+        first_call = time.perf_counter() - start
+        timings = time_call(step, warmup=1, repeats=args.repeats)
+        grad = torch.autograd.grad(block(x), x, grad_output)[0]
+        result = {
+            "impl": impl,
+            "first_call_seconds": first_call,
+            "median_ms": statistics.median(timings) * 1e3,
+            "min_ms": min(timings) * 1e3,
+            # Compiled graphs save their activations out of sight of the hooks; not comparable.
+            "saved_bytes": saved_activation_bytes(block, x) if impl != "compiled" else None,
+            "max_output_diff": (out - expected).abs().max().item(),
+            "max_input_grad_diff": (grad - expected_grad).abs().max().item(),
+        }
+        saved = f"{result['saved_bytes'] / 2**20:>10.1f}" if result["saved_bytes"] is not None else f"{'-':>10}"
+        print(
+            f"{impl:>9} {first_call:>13.2f} {result['median_ms']:>10.1f} {result['min_ms']:>8.1f} {saved} "
+            f"{result['max_output_diff']:>11.2e}"
+        )
+        if args.output is not None:
+            with args.output.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
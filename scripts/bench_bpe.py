@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import tempfile
+import time
+from pathlib import Path
+
+from cs336_basics.benchmarking import git_revision, peak_rss_bytes, run_isolated, write_synthetic_corpus
+from cs336_basics.bpe import my_run_train_bpe
+
+# Phases reported by my_run_train_bpe through kwargs["phase_seconds"], in execution order.
+PHASES = ("chunking", "pretokenize", "merge_counts", "pair_counts", "merge_loop")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Per-phase time and peak memory of BPE training over corpus size, num_processes and vocab size."
+    )
+    parser.add_argument("--sizes-mib", type=float, nargs="+", default=[1, 4, 16], help="Synthetic corpus sizes.")
+    parser.add_argument("--num-processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--vocab-sizes", type=int, nargs="+", default=[1000, 4000, 10000])
+    parser.add_argument("--special-tokens", nargs="*", default=["<|endoftext|>"])
+    parser.add_argument("--corpus-dir", type=Path, default=None, help="Keep the generated corpora here for reuse.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None, help="Append one JSON line per configuration here.")
+    return parser.parse_args()
+
+
+def train_once(input_path: Path, vocab_size: int, special_tokens: list[str], num_processes: int) -> dict:
+    """Runs in a fresh process, so the peak RSS figures belong to this run alone."""
+    phase_seconds: dict[str, float] = {}
+    start = time.perf_counter()
+    _, merges = my_run_train_bpe(
+        input_path, vocab_size, special_tokens, {"num_processes": num_processes, "phase_seconds": phase_seconds}
+    )
+    return {
+        "total_seconds": time.perf_counter() - start,
+        **{f"{phase}_seconds": phase_seconds.get(phase, 0.0) for phase in PHASES},
+        "num_merges": len(merges),
+        "peak_rss_mib": peak_rss_bytes() / 2**20,
+        # The pre-tokenization workers hold a chunk of text and its counts each.
+        "peak_worker_rss_mib": peak_rss_bytes(children=True) / 2**20,
+    }
+
+
+def corpus_path(corpus_dir: Path, size_mib: float, seed: int) -> Path:
+    path = corpus_dir / f"synthetic_{size_mib:g}mib_seed{seed}.txt"
+    if not path.exists():
+        write_synthetic_corpus(path, int(size_mib * 2**20), seed)
+    return path
+
+
+def scaling_exponent(sizes: list[float], seconds: list[float]) -> float:
+    """Least-squares slope of log(seconds) against log(size): 1.0 is linear scaling."""
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(second, 1e-9)) for second in seconds]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance if variance else float("nan")
+
+
+def main() -> None:
+    args = parse_args()
+    revision = git_revision(Path(__file__).parent)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = args.corpus_dir or Path(tmp)
+        corpus_dir.mkdir(parents=True, exist_ok=True)
+        print(
+            f"{'MiB':>6} {'procs':>5} {'vocab':>6} {'total s':>8} {'pretok s':>9} {'counts s':>9} "
+            f"{'pairs s':>8} {'merge s':>8} {'peak MiB':>9} {'worker MiB':>11}"
+        )
+        for size_mib in args.sizes_mib:
+            path = corpus_path(corpus_dir, size_mib, args.seed)
+            for num_processes in args.num_processes:
+                for vocab_size in args.vocab_sizes:
+                    metrics = run_isolated(train_once, path, vocab_size, args.special_tokens, num_processes)
+                    result = {
+                        "revision": revision,
+                        "corpus": "synthetic",
+                        "size_mib": size_mib,
+                        "num_processes": num_processes,
+                        "vocab_size": vocab_size,
+                        **metrics,
+                    }
+                    results.append(result)
+                    print(
+                        f"{size_mib:>6g} {num_processes:>5} {vocab_size:>6} {result['total_seconds']:>8.2f} "
+                        f"{result['pretokenize_seconds']:>9.2f} {result['merge_counts_seconds']:>9.2f} "
+                        f"{result['pair_counts_seconds']:>8.2f} {result['merge_loop_seconds']:>8.2f} "
+                        f"{result['peak_rss_mib']:>9.0f} {result['peak_worker_rss_mib']:>11.0f}"
+                    )
+                    if args.output is not None:
+                        with args.output.open("a", encoding="utf-8") as f:
+                            f.write(json.dumps(result) + "\n")
+
+    if len(args.sizes_mib) > 1:
+        print("\nscaling exponent of each phase with corpus size (1.0 = linear)")
+        print(f"{'procs':>5} {'vocab':>6} " + " ".join(f"{phase:>12}" for phase in ("total", *PHASES)))
+        for num_processes in args.num_processes:
+            for vocab_size in args.vocab_sizes:
+                runs = [r for r in results if (r["num_processes"], r["vocab_size"]) == (num_processes, vocab_size)]
+                sizes = [r["size_mib"] for r in runs]
+                exponents = [
+                    scaling_exponent(sizes, [r[f"{phase}_seconds"] for r in runs]) for phase in ("total", *PHASES)
+                ]
+                print(f"{num_processes:>5} {vocab_size:>6} " + " ".join(f"{e:>12.2f}" for e in exponents))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+from collections.abc import Callable
+from pathlib import Path
+
+import torch
+
+from cs336_basics.benchmarking import git_revision, peak_rss_bytes, run_isolated, time_call
+from cs336_basics.model import (
+    ATTENTION_IMPLS,
+    BLOCK_IMPLS,
+    Embedding,
+    Linear,
+    MultiHeadSelfAttention,
+    RMSNorm,
+    RotaryPositionalEmbedding,
+    SwiGLU,
+    TransformerBlock,
+    TransformerLM,
+    scaled_dot_product_attention,
+)
+
+# One entry per model adapter in tests/adapters.py, in the order they build on each other.
+COMPONENTS = ("linear", "embedding", "rmsnorm", "swiglu", "sdpa", "mha_rope", "transformer_block", "transformer_lm")
+# Fields identifying a configuration, used to match rows against a --baseline run.
+KEY_COLUMNS = ("component", "batch_size", "seq_len", "d_model")
+D_HEAD = 64
+ROPE_THETA = 10000.0
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Forward and forward+backward time and peak memory of each model component over a shape grid."
+    )
+    parser.add_argument("--components", nargs="+", choices=COMPONENTS, default=list(COMPONENTS))
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8])
+    parser.add_argument("--seq-lens", type=int, nargs="+", default=[128, 512])
+    parser.add_argument("--d-models", type=int, nargs="+", default=[256, 512])
+    parser.add_argument("--vocab-size", type=int, default=10000)
+    parser.add_argument("--num-layers", type=int, default=2, help="Layers of the transformer_lm component.")
+    parser.add_argument("--attention-impl", choices=ATTENTION_IMPLS, default="dense")
+    parser.add_argument("--block-impl", choices=BLOCK_IMPLS, default="eager")
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--baseline", type=Path, default=None, help="JSONL of an earlier run to report speedups over.")
+    parser.add_argument("--table", type=Path, default=None, help="Write the printed table here, for diffing runs.")
+    parser.add_argument("--output", type=Path, default=None, help="Append one JSON line per configuration here.")
+    return parser.parse_args()
+
+
+def d_ff_for(d_model: int) -> int:
+    """About 8/3 * d_model, rounded up to a multiple of 64, as in the standard SwiGLU sizing."""
+    return (8 * d_model // 3 + 63) // 64 * 64
+
+
+def build(
+    component: str, batch_size: int, seq_len: int, d_model: int, args: argparse.Namespace
+) -> Callable[[], torch.Tensor]:
+    """A closure running the component's forward pass on fixed random inputs."""
+    device = torch.device(args.device)
+    num_heads = max(1, d_model // D_HEAD)
+    fused = args.block_impl == "fused"
+    x = torch.randn(batch_size, seq_len, d_model, device=device, requires_grad=True)
+    if component == "linear":
+        module = Linear(d_model, d_ff_for(d_model), device=device)
+        return lambda: module(x)
+    if component == "embedding":
+        module = Embedding(args.vocab_size, d_model, device=device)
+        token_ids = torch.randint(0, args.vocab_size, (batch_size, seq_len), device=device)
+        return lambda: module(token_ids)
+    if component == "rmsnorm":
+        module = RMSNorm(d_model, fused=fused, device=device)
+        return lambda: module(x)
+    if component == "swiglu":
+        module = SwiGLU(d_model, d_ff_for(d_model), fused=fused, device=device)
+        return lambda: module(x)
+    if component == "sdpa":
+        shape = (batch_size, num_heads, seq_len, d_model // num_heads)
+        q, k, v = (torch.randn(shape, device=device, requires_grad=True) for _ in range(3))
+        mask = torch.ones(seq_len, seq_len, dtype=torch.bool, device=device).tril()
+        return lambda: scaled_dot_product_attention(q, k, v, mask)
+    if component == "mha_rope":
+        rope = RotaryPositionalEmbedding(ROPE_THETA, d_model // num_heads, seq_len, device=device)
+        module = MultiHeadSelfAttention(
+            d_model, num_heads, rope=rope, attention_impl=args.attention_impl, device=device
+        )
+        return lambda: module(x)
+    if component == "transformer_block":
+        module = TransformerBlock(
+            d_model,
+            num_heads,
+            d_ff_for(d_model),
+            seq_len,
+            ROPE_THETA,
+            attention_impl=args.attention_impl,
+            block_impl=args.block_impl,
+            device=device,
+        )
+        return lambda: module(x)
+    module = TransformerLM(
+        args.vocab_size,
+        seq_len,
+        d_model,
+        args.num_layers,
+        num_heads,
+        d_ff_for(d_model),
+        ROPE_THETA,
+        attention_impl=args.attention_impl,
+        block_impl=args.block_impl,
+        device=device,
+    )
+    token_ids = torch.randint(0, args.vocab_size, (batch_size, seq_len), device=device)
+    return lambda: module(token_ids)
+
+
+def measure(component: str, batch_size: int, seq_len: int, d_model: int, args: argparse.Namespace) -> dict:
+    """Runs in a fresh process on CPU, so the peak RSS belongs to this configuration alone."""
+    torch.manual_seed(0)
+    cuda = torch.device(args.device).type == "cuda"
+    synchronize = torch.cuda.synchronize if cuda else lambda: None
+    if cuda:
+        torch.cuda.empty_cache()
+        torch.cuda.reset_peak_memory_stats()
+        baseline = torch.cuda.memory_allocated()
+    else:
+        baseline = peak_rss_bytes()
+
+    def peak_mib() -> float:
+        peak = torch.cuda.max_memory_allocated() if cuda else peak_rss_bytes()
+        return (peak - baseline) / 2**20
+
+    forward = build(component, batch_size, seq_len, d_model, args)
+
+    def run_forward() -> None:
+        with torch.no_grad():
+            forward()
+        synchronize()
+
+    forward_seconds = time_call(run_forward, args.warmup, args.repeats)
+    forward_peak = peak_mib()
+
+    grad_out = torch.randn_like(forward())
+
+    def run_step() -> None:
+        forward().backward(grad_out)
+        synchronize()
+
+    step_seconds = time_call(run_step, args.warmup, args.repeats)
+    return {
+        "component": component,
+        "batch_size": batch_size,
+        "seq_len": seq_len,
+        "d_model": d_model,
+        "attention_impl": args.attention_impl,
+        "block_impl": args.block_impl,
+        "device": args.device,
+        "forward_ms": statistics.median(forward_seconds) * 1000,
+        "forward_backward_ms": statistics.median(step_seconds) * 1000,
+        "forward_peak_mib": forward_peak,
+        "forward_backward_peak_mib": peak_mib(),
+    }
+
+
+def load_baseline(path: Path | None) -> dict[tuple, dict]:
+    if path is None:
+        return {}
+    records = [json.loads(line) for line in path.read_text().splitlines() if line.strip()]
+    return {tuple(record[key] for key in KEY_COLUMNS): record for record in records}
+
+
+def format_row(result: dict, reference: dict | None) -> str:
+    row = (
+        f"{result['component']:>17} {result['batch_size']:>5} {result['seq_len']:>6} {result['d_model']:>7} "
+        f"{result['forward_ms']:>9.2f} {result['forward_backward_ms']:>10.2f} "
+        f"{result['forward_peak_mib']:>9.1f} {result['forward_backward_peak_mib']:>10.1f}"
+    )
+    if reference is not None:
+        row += (
+            f" {reference['forward_ms'] / result['forward_ms']:>7.2f}x"
+            f" {reference['forward_backward_ms'] / result['forward_backward_ms']:>7.2f}x"
+        )
+    return row
+
+
+def main() -> None:
+    args = parse_args()
+    baseline = load_baseline(args.baseline)
+    header = (
+        f"{'component':>17} {'batch':>5} {'seq':>6} {'d_model':>7} {'fwd ms':>9} {'fwd+bwd ms':>10} "
+        f"{'fwd MiB':>9} {'train MiB':>10}"
+    )
+    if baseline:
+        header += f" {'fwd':>8} {'fwd+bwd':>8}"
+    lines = [
+        (
+            f"# revision={git_revision(Path(__file__).parent)} device={args.device} "
+            f"attention_impl={args.attention_impl} block_impl={args.block_impl}"
+        ),
+        header,
+    ]
+    print("\n".join(lines))
+
+    for component in args.components:
+        for batch_size in args.batch_sizes:
+            for seq_len in args.seq_lens:
+                for d_model in args.d_models:
+                    config = (component, batch_size, seq_len, d_model, args)
+                    isolate = torch.device(args.device).type == "cpu"
+                    result = run_isolated(measure, *config) if isolate else measure(*config)
+                    line = format_row(result, baseline.get(tuple(result[key] for key in KEY_COLUMNS)))
+                    print(line)
+                    lines.append(line)
+                    if args.output is not None:
+                        with args.output.open("a", encoding="utf-8") as f:
+                            f.write(json.dumps(result) + "\n")
+
+    if args.table is not None:
+        args.table.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
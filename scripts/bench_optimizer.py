@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import argparse
+import statistics
+
+import torch
+
+from cs336_basics.benchmarking import time_call
+from cs336_basics.model import TransformerLM
+from cs336_basics.optimizer import AdamW
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Time AdamW.step() on a Transformer LM with many parameter tensors.")
+    parser.add_argument("--vocab-size", type=int, default=10000)
+    parser.add_argument("--d-model", type=int, default=256)
+    parser.add_argument("--num-layers", type=int, default=48)
+    parser.add_argument("--num-heads", type=int, default=8)
+    parser.add_argument("--d-ff", type=int, default=672)
+    parser.add_argument("--repeats", type=int, default=20)
+    return parser.parse_args()
+
+
+OPTIMIZERS = {
+    "torch AdamW (for-loop)": lambda params: torch.optim.AdamW(params, foreach=False),
+    "torch AdamW (foreach)": lambda params: torch.optim.AdamW(params, foreach=True),
+    "cs336 AdamW (flat)": lambda params: AdamW(params),
+}
+
+
+def main() -> None:
+    args = parse_args()
+    print(f"{'optimizer':>24} {'median ms':>10} {'min ms':>8}")
+    for name, make_optimizer in OPTIMIZERS.items():
+        torch.manual_seed(0)
+        model = TransformerLM(
+            args.vocab_size, 256, args.d_model, args.num_layers, args.num_heads, args.d_ff, rope_theta=10000.0
+        )
+        params = list(model.parameters())
+        for p in params:
+            p.grad = torch.randn_like(p)
+        optimizer = make_optimizer(params)
+        timings = time_call(optimizer.step, warmup=2, repeats=args.repeats)
+        print(f"{name:>24} {statistics.median(timings) * 1e3:>10.2f} {min(timings) * 1e3:>8.2f}")
+    num_params = sum(p.numel() for p in params)
+    print(f"{len(params)} parameter tensors, {num_params / 1e6:.1f}M parameters")
+
+
+if __name__ == "__main__":
+    main()
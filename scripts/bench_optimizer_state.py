@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+
+import torch
+
+from cs336_basics.model import TransformerLM
+from cs336_basics.nn_utils import cross_entropy
+from cs336_basics.optimizer import STATE_MODES, AdamW
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Train a small LM with each AdamW state mode; report state memory and drift from the fp32 run."
+    )
+    parser.add_argument("--modes", nargs="+", choices=STATE_MODES, default=list(STATE_MODES))
+    parser.add_argument("--vocab-size", type=int, default=512)
+    parser.add_argument("--context-length", type=int, default=64)
+    parser.add_argument("--d-model", type=int, default=128)
+    parser.add_argument("--num-layers", type=int, default=4)
+    parser.add_argument("--num-heads", type=int, default=4)
+    parser.add_argument("--d-ff", type=int, default=344)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--lr", type=float, default=3e-3)
+    parser.add_argument("--output", type=Path, default=None, help="Append one JSON line per mode here.")
+    return parser.parse_args()
+
+
+def synthetic_batches(vocab_size: int, batch_size: int, context_length: int, steps: int) -> list[torch.Tensor]:
+    """Token sequences from a fixed random Markov chain with 4 likely successors per token."""
+    generator = torch.Generator().manual_seed(0)
+    successors = torch.randint(0, vocab_size, (vocab_size, 4), generator=generator)
+    batches = []
+    for _ in range(steps):
+        tokens = torch.empty(batch_size, context_length + 1, dtype=torch.long)
+        tokens[:, 0] = torch.randint(0, vocab_size, (batch_size,), generator=generator)
+        for i in range(context_length):
+            choice = torch.randint(0, 4, (batch_size,), generator=generator)
+            tokens[:, i + 1] = successors[tokens[:, i], choice]
+        batches.append(tokens)
+    return batches
+
+
+def train(args: argparse.Namespace, state_mode: str, batches: list[torch.Tensor]) -> tuple[list[float], dict, int]:
+    torch.manual_seed(0)
+    model = TransformerLM(
+        args.vocab_size, args.context_length, args.d_model, args.num_layers, args.num_heads, args.d_ff, 10000.0
+    )
+    optimizer = AdamW(model.parameters(), lr=args.lr, betas=(0.9, 0.95), weight_decay=0.1, state_mode=state_mode)
+    losses = []
+    for tokens in batches:
+        logits = model(tokens[:, :-1])
+        loss = cross_entropy(logits.flatten(0, 1), tokens[:, 1:].flatten())
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        losses.append(loss.item())
+    return losses, {name: p.detach().clone() for name, p in model.named_parameters()}, optimizer.state_memory_bytes()
+
+
+def main() -> None:
+    args = parse_args()
+    batches = synthetic_batches(args.vocab_size, args.batch_size, args.context_length, args.steps)
+    reference_losses, reference_params, reference_bytes = train(args, "fp32", batches)
+
+    print(
+        f"{'mode':>9} {'state MiB':>10} {'saved MiB':>10} {'saved %':>8} "
+        f"{'final loss':>11} {'max |dloss|':>12} {'param rel err':>14}"
+    )
+    for mode in args.modes:
+        if mode == "fp32":
+            losses, params, state_bytes = reference_losses, reference_params, reference_bytes
+        else:
+            losses, params, state_bytes = train(args, mode, batches)
+        param_error = max(
+            ((params[name] - reference).norm() / reference.norm()).item()
+            for name, reference in reference_params.items()
+        )
+        result = {
+            "mode": mode,
+            "steps": args.steps,
+            "state_bytes": state_bytes,
+            "saved_bytes": reference_bytes - state_bytes,
+            "final_loss": losses[-1],
+            "reference_final_loss": reference_losses[-1],
+            "max_loss_diff": max(abs(a - b) for a, b in zip(losses, reference_losses)),
+            "max_param_rel_error": param_error,
+        }
+        print(
+            f"{mode:>9} {state_bytes / 2**20:>10.2f} {result['saved_bytes'] / 2**20:>10.2f} "
+            f"{100 * result['saved_bytes'] / reference_bytes:>8.1f} {losses[-1]:>11.4f} "
+            f"{result['max_loss_diff']:>12.4f} {param_error:>14.4f}"
+        )
+        if args.output is not None:
+            with args.output.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
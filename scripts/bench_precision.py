@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from cs336_basics.benchmarking import run_script_metrics
+
+TRAIN_SCRIPT = Path(__file__).with_name("train_lm.py")
+# Must match train_lm.PRECISIONS; the first one is the reference.
+PRECISIONS = ("fp32", "bf16-autocast", "bf16")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Throughput and loss parity of train_lm.py in bf16 (autocast / master weights) against fp32."
+    )
+    parser.add_argument(
+        "--train-data",
+        type=Path,
+        default=None,
+        help="Token IDs (e.g. TinyStories); default: a synthetic Markov-chain corpus.",
+    )
+    parser.add_argument("--val-data", type=Path, default=None, help="Held-out token IDs (default: the train data).")
+    parser.add_argument("--precisions", nargs="+", choices=PRECISIONS, default=list(PRECISIONS))
+    parser.add_argument("--vocab-size", type=int, default=2048)
+    parser.add_argument("--context-length", type=int, default=128)
+    parser.add_argument("--d-model", type=int, default=256)
+    parser.add_argument("--num-layers", type=int, default=4)
+    parser.add_argument("--num-heads", type=int, default=8)
+    parser.add_argument("--d-ff", type=int, default=672)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--log-interval", type=int, default=10)
+    parser.add_argument("--output", type=Path, default=None, help="Append one JSON line per precision here.")
+    return parser.parse_args()
+
+
+def write_markov_tokens(path: Path, vocab_size: int, num_tokens: int) -> None:
+    """A token stream from a fixed random Markov chain with 4 likely successors per token, so the loss can fall."""
+    rng = np.random.default_rng(0)
+    successors = rng.integers(0, vocab_size, (vocab_size, 4))
+    choices = rng.integers(0, 4, num_tokens)
+    tokens = np.empty(num_tokens, dtype=np.uint16)
+    tokens[0] = 0
+    for i in range(1, num_tokens):
+        tokens[i] = successors[tokens[i - 1], choices[i]]
+    np.save(path, tokens)
+
+
+def run_precision(args: argparse.Namespace, train_path: Path, val_path: Path, precision: str) -> list[dict]:
+    arguments = [
+        f"--train-data={train_path}",
+        f"--val-data={val_path}",
+        f"--vocab-size={args.vocab_size}",
+        f"--context-length={args.context_length}",
+        f"--d-model={args.d_model}",
+        f"--num-layers={args.num_layers}",
+        f"--num-heads={args.num_heads}",
+        f"--d-ff={args.d_ff}",
+        f"--batch-size={args.batch_size}",
+        f"--max-steps={args.steps}",
+        f"--log-interval={args.log_interval}",
+        f"--eval-interval={args.steps}",
+        f"--warmup-steps={args.steps // 10}",
+        f"--precision={precision}",
+    ]
+    return run_script_metrics(TRAIN_SCRIPT, arguments)
+
+
+def summarize(records: list[dict]) -> dict:
+    train = [record for record in records if record["event"] == "train"]
+    # The first interval includes warm-up (allocator, first-touch of weights); leave it out of the throughput.
+    timed = train[1:] or train
+    return {
+        "tokens_per_second": sum(r["tokens_per_second"] for r in timed) / len(timed),
+        "losses": [r["loss"] for r in train],
+        "final_loss": train[-1]["loss"],
+        "val_loss": [r["val_loss"] for r in records if r["event"] == "eval"][-1],
+    }
+
+
+def main() -> None:
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        train_path = args.train_data
+        if train_path is None:
+            train_path = Path(tmp) / "tokens.npy"
+            write_markov_tokens(train_path, args.vocab_size, 1 << 20)
+        val_path = args.val_data if args.val_data is not None else train_path
+        # The reference always runs, on the same data and seed, so every row has something to compare against.
+        runs = {"fp32": summarize(run_precision(args, train_path, val_path, "fp32"))}
+        for precision in args.precisions:
+            if precision not in runs:
+                runs[precision] = summarize(run_precision(args, train_path, val_path, precision))
+
+    reference = runs["fp32"]
+    print(f"{'precision':>14} {'tok/s':>8} {'speedup':>8} {'final loss':>11} {'val loss':>9} {'max |dloss|':>12}")
+    for precision in args.precisions:
+        run = runs[precision]
+        result = {
+            "precision": precision,
+            "steps": args.steps,
+            "tokens_per_second": run["tokens_per_second"],
+            "speedup": run["tokens_per_second"] / reference["tokens_per_second"],
+            "final_loss": run["final_loss"],
+            "val_loss": run["val_loss"],
+            "reference_val_loss": reference["val_loss"],
+            "max_loss_diff": max(abs(a - b) for a, b in zip(run["losses"], reference["losses"])),
+        }
+        print(
+            f"{precision:>14} {result['tokens_per_second']:>8.0f} {result['speedup']:>8.2f} "
+            f"{result['final_loss']:>11.4f} {result['val_loss']:>9.4f} {result['max_loss_diff']:>12.4f}"
+        )
+        if args.output is not None:
+            with args.output.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from cs336_basics.checkpointing import read_checkpoint
+from cs336_basics.model import TransformerLM
+from cs336_basics.serving import GenerationServer
+from cs336_basics.tokenizer import Tokenizer
+
+# Prompts are random sequences of these words.
+WORDS = [
+    "once",
+    "upon",
+    "a",
+    "time",
+    "there",
+    "was",
+    "a",
+    "little",
+    "girl",
+    "who",
+    "loved",
+    "to",
+    "play",
+    "in",
+    "the",
+    "park",
+    "with",
+    "her",
+    "dog",
+]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Latency percentiles and throughput of GenerationServer under a synthetic Poisson load."
+    )
+    parser.add_argument("--checkpoint", type=Path, default=None, help="Model weights; default: random init.")
+    parser.add_argument("--vocab", type=Path, default=None, help="Tokenizer vocab (with --merges); default: bytes.")
+    parser.add_argument("--merges", type=Path, default=None)
+    parser.add_argument("--special-tokens", nargs="*", default=["<|endoftext|>"])
+    parser.add_argument("--context-length", type=int, default=256)
+    parser.add_argument("--d-model", type=int, default=512)
+    parser.add_argument("--num-layers", type=int, default=4)
+    parser.add_argument("--num-heads", type=int, default=16)
+    parser.add_argument("--d-ff", type=int, default=1344)
+    parser.add_argument("--max-batch-sizes", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--num-requests", type=int, default=48)
+    parser.add_argument("--rate", type=float, default=4.0, help="Mean request arrivals per second.")
+    parser.add_argument("--prompt-words", type=int, nargs=2, default=(4, 32), help="Min and max prompt length.")
+    parser.add_argument("--max-new-tokens", type=int, nargs=2, default=(16, 64), help="Min and max completion length.")
+    parser.add_argument("--temperature", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None, help="Append one JSON line per batch size here.")
+    return parser.parse_args()
+
+
+def load_tokenizer(args: argparse.Namespace) -> Tokenizer:
+    if args.vocab is not None:
+        return Tokenizer.from_files(str(args.vocab), str(args.merges), args.special_tokens)
+    return Tokenizer({i: bytes([i]) for i in range(256)}, [])
+
+
+def load_model(args: argparse.Namespace, vocab_size: int) -> TransformerLM:
+    torch.manual_seed(args.seed)
+    model = TransformerLM(
+        vocab_size, args.context_length, args.d_model, args.num_layers, args.num_heads, args.d_ff, 10000.0
+    )
+    if args.checkpoint is not None:
+        model.load_state_dict(read_checkpoint(args.checkpoint)["model"])
+    return model.eval()
+
+
+def make_workload(args: argparse.Namespace) -> list[tuple[float, str, int]]:
+    """(arrival time, prompt, max_new_tokens) per request, with exponential inter-arrival times."""
+    rng = random.Random(args.seed)
+    arrival = 0.0
+    workload = []
+    for _ in range(args.num_requests):
+        arrival += rng.expovariate(args.rate)
+        prompt = " ".join(rng.choices(WORDS, k=rng.randint(*args.prompt_words)))
+        workload.append((arrival, prompt, rng.randint(*args.max_new_tokens)))
+    return workload
+
+
+async def client(
+    server: GenerationServer, start: float, arrival: float, prompt: str, max_new_tokens: int, args: argparse.Namespace
+) -> dict:
+    await asyncio.sleep(max(0.0, start + arrival - time.perf_counter()))
+    submitted = time.perf_counter()
+    first_token = None
+    num_tokens = 0
+    prompt_ids = server.tokenizer.encode(prompt)
+    async for _ in server.stream_ids(prompt_ids, max_new_tokens, temperature=args.temperature):
+        if first_token is None:
+            first_token = time.perf_counter()
+        num_tokens += 1
+    done = time.perf_counter()
+    return {"ttft": first_token - submitted, "latency": done - submitted, "num_tokens": num_tokens}
+
+
+async def run_load(model: TransformerLM, tokenizer: Tokenizer, max_batch_size: int, args: argparse.Namespace) -> dict:
+    workload = make_workload(args)
+    generator = torch.Generator().manual_seed(args.seed)
+    async with GenerationServer(model, tokenizer, max_batch_size=max_batch_size, generator=generator) as server:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(client(server, start, *request, args) for request in workload))
+        elapsed = time.perf_counter() - start
+    latency = np.array([r["latency"] for r in results])
+    ttft = np.array([r["ttft"] for r in results])
+    num_tokens = sum(r["num_tokens"] for r in results)
+    return {
+        "max_batch_size": max_batch_size,
+        "num_requests": len(results),
+        "rate": args.rate,
+        "tokens_per_second": num_tokens / elapsed,
+        "mean_batch_size": server.stats.mean_batch_size,
+        **{f"latency_p{q}": float(np.percentile(latency, q)) for q in (50, 90, 99)},
+        **{f"ttft_p{q}": float(np.percentile(ttft, q)) for q in (50, 90, 99)},
+    }
+
+
+def main() -> None:
+    args = parse_args()
+    tokenizer = load_tokenizer(args)
+    model = load_model(args, len(tokenizer.vocab))
+
+    print(
+        f"{'batch':>6} {'tok/s':>8} {'mean batch':>11} {'p50 s':>7} {'p90 s':>7} {'p99 s':>7} "
+        f"{'ttft p50':>9} {'ttft p99':>9}"
+    )
+    for max_batch_size in args.max_batch_sizes:
+        result = asyncio.run(run_load(model, tokenizer, max_batch_size, args))
+        print(
+            f"{max_batch_size:>6} {result['tokens_per_second']:>8.1f} {result['mean_batch_size']:>11.2f} "
+            f"{result['latency_p50']:>7.2f} {result['latency_p90']:>7.2f} {result['latency_p99']:>7.2f} "
+            f"{result['ttft_p50']:>9.3f} {result['ttft_p99']:>9.3f}"
+        )
+        if args.output is not None:
+            with args.output.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from cs336_basics.benchmarking import run_script_metrics
+
+TRAIN_SCRIPT = Path(__file__).with_name("train_lm.py")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Parameters, peak memory, checkpoint size and step time of train_lm.py with tied vs untied embeddings."
+    )
+    parser.add_argument("--vocab-size", type=int, default=50257)
+    parser.add_argument("--context-length", type=int, default=128)
+    parser.add_argument("--d-model", type=int, default=256)
+    parser.add_argument("--num-layers", type=int, default=4)
+    parser.add_argument("--num-heads", type=int, default=8)
+    parser.add_argument("--d-ff", type=int, default=672)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--steps", type=int, default=6)
+    parser.add_argument("--output", type=Path, default=None, help="Append one JSON line per setting here.")
+    return parser.parse_args()
+
+
+def run_setting(args: argparse.Namespace, data_path: Path, tie_embeddings: bool) -> dict:
+    """Train for a few steps in a fresh process and return its config and last train record plus checkpoint size."""
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint_dir = Path(tmp) / "checkpoints"
+        arguments = [
+            f"--train-data={data_path}",
+            f"--vocab-size={args.vocab_size}",
+            f"--context-length={args.context_length}",
+            f"--d-model={args.d_model}",
+            f"--num-layers={args.num_layers}",
+            f"--num-heads={args.num_heads}",
+            f"--d-ff={args.d_ff}",
+            f"--batch-size={args.batch_size}",
+            f"--max-steps={args.steps}",
+            # One warmup step, then one record covering the remaining steps.
+            f"--log-interval={max(args.steps - 1, 1)}",
+            "--warmup-steps=0",
+            f"--checkpoint-dir={checkpoint_dir}",
+            f"--checkpoint-interval={args.steps}",
+            *(["--tie-embeddings"] if tie_embeddings else []),
+        ]
+        records = run_script_metrics(TRAIN_SCRIPT, arguments)
+        checkpoint_bytes = sum(path.stat().st_size for path in checkpoint_dir.iterdir())
+    config = next(record for record in records if record["event"] == "config")
+    train = [record for record in records if record["event"] == "train"][-1]
+    return {"num_params": config["num_params"], "checkpoint_bytes": checkpoint_bytes, **train}
+
+
+def main() -> None:
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        data_path = Path(tmp) / "tokens.npy"
+        np.save(data_path, np.random.default_rng(0).integers(0, args.vocab_size, 1 << 20, dtype=np.uint16))
+
+        print(f"{'tied':>5} {'params M':>9} {'ckpt MiB':>9} {'peak MiB':>9} {'step s':>7} {'opt s':>7}")
+        for tie_embeddings in (False, True):
+            record = run_setting(args, data_path, tie_embeddings)
+            print(
+                f"{'yes' if tie_embeddings else 'no':>5} {record['num_params'] / 1e6:>9.2f} "
+                f"{record['checkpoint_bytes'] / 2**20:>9.1f} {record['peak_rss_mib']:>9.0f} "
+                f"{record['step_seconds']:>7.3f} {record['optimizer_seconds']:>7.3f}"
+            )
+            if args.output is not None:
+                with args.output.open("a", encoding="utf-8") as f:
+                    f.write(json.dumps({"tie_embeddings": tie_embeddings, **record}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import time
+from collections.abc import Callable, Iterable, Iterator
+from pathlib import Path
+
+import numpy as np
+
+from cs336_basics.benchmarking import git_revision
+from cs336_basics.tokenizer import Tokenizer
+
+FIXTURES = Path(__file__).resolve().parent.parent / "tests" / "fixtures"
+FIXTURE_FILES = ("tinystories_sample.txt", "corpus.en", "german.txt", "address.txt")
+SPECIAL_TOKEN = "<|endoftext|>"
+# Documents without an explicit separator are cut into pieces of about this many bytes, at line ends.
+DOCUMENT_BYTES = 1024
+# (first, last) code points of the scripts in the multilingual text; CJK is written without spaces.
+SCRIPTS = {
+    "latin": (0x00E0, 0x00FF),
+    "cyrillic": (0x0430, 0x044F),
+    "greek": (0x03B1, 0x03C9),
+    "arabic": (0x0627, 0x064A),
+    "devanagari": (0x0915, 0x0939),
+    "cjk": (0x4E00, 0x4FFF),
+    "emoji": (0x1F600, 0x1F64F),
+}
+CODE_NAMES = ["x", "y", "i", "n", "data", "result", "value", "items", "config", "model", "tokens", "batch", "path"]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Throughput, per-document latency and cache hit rate of Tokenizer next to tiktoken's gpt2."
+    )
+    parser.add_argument("--vocab", type=Path, default=FIXTURES / "gpt2_vocab.json")
+    parser.add_argument("--merges", type=Path, default=FIXTURES / "gpt2_merges.txt")
+    parser.add_argument("--inputs", type=Path, nargs="*", default=[FIXTURES / name for name in FIXTURE_FILES])
+    parser.add_argument("--synthetic-kib", type=int, default=32, help="Size of each synthetic text; 0 skips them.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None, help="Append one JSON line per input and tokenizer.")
+    return parser.parse_args()
+
+
+def zipf_choices(rng: random.Random, words: list[str], k: int) -> list[str]:
+    return rng.choices(words, weights=[1.0 / rank for rank in range(1, len(words) + 1)], k=k)
+
+
+def multilingual_text(num_bytes: int, rng: random.Random) -> str:
+    lexicons = {
+        script: ["".join(chr(rng.randint(low, high)) for _ in range(rng.randint(1, 8))) for _ in range(500)]
+        for script, (low, high) in SCRIPTS.items()
+    }
+    lines, size = [], 0
+    while size < num_bytes:
+        script = rng.choice(list(SCRIPTS))
+        separator = "" if script == "cjk" else " "
+        line = separator.join(zipf_choices(rng, lexicons[script], rng.randint(5, 20))) + rng.choice(".。!?") + "\n"
+        lines.append(line)
+        size += len(line.encode("utf-8"))
+    return "".join(lines)
+
+
+def code_text(num_bytes: int, rng: random.Random) -> str:
+    templates = [
+        "{a} = {b}({c}, {n})",
+        "for {a} in range(len({b})):",
+        "if {a} is not None and {b} > {n}:",
+        "return {a}[{c}:{n}] + {b}",
+        "{a}.{b}({c}={n}, {a}_{b}='{c}')",
+        "# TODO: {a} the {b} before {c}",
+        "def {a}_{b}({c}: int = {n}) -> list[int]:",
+    ]
+    lines, size, depth = [], 0, 0
+    while size < num_bytes:
+        a, b, c = (rng.choice(CODE_NAMES) for _ in range(3))
+        line = "    " * depth + rng.choice(templates).format(a=a, b=b, c=c, n=rng.randint(0, 4096)) + "\n"
+        depth = min(depth + 1, 4) if line.rstrip().endswith(":") else rng.randint(0, depth)
+        lines.append(line)
+        size += len(line.encode("utf-8"))
+    return "".join(lines)
+
+
+def whitespace_text(num_bytes: int, rng: random.Random) -> str:
+    words = ["the", "a", "cat", "sat", "on", "mat", "and", "then", "it", "ran", "away"]
+    runs = [" ", "  ", "    ", "\t", "\t\t", " \t ", "\n", "\n\n", "\n\n\n", "   \n"]
+    parts, size = [], 0
+    while size < num_bytes:
+        part = rng.choice(words) + rng.choice(runs)
+        parts.append(part)
+        size += len(part)
+    return "".join(parts)
+
+
+def split_documents(text: str) -> list[str]:
+    """Documents end with a special token, or at the first line end past DOCUMENT_BYTES."""
+    documents = []
+    pieces = text.split(SPECIAL_TOKEN)
+    for i, piece in enumerate(pieces):
+        current, size = [], 0
+        for line in piece.splitlines(keepends=True):
+            current.append(line)
+            size += len(line.encode("utf-8"))
+            if size >= DOCUMENT_BYTES:
+                documents.append("".join(current))
+                current, size = [], 0
+        if i < len(pieces) - 1:
+            current.append(SPECIAL_TOKEN)
+        if current:
+            documents.append("".join(current))
+    return documents
+
+
+def measure(
+    documents: list[str],
+    encode: Callable[[str], list[int]],
+    encode_iterable: Callable[[Iterable[str]], Iterator[int]],
+    decode: Callable[[list[int]], str],
+    clear_cache: Callable[[], None],
+    cache_hit_rate: Callable[[], float | None],
+) -> tuple[dict, list[list[int]]]:
+    """Encode, encode_iterable (over lines) and decode rates for one tokenizer.
+
+    The encode rate and p50/p99 latency are cold: the cache is cleared before
+    every document, outside the timed call. The warm encode rate and the cache
+    hit rate come from a second pass that encodes the documents in order
+    behind a single clear, as a long-running tokenizer would.
+    """
+    num_bytes = sum(len(document.encode("utf-8")) for document in documents)
+
+    latencies, encoded = [], []
+    for document in documents:
+        clear_cache()
+        start = time.perf_counter()
+        encoded.append(encode(document))
+        latencies.append(time.perf_counter() - start)
+    encode_seconds = sum(latencies)
+    num_tokens = sum(len(ids) for ids in encoded)
+
+    clear_cache()
+    start = time.perf_counter()
+    for document in documents:
+        encode(document)
+    warm_encode_seconds = time.perf_counter() - start
+    hit_rate = cache_hit_rate()
+
+    clear_cache()
+    lines = "".join(documents).splitlines(keepends=True)
+    start = time.perf_counter()
+    streamed = sum(1 for _ in encode_iterable(lines))
+    iterable_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for ids in encoded:
+        decode(ids)
+    decode_seconds = time.perf_counter() - start
+
+    return {
+        "num_documents": len(documents),
+        "num_bytes": num_bytes,
+        "num_tokens": num_tokens,
+        "encode_bytes_per_second": num_bytes / encode_seconds,
+        "encode_tokens_per_second": num_tokens / encode_seconds,
+        "encode_p50_ms": float(np.percentile(latencies, 50)) * 1000,
+        "encode_p99_ms": float(np.percentile(latencies, 99)) * 1000,
+        "warm_encode_bytes_per_second": num_bytes / warm_encode_seconds,
+        "cache_hit_rate": hit_rate,
+        "encode_iterable_bytes_per_second": num_bytes / iterable_seconds,
+        "encode_iterable_tokens_per_second": streamed / iterable_seconds,
+        "decode_bytes_per_second": num_bytes / decode_seconds,
+        "decode_tokens_per_second": num_tokens / decode_seconds,
+    }, encoded
+
+
+def measure_ours(tokenizer: Tokenizer, documents: list[str]) -> tuple[dict, list[list[int]]]:
+    return measure(
+        documents,
+        tokenizer.encode,
+        tokenizer.encode_iterable,
+        tokenizer.decode,
+        tokenizer.clear_cache,
+        lambda: tokenizer.cache_hit_rate,
+    )
+
+
+def measure_tiktoken(encoding, documents: list[str]) -> tuple[dict, list[list[int]]]:
+    def encode(text: str) -> list[int]:
+        return encoding.encode(text, allowed_special={SPECIAL_TOKEN})
+
+    def encode_iterable(lines: Iterable[str]) -> Iterator[int]:
+        # tiktoken has no streaming encoder; encoding line by line is the closest equivalent.
+        for line in lines:
+            yield from encode(line)
+
+    return measure(documents, encode, encode_iterable, encoding.decode, lambda: None, lambda: None)
+
+
+def load_tiktoken():
+    # Not installed, or the encoding files cannot be downloaded (requests' errors are OSErrors).
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("gpt2")
+    except (ImportError, OSError, ValueError) as error:
+        print(f"tiktoken unavailable ({type(error).__name__}: {error}); reporting Tokenizer only\n")
+        return None
+
+
+def main() -> None:
+    args = parse_args()
+    revision = git_revision(Path(__file__).parent)
+    tokenizer = Tokenizer.from_files(str(args.vocab), str(args.merges), [SPECIAL_TOKEN])
+    reference = load_tiktoken()
+
+    texts = {path.name: path.read_text(encoding="utf-8") for path in args.inputs}
+    if args.synthetic_kib > 0:
+        rng = random.Random(args.seed)
+        num_bytes = args.synthetic_kib * 1024
+        texts["synthetic-multilingual"] = multilingual_text(num_bytes, rng)
+        texts["synthetic-code"] = code_text(num_bytes, rng)
+        texts["synthetic-whitespace"] = whitespace_text(num_bytes, rng)
+
+    print(
+        f"{'input':>24} {'tokenizer':>9} {'enc KB/s':>9} {'enc tok/s':>10} {'p50 ms':>8} {'p99 ms':>8} "
+        f"{'warm KB/s':>10} {'hit %':>6} {'iter KB/s':>10} {'dec KB/s':>9} {'same ids':>9}"
+    )
+    for name, text in texts.items():
+        documents = split_documents(text)
+        runs = {"ours": measure_ours(tokenizer, documents)}
+        if reference is not None:
+            runs["tiktoken"] = measure_tiktoken(reference, documents)
+        for tokenizer_name, (result, encoded) in runs.items():
+            result = {"revision": revision, "input": name, "tokenizer": tokenizer_name, **result}
+            if reference is not None:
+                result["matches_tiktoken"] = encoded == runs["tiktoken"][1]
+            hit_rate = result["cache_hit_rate"]
+            print(
+                f"{name:>24} {tokenizer_name:>9} {result['encode_bytes_per_second'] / 1e3:>9.1f} "
+                f"{result['encode_tokens_per_second']:>10.0f} {result['encode_p50_ms']:>8.2f} "
+                f"{result['encode_p99_ms']:>8.2f} {result['warm_encode_bytes_per_second'] / 1e3:>10.1f} "
+                f"{'-' if hit_rate is None else f'{100 * hit_rate:.1f}':>6} "
+                f"{result['encode_iterable_bytes_per_second'] / 1e3:>10.1f} "
+                f"{result['decode_bytes_per_second'] / 1e3:>9.1f} {result.get('matches_tiktoken', '-')!s:>9}"
+            )
+            if args.output is not None:
+                with args.output.open("a", encoding="utf-8") as f:
+                    f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
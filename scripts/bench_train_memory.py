@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from cs336_basics.benchmarking import run_script_metrics
+
+TRAIN_SCRIPT = Path(__file__).with_name("train_lm.py")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Peak memory and throughput of train_lm.py across gradient accumulation / activation checkpointing."
+    )
+    parser.add_argument("--grad-accum-steps", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--vocab-size", type=int, default=10000)
+    parser.add_argument("--context-length", type=int, default=256)
+    parser.add_argument("--d-model", type=int, default=256)
+    parser.add_argument("--num-layers", type=int, default=4)
+    parser.add_argument("--num-heads", type=int, default=8)
+    parser.add_argument("--d-ff", type=int, default=672)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument("--output", type=Path, default=None, help="Append one JSON line per setting here.")
+    return parser.parse_args()
+
+
+def run_setting(args: argparse.Namespace, data_path: Path, grad_accum_steps: int, checkpointing: bool) -> dict:
+    """Train for a few steps in a fresh process (so its peak RSS is its own) and return the last train record."""
+    arguments = [
+        f"--train-data={data_path}",
+        f"--vocab-size={args.vocab_size}",
+        f"--context-length={args.context_length}",
+        f"--d-model={args.d_model}",
+        f"--num-layers={args.num_layers}",
+        f"--num-heads={args.num_heads}",
+        f"--d-ff={args.d_ff}",
+        f"--batch-size={args.batch_size}",
+        f"--grad-accum-steps={grad_accum_steps}",
+        f"--max-steps={args.steps}",
+        # One warmup step, then one record covering the remaining steps.
+        f"--log-interval={max(args.steps - 1, 1)}",
+        "--warmup-steps=0",
+        *(["--activation-checkpointing"] if checkpointing else []),
+    ]
+    records = run_script_metrics(TRAIN_SCRIPT, arguments)
+    return [record for record in records if record["event"] == "train"][-1]
+
+
+def main() -> None:
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        data_path = Path(tmp) / "tokens.npy"
+        np.save(data_path, np.random.default_rng(0).integers(0, args.vocab_size, 1 << 20, dtype=np.uint16))
+
+        print(
+            f"{'accum':>6} {'ckpt':>5} {'peak MiB':>9} {'tok/s':>8} {'fwd s':>7} {'head s':>7} {'bwd s':>7} "
+            f"{'opt s':>7}"
+        )
+        for grad_accum_steps in args.grad_accum_steps:
+            for checkpointing in (False, True):
+                record = run_setting(args, data_path, grad_accum_steps, checkpointing)
+                print(
+                    f"{grad_accum_steps:>6} {'on' if checkpointing else 'off':>5} {record['peak_rss_mib']:>9.0f} "
+                    f"{record['tokens_per_second']:>8.0f} {record['forward_seconds']:>7.3f} "
+                    f"{record['lm_head_seconds']:>7.3f} {record['backward_seconds']:>7.3f} "
+                    f"{record['optimizer_seconds']:>7.3f}"
+                )
+                if args.output is not None:
+                    result = {"grad_accum_steps": grad_accum_steps, "activation_checkpointing": checkpointing, **record}
+                    with args.output.open("a", encoding="utf-8") as f:
+                        f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
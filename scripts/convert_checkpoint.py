@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+
+from cs336_basics.checkpointing import CHECKPOINT_FORMATS, read_checkpoint, write_checkpoint
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Convert a checkpoint between torch.save and the memory-mappable tensor archive format."
+    )
+    parser.add_argument("input_path", type=Path, help="Checkpoint to read (either format is detected).")
+    parser.add_argument("output_path", type=Path, help="Where to write the converted checkpoint.")
+    parser.add_argument("--format", choices=CHECKPOINT_FORMATS, default="mmap", help="Output format.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    write_checkpoint(read_checkpoint(args.input_path), args.output_path, args.format)
+    print(f"Wrote {args.format} checkpoint to {args.output_path} ({args.output_path.stat().st_size / 2**20:.1f} MiB)")
+
+
+if __name__ == "__main__":
+    main()
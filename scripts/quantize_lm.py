@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import statistics
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from cs336_basics.benchmarking import time_call
+from cs336_basics.checkpointing import CHECKPOINT_FORMATS, read_checkpoint, write_checkpoint
+from cs336_basics.data import get_batch, load_tokens
+from cs336_basics.generation import generate
+from cs336_basics.model import TransformerLM
+from cs336_basics.nn_utils import cross_entropy
+from cs336_basics.quantization import QUANTIZED_BACKENDS, int8_gemm_available, quantize_model_
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Quantize a trained TransformerLM's Linear weights to per-channel int8 and compare "
+        "validation perplexity and CPU inference speed against fp32."
+    )
+    parser.add_argument("--checkpoint", type=Path, required=True, help="A train_lm.py checkpoint.")
+    parser.add_argument("--val-data", type=Path, required=True, help="Held-out token IDs (e.g. TinyStories valid).")
+    parser.add_argument("--data-dtype", default="uint16", help="dtype of raw (non-.npy) token files.")
+    parser.add_argument("--vocab-size", type=int, default=10000)
+    parser.add_argument("--context-length", type=int, default=256)
+    parser.add_argument("--d-model", type=int, default=512)
+    parser.add_argument("--num-layers", type=int, default=4)
+    parser.add_argument("--num-heads", type=int, default=16)
+    parser.add_argument("--d-ff", type=int, default=1344)
+    parser.add_argument("--rope-theta", type=float, default=10000.0)
+    parser.add_argument("--tie-embeddings", action="store_true")
+    parser.add_argument("--backends", nargs="+", choices=QUANTIZED_BACKENDS, default=None)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--eval-batches", type=int, default=20)
+    parser.add_argument("--decode-tokens", type=int, default=128, help="Tokens generated for the decode timing.")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", type=Path, default=None, help="Write the quantized model's state dict here.")
+    parser.add_argument("--save-format", choices=CHECKPOINT_FORMATS, default="torch")
+    parser.add_argument("--output", type=Path, default=None, help="Append one JSON line per variant here.")
+    return parser.parse_args()
+
+
+def load_model(args: argparse.Namespace, state_dict: dict) -> TransformerLM:
+    model = TransformerLM(
+        args.vocab_size,
+        args.context_length,
+        args.d_model,
+        args.num_layers,
+        args.num_heads,
+        args.d_ff,
+        args.rope_theta,
+        tie_embeddings=args.tie_embeddings,
+    )
+    model.load_state_dict(state_dict)
+    return model.eval()
+
+
+def model_bytes(model: TransformerLM) -> int:
+    tensors = {id(t): t for t in [*model.parameters(), *model.buffers()]}.values()
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+@torch.no_grad()
+def perplexity(model: TransformerLM, batches: list[tuple[torch.Tensor, torch.Tensor]]) -> float:
+    # Through forward() rather than model.loss(), so a quantized LM head runs its own kernel.
+    losses = [cross_entropy(model(inputs), targets).item() for inputs, targets in batches]
+    return math.exp(statistics.fmean(losses))
+
+
+def measure(model: TransformerLM, batches: list[tuple[torch.Tensor, torch.Tensor]], args: argparse.Namespace) -> dict:
+    inputs = batches[0][0]
+    with torch.no_grad():
+        forward_seconds = statistics.median(time_call(lambda: model(inputs), repeats=args.repeats))
+    prompt = inputs[0, : args.context_length // 4].tolist()
+    decode = [
+        generate(model, prompt, args.decode_tokens, temperature=0.0).tokens_per_second for _ in range(args.repeats)
+    ]
+    return {
+        "perplexity": perplexity(model, batches),
+        "forward_ms": forward_seconds * 1000,
+        "decode_tokens_per_second": statistics.median(decode),
+        "model_bytes": model_bytes(model),
+    }
+
+
+def main() -> None:
+    args = parse_args()
+    torch.manual_seed(args.seed)
+    state_dict = read_checkpoint(args.checkpoint)["model"]
+    dataset = load_tokens(args.val_data, args.data_dtype)
+    generator = np.random.default_rng(args.seed)
+    batches = [
+        get_batch(dataset, args.batch_size, args.context_length, "cpu", generator) for _ in range(args.eval_batches)
+    ]
+    backends = args.backends
+    if backends is None:
+        backends = [backend for backend in QUANTIZED_BACKENDS if backend != "int8_gemm" or int8_gemm_available()]
+
+    variants = {"fp32": load_model(args, state_dict)}
+    for backend in backends:
+        variants[f"int8-{backend}"] = quantize_model_(load_model(args, state_dict), backend)
+
+    reference = None
+    print(
+        f"{'variant':>15} {'ppl':>9} {'delta ppl':>10} {'fwd ms':>8} {'speedup':>8} {'decode tok/s':>13} "
+        f"{'speedup':>8} {'MiB':>7}"
+    )
+    for name, model in variants.items():
+        result = {"variant": name, **measure(model, batches, args)}
+        reference = reference or result
+        result["perplexity_delta"] = result["perplexity"] - reference["perplexity"]
+        result["forward_speedup"] = reference["forward_ms"] / result["forward_ms"]
+        result["decode_speedup"] = result["decode_tokens_per_second"] / reference["decode_tokens_per_second"]
+        print(
+            f"{name:>15} {result['perplexity']:>9.3f} {result['perplexity_delta']:>+10.3f} "
+            f"{result['forward_ms']:>8.1f} {result['forward_speedup']:>8.2f} "
+            f"{result['decode_tokens_per_second']:>13.1f} {result['decode_speedup']:>8.2f} "
+            f"{result['model_bytes'] / 2**20:>7.1f}"
+        )
+        if args.output is not None:
+            with args.output.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(result) + "\n")
+
+    if args.save is not None:
+        model = variants[f"int8-{backends[0]}"]
+        write_checkpoint({"model": model.state_dict(), "quantization": backends[0]}, args.save, args.save_format)
+
+
+if __name__ == "__main__":
+    main()
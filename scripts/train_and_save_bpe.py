@@ -3,10 +3,12 @@ from __future__ import annotations
 import argparse
 import json
 import os
+import time
 from pathlib import Path
 
-from cs336_basics.bpe import my_run_train_bpe
+from cs336_basics.bpe import merge_overlap, my_run_train_bpe
 from cs336_basics.gpt2_utils import bytes_to_gpt2_text
+from cs336_basics.tokenizer import Tokenizer
 
 
 def parse_args() -> argparse.Namespace:
@@ -27,19 +29,95 @@ def parse_args() -> argparse.Namespace:
         default=min(8, os.cpu_count() or 1),
         help="Number of processes for chunk pre-tokenization.",
     )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        default=None,
+        help="Append the trainer's profile events (phase timings, merge-loop snapshots) here as JSONL.",
+    )
+    parser.add_argument("--profile-interval", type=int, default=100, help="Merges between merge-loop snapshots.")
+    parser.add_argument("--progress", action="store_true", help="Show a progress bar over the merges.")
+    parser.add_argument(
+        "--sample-rate",
+        type=float,
+        default=1.0,
+        help="Pre-tokenize only this fraction of the corpus chunks and extrapolate the counts, for quick exploration.",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the --sample-rate chunk sample.")
+    parser.add_argument(
+        "--compare-to",
+        type=Path,
+        default=None,
+        help="Output directory of an earlier full run; report how closely this run's merges overlap with its merges.",
+    )
+    parser.add_argument(
+        "--compare-full",
+        action="store_true",
+        help="With --sample-rate below 1, also train on the full corpus and report the merge overlap.",
+    )
+    parser.add_argument("--min-count", type=int, default=1, help="Drop pre-tokens seen fewer times than this.")
+    parser.add_argument(
+        "--max-pre-tokens",
+        type=int,
+        default=None,
+        help="Keep at most this many unique pre-tokens (bounded counter), to cap the trainer's memory.",
+    )
+    parser.add_argument(
+        "--extend-from",
+        type=Path,
+        default=None,
+        help="Directory with the vocab.json and merges.txt of an existing tokenizer (e.g. GPT-2) to add merges to, "
+        "keeping its token IDs; --vocab-size is then the size after extension.",
+    )
     return parser.parse_args()
 
 
+def print_overlap(merges: list[tuple[bytes, bytes]], reference_merges: list[tuple[bytes, bytes]], label: str) -> None:
+    overlap = merge_overlap(merges, reference_merges)
+    print(
+        f"Merge overlap with {label}: common prefix {overlap.pop('common_prefix')}/{len(reference_merges)}, "
+        + ", ".join(f"{key}={value:.3f}" for key, value in overlap.items())
+    )
+
+
 def main() -> None:
     args = parse_args()
     special_tokens = args.special_tokens or ["<|endoftext|>"]
 
-    vocab, merges = my_run_train_bpe(
-        input_path=args.input_path,
-        vocab_size=args.vocab_size,
-        special_tokens=special_tokens,
-        kwargs={"num_processes": args.num_processes},
-    )
+    phase_seconds: dict[str, float] = {}
+    kwargs = {
+        "num_processes": args.num_processes,
+        "phase_seconds": phase_seconds,
+        "progress": args.progress,
+        "sample_rate": args.sample_rate,
+        "seed": args.seed,
+        "min_count": args.min_count,
+        "max_pre_tokens": args.max_pre_tokens,
+        "profile_interval": args.profile_interval,
+    }
+    if args.extend_from is not None:
+        base = Tokenizer.from_files(str(args.extend_from / "vocab.json"), str(args.extend_from / "merges.txt"))
+        kwargs["initial_vocab"], kwargs["initial_merges"] = base.vocab, base.merges
+    pruning: dict = {}
+    profile_file = args.profile.open("a", encoding="utf-8") if args.profile is not None else None
+
+    def profile(event: dict) -> None:
+        if event["event"] == "pruning":
+            pruning.update(event)
+        if profile_file is not None:
+            profile_file.write(json.dumps(event) + "\n")
+
+    kwargs["profile"] = profile
+    try:
+        vocab, merges = my_run_train_bpe(
+            input_path=args.input_path,
+            vocab_size=args.vocab_size,
+            special_tokens=special_tokens,
+            kwargs=kwargs,
+        )
+    finally:
+        if profile_file is not None:
+            profile_file.close()
 
     args.output_dir.mkdir(parents=True, exist_ok=True)
     vocab_path = args.output_dir / "vocab.json"
@@ -57,6 +135,29 @@ def main() -> None:
     print(f"Saved merges: {merges_path}")
     print(f"Vocab size: {len(vocab)}")
     print(f"Num merges: {len(merges)}")
+    print("Phase seconds: " + ", ".join(f"{phase}={seconds:.2f}" for phase, seconds in phase_seconds.items()))
+    if pruning:
+        guaranteed = pruning["guaranteed_merges"]
+        print(
+            f"Pruning: kept {pruning['num_pre_tokens']} pre-tokens, pair counts low by at most "
+            f"{pruning['pair_count_error_bound']}, "
+            + ("no merges guaranteed (sampled)" if guaranteed is None else f"first {guaranteed} merges exact")
+        )
+
+    if args.compare_to is not None:
+        reference = Tokenizer.from_files(str(args.compare_to / "vocab.json"), str(args.compare_to / "merges.txt"))
+        print_overlap(merges, reference.merges, str(args.compare_to))
+    if args.compare_full and args.sample_rate < 1.0:
+        start = time.perf_counter()
+        _, full_merges = my_run_train_bpe(
+            input_path=args.input_path,
+            vocab_size=args.vocab_size,
+            special_tokens=special_tokens,
+            kwargs={"num_processes": args.num_processes, "progress": args.progress},
+        )
+        full_seconds = time.perf_counter() - start
+        print(f"Full run: {full_seconds:.2f}s vs sampled {sum(phase_seconds.values()):.2f}s")
+        print_overlap(merges, full_merges, "the full run")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import psutil
+import torch
+
+from cs336_basics.benchmarking import peak_rss_bytes
+from cs336_basics.checkpointing import CHECKPOINT_FORMATS, CheckpointManager, load_checkpoint
+from cs336_basics.data import get_batch, load_tokens, skip_batches
+from cs336_basics.model import ATTENTION_IMPLS, BLOCK_IMPLS, TransformerLM
+from cs336_basics.nn_utils import clip_gradients
+from cs336_basics.optimizer import STATE_MODES, AdamW, get_lr_cosine_schedule
+
+# Per-step phases whose wall-clock time is reported. "forward" runs the blocks; "lm_head" is the fused
+# final norm, LM head and loss, which also computes their gradients, so it holds the LM head's backward
+# GEMMs too; "backward" is the rest of the backward pass, through the blocks.
+PHASES = ("data", "forward", "lm_head", "backward", "optimizer")
+# "fp32": fp32 everywhere. "bf16-autocast": fp32 parameters, forward under bf16 autocast.
+# "bf16": bf16 parameters with fp32 master weights in AdamW, forward under bf16 autocast.
+PRECISIONS = ("fp32", "bf16-autocast", "bf16")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Train a Transformer LM on pre-tokenized data and log JSONL metrics.")
+    parser.add_argument("--train-data", type=Path, required=True, help="Token IDs: a .npy file or raw --data-dtype.")
+    parser.add_argument("--val-data", type=Path, default=None, help="Held-out token IDs for eval loss.")
+    parser.add_argument("--data-dtype", default="uint16", help="dtype of raw (non-.npy) token files.")
+    parser.add_argument("--vocab-size", type=int, default=10000)
+    parser.add_argument("--context-length", type=int, default=256)
+    parser.add_argument("--d-model", type=int, default=512)
+    parser.add_argument("--num-layers", type=int, default=4)
+    parser.add_argument("--num-heads", type=int, default=16)
+    parser.add_argument("--d-ff", type=int, default=1344)
+    parser.add_argument("--rope-theta", type=float, default=10000.0)
+    parser.add_argument("--attention-impl", choices=ATTENTION_IMPLS, default="dense")
+    parser.add_argument("--block-impl", choices=BLOCK_IMPLS, default="eager")
+    parser.add_argument(
+        "--tie-embeddings", action="store_true", help="Share one matrix between the token embedding and the LM head."
+    )
+    parser.add_argument("--batch-size", type=int, default=32, help="Sequences per optimizer step.")
+    parser.add_argument(
+        "--grad-accum-steps",
+        type=int,
+        default=1,
+        help="Split each batch into this many micro-batches and accumulate their gradients.",
+    )
+    parser.add_argument(
+        "--activation-checkpointing",
+        action="store_true",
+        help="Recompute each transformer block's forward during backward instead of storing its activations.",
+    )
+    parser.add_argument("--max-steps", type=int, default=5000)
+    parser.add_argument("--lr-max", type=float, default=1e-3)
+    parser.add_argument("--lr-min", type=float, default=1e-4)
+    parser.add_argument("--warmup-steps", type=int, default=100)
+    parser.add_argument("--cosine-steps", type=int, default=None, help="End of the cosine decay (default: max steps).")
+    parser.add_argument("--weight-decay", type=float, default=0.1)
+    parser.add_argument("--betas", type=float, nargs=2, default=(0.9, 0.95))
+    parser.add_argument("--state-mode", choices=STATE_MODES, default="fp32", help="AdamW moment storage.")
+    parser.add_argument("--precision", choices=PRECISIONS, default="fp32", help="Parameter and compute precision.")
+    parser.add_argument("--grad-clip", type=float, default=1.0, help="Max global gradient L2 norm; 0 disables.")
+    parser.add_argument("--log-interval", type=int, default=10)
+    parser.add_argument("--eval-interval", type=int, default=500)
+    parser.add_argument("--eval-batches", type=int, default=20)
+    parser.add_argument("--checkpoint-dir", type=Path, default=None)
+    parser.add_argument("--checkpoint-interval", type=int, default=1000)
+    parser.add_argument("--keep-checkpoints", type=int, default=3)
+    parser.add_argument("--checkpoint-format", choices=CHECKPOINT_FORMATS, default="torch")
+    parser.add_argument("--resume", type=Path, default=None, help="Checkpoint to resume from.")
+    parser.add_argument("--metrics", type=Path, default=None, help="Append JSONL metric records here.")
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.grad_accum_steps < 1 or args.batch_size % args.grad_accum_steps:
+        parser.error("--batch-size must be a positive multiple of --grad-accum-steps")
+    return args
+
+
+class MetricsLogger:
+    """Prints a short line per record and appends every record to a JSONL file."""
+
+    def __init__(self, path: Path | None) -> None:
+        self.file = path.open("a", encoding="utf-8") if path is not None else None
+
+    def log(self, record: dict) -> None:
+        if self.file is not None:
+            self.file.write(json.dumps(record) + "\n")
+            self.file.flush()
+        summary = " ".join(
+            f"{key}={value:.4g}" if isinstance(value, float) else f"{key}={value}" for key, value in record.items()
+        )
+        print(summary, flush=True)
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+
+
+def synchronize(device: torch.device) -> None:
+    """Wait for queued device work so that wall-clock phase timings are attributed correctly."""
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+@contextmanager
+def timed(phase_seconds: dict[str, float], phase: str, device: torch.device) -> Iterator[None]:
+    start = time.perf_counter()
+    yield
+    synchronize(device)
+    phase_seconds[phase] += time.perf_counter() - start
+
+
+def autocast(precision: str, device: torch.device) -> torch.autocast:
+    """The autocast region the forward pass runs in; a no-op for "fp32"."""
+    return torch.autocast(device.type, dtype=torch.bfloat16, enabled=precision != "fp32")
+
+
+@torch.no_grad()
+def evaluate(model: TransformerLM, dataset: np.ndarray, args: argparse.Namespace, device: torch.device) -> float:
+    model.eval()
+    # The same batches at every eval, so successive losses are directly comparable.
+    generator = np.random.default_rng(args.seed + 1)
+    losses = []
+    for _ in range(args.eval_batches):
+        inputs, targets = get_batch(dataset, args.batch_size, args.context_length, device, generator)
+        # Under no_grad, model.loss computes only the loss, with none of the LM-head gradient work.
+        with autocast(args.precision, device):
+            losses.append(model.loss(inputs, targets))
+    model.train()
+    return torch.stack(losses).mean().item()
+
+
+def main() -> None:
+    args = parse_args()
+    device = torch.device(args.device)
+    torch.manual_seed(args.seed)
+    generator = np.random.default_rng(args.seed)
+    train_data = load_tokens(args.train_data, args.data_dtype)
+    val_data = load_tokens(args.val_data, args.data_dtype) if args.val_data is not None else None
+    cosine_steps = args.cosine_steps if args.cosine_steps is not None else args.max_steps
+
+    model = TransformerLM(
+        args.vocab_size,
+        args.context_length,
+        args.d_model,
+        args.num_layers,
+        args.num_heads,
+        args.d_ff,
+        args.rope_theta,
+        attention_impl=args.attention_impl,
+        block_impl=args.block_impl,
+        activation_checkpointing=args.activation_checkpointing,
+        tie_embeddings=args.tie_embeddings,
+        device=device,
+        dtype=torch.bfloat16 if args.precision == "bf16" else torch.float32,
+    )
+    optimizer = AdamW(
+        model.parameters(),
+        lr=args.lr_max,
+        betas=tuple(args.betas),
+        weight_decay=args.weight_decay,
+        state_mode=args.state_mode,
+        master_weights=args.precision == "bf16",
+    )
+    start_step = load_checkpoint(args.resume, model, optimizer) if args.resume is not None else 0
+    micro_batch_size = args.batch_size // args.grad_accum_steps
+    # Continue with the batches an uninterrupted run would draw next, rather than replaying the first ones.
+    skip_batches(train_data, micro_batch_size, args.context_length, start_step * args.grad_accum_steps, generator)
+    checkpoints = (
+        CheckpointManager(args.checkpoint_dir, args.keep_checkpoints, args.checkpoint_format)
+        if args.checkpoint_dir is not None
+        else None
+    )
+
+    metrics = MetricsLogger(args.metrics)
+    process = psutil.Process()
+    num_params = sum(p.numel() for p in model.parameters())
+    config = {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()}
+    metrics.log({"event": "config", "num_params": num_params, "start_step": start_step, **config})
+
+    phase_seconds = dict.fromkeys(PHASES, 0.0)
+    loss_sum = torch.zeros((), device=device)
+    grad_norm = None
+    interval_steps = 0
+    interval_start = time.perf_counter()
+    for step in range(start_step, args.max_steps):
+        lr = get_lr_cosine_schedule(step, args.lr_max, args.lr_min, args.warmup_steps, cosine_steps)
+        for group in optimizer.param_groups:
+            group["lr"] = lr
+
+        # Keep .grad allocated: with the flat-buffer AdamW, backward then accumulates straight into its buffer.
+        optimizer.zero_grad(set_to_none=False)
+        for _ in range(args.grad_accum_steps):
+            with timed(phase_seconds, "data", device):
+                inputs, targets = get_batch(train_data, micro_batch_size, args.context_length, device, generator)
+            with timed(phase_seconds, "forward", device), autocast(args.precision, device):
+                hidden = model.hidden_states(inputs)
+            with timed(phase_seconds, "lm_head", device), autocast(args.precision, device):
+                loss = model.head_loss(hidden, targets) / args.grad_accum_steps
+            with timed(phase_seconds, "backward", device):
+                loss.backward()
+            loss_sum += loss.detach()
+        with timed(phase_seconds, "optimizer", device):
+            if args.grad_clip > 0:
+                grad_norm = clip_gradients(model.parameters(), args.grad_clip)
+            optimizer.step()
+        interval_steps += 1
+        completed = step + 1
+
+        if completed % args.log_interval == 0 or completed == args.max_steps:
+            elapsed = time.perf_counter() - interval_start
+            metrics.log(
+                {
+                    "event": "train",
+                    "step": completed,
+                    "loss": (loss_sum / interval_steps).item(),
+                    "lr": lr,
+                    "grad_norm": grad_norm.item() if grad_norm is not None else None,
+                    "tokens_per_second": interval_steps * args.batch_size * args.context_length / elapsed,
+                    "step_seconds": elapsed / interval_steps,
+                    **{f"{phase}_seconds": seconds / interval_steps for phase, seconds in phase_seconds.items()},
+                    "rss_mib": process.memory_info().rss / 2**20,
+                    # The kernel's high-water mark: sampling RSS between steps would miss the in-step activation peak.
+                    "peak_rss_mib": peak_rss_bytes() / 2**20,
+                }
+            )
+            phase_seconds = dict.fromkeys(PHASES, 0.0)
+            loss_sum.zero_()
+            interval_steps = 0
+            interval_start = time.perf_counter()
+
+        if val_data is not None and (completed % args.eval_interval == 0 or completed == args.max_steps):
+            eval_start = time.perf_counter()
+            val_loss = evaluate(model, val_data, args, device)
+            metrics.log(
+                {
+                    "event": "eval",
+                    "step": completed,
+                    "val_loss": val_loss,
+                    "eval_seconds": time.perf_counter() - eval_start,
+                }
+            )
+            interval_start += time.perf_counter() - eval_start
+
+        if checkpoints is not None and (completed % args.checkpoint_interval == 0 or completed == args.max_steps):
+            save_start = time.perf_counter()
+            checkpoints.save(model, optimizer, completed)
+            interval_start += time.perf_counter() - save_start
+
+    if checkpoints is not None:
+        checkpoints.close()
+    metrics.close()
+
+
+if __name__ == "__main__":
+    main()
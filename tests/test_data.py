@@ -70,3 +70,18 @@ def test_get_batch():
             device="cuda:99",
         )
         assert "CUDA error" in str(excinfo.value) or "Torch not compiled with CUDA enabled" in str(excinfo.value)
+
+
+def test_skip_batches_continues_the_batch_sequence():
+    import torch
+
+    from cs336_basics.data import get_batch, skip_batches
+
+    dataset = np.arange(0, 100)
+    generator = np.random.default_rng(0)
+    batches = [get_batch(dataset, 4, 8, "cpu", generator)[0] for _ in range(5)]
+
+    resumed = np.random.default_rng(0)
+    skip_batches(dataset, 4, 8, 3, resumed)
+    for expected in batches[3:]:
+        torch.testing.assert_close(get_batch(dataset, 4, 8, "cpu", resumed)[0], expected)
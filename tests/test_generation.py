@@ -0,0 +1,106 @@
+import numpy
+import torch
+
+from cs336_basics.generation import generate, sample_next_token
+from cs336_basics.model import TransformerLM
+
+
+def _tiny_lm(context_length: int = 32) -> TransformerLM:
+    torch.manual_seed(0)
+    return TransformerLM(
+        vocab_size=64,
+        context_length=context_length,
+        d_model=32,
+        num_layers=2,
+        num_heads=4,
+        d_ff=64,
+        rope_theta=10000.0,
+    )
+
+
+def test_kv_cache_matches_full_forward():
+    model = _tiny_lm()
+    in_indices = torch.randint(0, 64, (2, 12))
+    expected = model(in_indices)
+
+    kv_cache = model.new_kv_cache(batch_size=2)
+    prefill = model(in_indices[:, :5], kv_cache=kv_cache)
+    steps = [model(in_indices[:, i : i + 1], kv_cache=kv_cache) for i in range(5, 12)]
+    actual = torch.cat([prefill, *steps], dim=1)
+
+    assert kv_cache.seq_len == 12
+    numpy.testing.assert_allclose(actual.detach().numpy(), expected.detach().numpy(), atol=1e-5)
+
+
+def test_greedy_generate_matches_recompute():
+    model = _tiny_lm()
+    prompt = [1, 2, 3, 4]
+    output = generate(model, prompt, max_new_tokens=10, temperature=0.0)
+
+    expected = list(prompt)
+    with torch.no_grad():
+        for _ in range(10):
+            expected.append(int(model(torch.tensor([expected]))[0, -1].argmax()))
+
+    assert output.token_ids == expected
+    assert output.num_new_tokens == 10
+    assert output.tokens_per_second > 0
+
+
+def test_generate_stops_at_context_length():
+    model = _tiny_lm(context_length=8)
+    output = generate(model, [1, 2, 3], max_new_tokens=20, temperature=1.0)
+    assert len(output.token_ids) <= 9
+
+
+def test_top_p_keeps_only_the_nucleus():
+    logits = torch.log(torch.tensor([0.5, 0.3, 0.15, 0.05]))
+    generator = torch.Generator().manual_seed(0)
+    samples = {int(sample_next_token(logits, top_p=0.75, generator=generator)) for _ in range(200)}
+    assert samples == {0, 1}
+
+
+def test_slot_kv_cache_matches_full_forward_for_sequences_of_different_lengths():
+    model = _tiny_lm()
+    a, b = torch.randint(0, 64, (2, 12)).unbind(0)
+    kv_cache = model.new_slot_kv_cache(num_slots=3)
+    with torch.no_grad():
+        # Prefill the sequences one at a time into arbitrary slots, then decode them together.
+        kv_cache.select([2])
+        outputs_a = [model(a[None, :6], kv_cache=kv_cache)]
+        kv_cache.select([0])
+        outputs_b = [model(b[None, :3], kv_cache=kv_cache)]
+        for i in range(6):
+            kv_cache.select([2, 0])
+            step = model(torch.stack([a[6 + i : 7 + i], b[3 + i : 4 + i]]), kv_cache=kv_cache)
+            outputs_a.append(step[:1])
+            outputs_b.append(step[1:])
+        expected_a, expected_b = model(a[None]), model(b[None, :9])
+
+    assert (kv_cache.length(2), kv_cache.length(0), kv_cache.length(1)) == (12, 9, 0)
+    numpy.testing.assert_allclose(torch.cat(outputs_a, dim=1).numpy(), expected_a.numpy(), atol=1e-5)
+    numpy.testing.assert_allclose(torch.cat(outputs_b, dim=1).numpy(), expected_b.numpy(), atol=1e-5)
+
+
+def test_generation_server_batches_concurrent_requests():
+    import asyncio
+
+    from cs336_basics.serving import GenerationServer
+    from cs336_basics.tokenizer import Tokenizer
+
+    torch.manual_seed(0)
+    model = TransformerLM(256, 64, 32, 2, 4, 64, rope_theta=10000.0)
+    tokenizer = Tokenizer({i: bytes([i]) for i in range(256)}, [])
+    requests = [("hello", 8), ("a", 12), ("the quick brown fox", 5), ("lorem ipsum", 10), ("z", 1)]
+
+    async def serve():
+        # Fewer slots than requests, so later requests have to wait for finished sequences' slots.
+        async with GenerationServer(model, tokenizer, max_batch_size=2) as server:
+            completions = await asyncio.gather(*(server.complete(prompt, n, temperature=0.0) for prompt, n in requests))
+            return completions, server.stats
+
+    completions, stats = asyncio.run(serve())
+    for (prompt, max_new_tokens), completion in zip(requests, completions):
+        expected = generate(model, tokenizer.encode(prompt), max_new_tokens, temperature=0.0)
+        assert completion == tokenizer.decode(expected.token_ids[expected.num_prompt_tokens :])
+    assert stats.mean_batch_size > 1
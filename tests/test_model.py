@@ -1,8 +1,15 @@
+import copy
+
 from einops import rearrange
 import numpy
 import torch
+import torch._dynamo
 import torch.nn.functional as F
 
+from cs336_basics.blockwise_attention import blockwise_attention
+from cs336_basics.model import MultiHeadSelfAttention, TransformerBlock, TransformerLM
+from cs336_basics.quantization import QuantizedLinear, quantize_model_, quantize_per_channel
+
 from .adapters import (
     run_multihead_self_attention_with_rope,
     run_rope,
@@ -17,6 +24,22 @@ from .adapters import (
     run_embedding,
 )
 
+# A TransformerLM small enough to compare exactly against reference computations on CPU.
+TINY_LM_CONFIG = {
+    "vocab_size": 50,
+    "context_length": 16,
+    "d_model": 32,
+    "num_layers": 2,
+    "num_heads": 4,
+    "d_ff": 64,
+    "rope_theta": 1e4,
+}
+
+
+def tiny_lm(**kwargs) -> TransformerLM:
+    """A `TransformerLM` with `TINY_LM_CONFIG`, updated by `kwargs`."""
+    return TransformerLM(**{**TINY_LM_CONFIG, **kwargs})
+
 
 def test_linear(numpy_snapshot, ts_state_dict, in_embeddings, d_model, d_ff):
     w1_weight = ts_state_dict[0]["layers.0.ffn.w1.weight"]
@@ -200,3 +223,175 @@ def test_silu_matches_pytorch():
     expected_output = F.silu(x)
     actual_output = run_silu(x)
     numpy.testing.assert_allclose(actual_output.detach().numpy(), expected_output.detach().numpy(), atol=1e-6)
+
+
+def test_rope_tables_shared_across_layers():
+    model = TransformerLM(
+        vocab_size=100, context_length=16, d_model=32, num_layers=3, num_heads=4, d_ff=64, rope_theta=10000.0
+    )
+    cos_tables = {layer.attn.rope.cos.data_ptr() for layer in model.layers}
+    assert cos_tables == {model.rope.cos.data_ptr()}
+    # RoPE tables are derived state and must not leak into checkpoints.
+    assert not any("cos" in key or "sin" in key for key in model.state_dict())
+    # Tables are shared within a model only, so moving or casting one model cannot affect another.
+    first, second = tiny_lm(), tiny_lm()
+    assert first.rope.cos.data_ptr() != second.rope.cos.data_ptr()
+
+
+def test_multihead_self_attention_loads_separate_qkv_weights():
+    torch.manual_seed(0)
+    d_model, num_heads, seq_len = 32, 4, 6
+    weights = {f"{name}_proj.weight": 0.1 * torch.randn(d_model, d_model) for name in ("q", "k", "v", "output")}
+    x = torch.randn(2, seq_len, d_model)
+
+    attn = MultiHeadSelfAttention(d_model, num_heads)
+    attn.load_state_dict(weights)
+    assert set(attn.state_dict()) == {"qkv_proj.weight", "output_proj.weight"}
+
+    q, k, v = (
+        rearrange(x @ weights[f"{name}_proj.weight"].T, "b s (h d) -> b h s d", h=num_heads) for name in ("q", "k", "v")
+    )
+    expected = F.scaled_dot_product_attention(q, k, v, is_causal=True)
+    expected = rearrange(expected, "b h s d -> b s (h d)") @ weights["output_proj.weight"].T
+    numpy.testing.assert_allclose(attn(x).detach().numpy(), expected.numpy(), atol=1e-5)
+
+
+def test_blockwise_attention_matches_snapshots(numpy_snapshot, q, k, v, mask):
+    # Small tiles so that every query and key dimension is split across several tiles.
+    output = blockwise_attention(q, k, v, mask=mask, q_tile_size=5, k_tile_size=3)
+    numpy_snapshot.assert_match(output, atol=1e-6, test_name="test_scaled_dot_product_attention")
+
+    q, k, v = (rearrange(x, "(batch head) seq d -> batch head seq d", head=2) for x in (q, k, v))
+    mask = rearrange(mask, "(batch head) query key -> batch head query key", head=2)
+    output = blockwise_attention(q, k, v, mask=mask, q_tile_size=5, k_tile_size=3)
+    numpy_snapshot.assert_match(output, atol=1e-6, test_name="test_4d_scaled_dot_product_attention")
+
+
+def test_blockwise_attention_lm_matches_dense():
+    torch.manual_seed(0)
+    dense = tiny_lm(vocab_size=100, context_length=300)
+    blockwise = tiny_lm(vocab_size=100, context_length=300, attention_impl="blockwise")
+    blockwise.load_state_dict(dense.state_dict())
+    in_indices = torch.randint(0, 100, (2, 300))
+
+    dense_loss = F.cross_entropy(dense(in_indices).flatten(0, 1), in_indices.flatten())
+    blockwise_loss = F.cross_entropy(blockwise(in_indices).flatten(0, 1), in_indices.flatten())
+    dense_loss.backward()
+    blockwise_loss.backward()
+
+    numpy.testing.assert_allclose(blockwise_loss.item(), dense_loss.item(), rtol=1e-5)
+    for (name, dense_param), blockwise_param in zip(dense.named_parameters(), blockwise.parameters()):
+        numpy.testing.assert_allclose(blockwise_param.grad.numpy(), dense_param.grad.numpy(), atol=1e-5, err_msg=name)
+
+
+def test_transformer_lm_loss_matches_full_logits():
+    torch.manual_seed(0)
+    model = tiny_lm()
+    inputs, targets = torch.randint(0, 50, (2, 2, 16)).unbind(0)
+
+    expected = F.cross_entropy(model(inputs).flatten(0, 1), targets.flatten())
+    expected_grads = torch.autograd.grad(expected, list(model.parameters()))
+    actual = model.loss(inputs, targets)
+    actual_grads = torch.autograd.grad(actual, list(model.parameters()))
+
+    numpy.testing.assert_allclose(actual.item(), expected.item(), rtol=1e-5)
+    for (name, _), actual_grad, expected_grad in zip(model.named_parameters(), actual_grads, expected_grads):
+        numpy.testing.assert_allclose(actual_grad.numpy(), expected_grad.numpy(), atol=1e-5, err_msg=name)
+
+
+def test_activation_checkpointing_matches_stored_activations():
+    torch.manual_seed(0)
+    model = tiny_lm()
+    inputs, targets = torch.randint(0, 50, (2, 2, 16)).unbind(0)
+
+    expected_grads = torch.autograd.grad(model.loss(inputs, targets), list(model.parameters()))
+    model.activation_checkpointing = True
+    actual_grads = torch.autograd.grad(model.loss(inputs, targets), list(model.parameters()))
+
+    for (name, _), actual_grad, expected_grad in zip(model.named_parameters(), actual_grads, expected_grads):
+        numpy.testing.assert_allclose(actual_grad.numpy(), expected_grad.numpy(), atol=1e-6, err_msg=name)
+
+
+def test_fused_transformer_block_matches_snapshot(
+    numpy_snapshot, ts_state_dict, in_embeddings, d_model, n_heads, d_ff, n_keys, theta
+):
+    block_weights = {k.replace("layers.0.", ""): v for k, v in ts_state_dict[0].items() if "layers.0." in k}
+    block = TransformerBlock(d_model, n_heads, d_ff, n_keys, theta, block_impl="fused")
+    block.load_state_dict(block_weights)
+    numpy_snapshot.assert_match(block(in_embeddings), atol=1e-6, test_name="test_transformer_block")
+
+
+def test_fused_transformer_block_matches_eager():
+    torch.manual_seed(0)
+    eager = TransformerBlock(32, 4, 64, 16, 1e4)
+    fused = TransformerBlock(32, 4, 64, 16, 1e4, block_impl="fused")
+    with torch.no_grad():
+        for p in eager.parameters():
+            p.add_(0.1 * torch.randn_like(p))
+    fused.load_state_dict(eager.state_dict())
+    x = torch.randn(2, 16, 32, requires_grad=True)
+
+    expected = eager(x)
+    actual = fused(x)
+    numpy.testing.assert_allclose(actual.detach().numpy(), expected.detach().numpy(), atol=1e-6)
+    grad_output = torch.randn_like(expected)
+    expected_grads = torch.autograd.grad(expected, [x, *eager.parameters()], grad_output)
+    actual_grads = torch.autograd.grad(actual, [x, *fused.parameters()], grad_output)
+    for name, actual_grad, expected_grad in zip(["x", *dict(fused.named_parameters())], actual_grads, expected_grads):
+        numpy.testing.assert_allclose(actual_grad.numpy(), expected_grad.numpy(), atol=1e-5, err_msg=name)
+
+    # Both variants must trace into a single graph, so block_impl="compiled" (of either) has no graph breaks.
+    for block in (eager, fused):
+        assert torch._dynamo.explain(block)(x).graph_break_count == 0
+
+
+def test_tied_embeddings_share_one_parameter_and_load_untied_state_dicts():
+    torch.manual_seed(0)
+    untied = tiny_lm()
+    with torch.no_grad():
+        untied.token_embeddings.weight.copy_(untied.lm_head.weight)
+    tied = tiny_lm(tie_embeddings=True)
+    tied.load_state_dict(untied.state_dict())
+    assert tied.token_embeddings.weight is tied.lm_head.weight
+    assert len(list(tied.parameters())) == len(list(untied.parameters())) - 1
+
+    # With equal matrices the models compute the same loss; the shared gradient is the sum of both uses.
+    inputs, targets = torch.randint(0, 50, (2, 2, 16)).unbind(0)
+    tied_loss, untied_loss = tied.loss(inputs, targets), untied.loss(inputs, targets)
+    tied_loss.backward()
+    untied_loss.backward()
+    numpy.testing.assert_allclose(tied_loss.item(), untied_loss.item(), rtol=1e-6)
+    expected_grad = untied.token_embeddings.weight.grad + untied.lm_head.weight.grad
+    numpy.testing.assert_allclose(tied.lm_head.weight.grad.numpy(), expected_grad.numpy(), atol=1e-6)
+
+    # The tied matrix is saved once, and an untied model loads it into both places.
+    state_dict = tied.state_dict()
+    assert "lm_head.weight" not in state_dict
+    reloaded = tiny_lm()
+    reloaded.load_state_dict(state_dict)
+    assert torch.equal(reloaded.lm_head.weight, tied.lm_head.weight)
+    assert torch.equal(reloaded.token_embeddings.weight, tied.lm_head.weight)
+
+
+def test_int8_quantized_model_tracks_fp32_and_round_trips_its_state_dict():
+    weight = torch.randn(8, 16)
+    codes, scale = quantize_per_channel(weight)
+    assert codes.dtype == torch.int8
+    # Rounding to the nearest code is off by at most half a step per channel.
+    assert ((codes.float() * scale[:, None] - weight).abs() <= scale[:, None] / 2 + 1e-7).all()
+
+    torch.manual_seed(0)
+    model = tiny_lm(tie_embeddings=True).eval()
+    inputs = torch.randint(0, 50, (2, 16))
+    with torch.no_grad():
+        expected = model(inputs)
+        for backend in ("dequant", "int8_gemm"):
+            quantized = quantize_model_(copy.deepcopy(model), backend)
+            assert isinstance(quantized.lm_head, QuantizedLinear)
+            assert isinstance(quantized.layers[0].ffn.w2, QuantizedLinear)
+            actual = quantized(inputs)
+            assert (actual - expected).norm() / expected.norm() < 0.05
+
+            reloaded = quantize_model_(tiny_lm(tie_embeddings=True).eval(), backend)
+            reloaded.load_state_dict(quantized.state_dict())
+            assert torch.equal(reloaded(inputs), actual)
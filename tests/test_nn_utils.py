@@ -3,6 +3,8 @@ import torch
 import torch.nn.functional as F
 from torch.nn.utils.clip_grad import clip_grad_norm_
 
+from cs336_basics.nn_utils import lm_head_cross_entropy, rms_norm
+
 from .adapters import run_cross_entropy, run_gradient_clipping, run_softmax
 
 
@@ -87,3 +89,55 @@ def test_gradient_clipping():
             t1_c_grad.detach().numpy(),
             atol=1e-6,
         )
+
+
+def test_lm_head_cross_entropy_matches_full_logits():
+    torch.manual_seed(0)
+    batch_size, seq_len, d_model, vocab_size = 3, 7, 16, 50
+    hidden = torch.randn(batch_size, seq_len, d_model, requires_grad=True)
+    norm_weight = torch.nn.Parameter(torch.rand(d_model) + 0.5)
+    lm_head_weight = torch.nn.Parameter(torch.randn(vocab_size, d_model))
+    targets = torch.randint(0, vocab_size, (batch_size, seq_len))
+
+    logits = rms_norm(hidden, norm_weight) @ lm_head_weight.T
+    expected = F.cross_entropy(logits.view(-1, vocab_size), targets.view(-1))
+    expected_grads = torch.autograd.grad(expected, (hidden, norm_weight, lm_head_weight))
+
+    # A chunk size that does not divide batch_size * seq_len exercises the ragged last chunk.
+    actual = lm_head_cross_entropy(hidden, norm_weight, lm_head_weight, targets, chunk_size=4)
+    actual_grads = torch.autograd.grad(actual, (hidden, norm_weight, lm_head_weight))
+
+    numpy.testing.assert_allclose(actual.detach().numpy(), expected.detach().numpy(), atol=1e-5)
+    for actual_grad, expected_grad in zip(actual_grads, expected_grads):
+        numpy.testing.assert_allclose(actual_grad.numpy(), expected_grad.numpy(), atol=1e-5)
+
+    # Loss-only evaluation, and a backward that needs only some of the gradients.
+    with torch.no_grad():
+        no_grad_loss = lm_head_cross_entropy(hidden, norm_weight, lm_head_weight, targets, chunk_size=4)
+    assert not no_grad_loss.requires_grad
+    numpy.testing.assert_allclose(no_grad_loss.numpy(), expected.detach().numpy(), atol=1e-5)
+    frozen_head = lm_head_cross_entropy(hidden, norm_weight, lm_head_weight.detach(), targets, chunk_size=4)
+    (hidden_grad,) = torch.autograd.grad(frozen_head, (hidden,))
+    numpy.testing.assert_allclose(hidden_grad.numpy(), expected_grads[0].numpy(), atol=1e-5)
+
+
+def test_clip_gradients_returns_pre_clip_norm_and_skips_small_gradients():
+    from cs336_basics.nn_utils import clip_gradients
+
+    torch.manual_seed(0)
+    params = [torch.nn.Parameter(torch.randn(4, 3)), torch.nn.Parameter(torch.randn(5, dtype=torch.float64))]
+    for p in params:
+        p.grad = torch.randn_like(p)
+    expected_norm = torch.cat([p.grad.flatten().double() for p in params]).norm().item()
+    original = [p.grad.clone() for p in params]
+
+    norm = clip_gradients(params, max_l2_norm=2 * expected_norm)
+    assert norm.dim() == 0
+    numpy.testing.assert_allclose(norm.item(), expected_norm, rtol=1e-6)
+    for p, grad in zip(params, original):
+        torch.testing.assert_close(p.grad, grad)
+
+    norm = clip_gradients(params, max_l2_norm=1.0)
+    numpy.testing.assert_allclose(norm.item(), expected_norm, rtol=1e-6)
+    clipped_norm = torch.cat([p.grad.flatten().double() for p in params]).norm().item()
+    numpy.testing.assert_allclose(clipped_norm, 1.0, rtol=1e-5)
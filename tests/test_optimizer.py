@@ -1,9 +1,23 @@
+import copy
+
 import numpy
+import pytest
 import torch
 
+from cs336_basics.model import TransformerLM
+from cs336_basics.nn_utils import cross_entropy
+from cs336_basics.optimizer import AdamW
+
 from .adapters import get_adamw_cls, run_get_lr_cosine_schedule
 
 
+def _make_mlp(dtype: torch.dtype = torch.float32) -> torch.nn.Sequential:
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(torch.nn.Linear(7, 5), torch.nn.ReLU(), torch.nn.Linear(5, 3), torch.nn.Linear(3, 2))
+    # Start from bf16-representable weights so that runs in every dtype begin at exactly the same point.
+    return model.to(torch.bfloat16).to(dtype)
+
+
 def _optimize(opt_class) -> torch.Tensor:
     torch.manual_seed(42)
     model = torch.nn.Linear(3, 2, bias=False)
@@ -93,3 +107,110 @@ def test_get_lr_cosine_schedule():
         for it in range(25)
     ]
     numpy.testing.assert_allclose(numpy.array(actual_lrs), numpy.array(expected_lrs))
+
+
+def test_adamw_matches_pytorch_across_buckets_and_reload():
+    hyperparams = {"lr": 1e-2, "weight_decay": 0.1, "betas": (0.9, 0.95), "eps": 1e-8}
+    expected_model, actual_model = _make_mlp(), _make_mlp()
+    expected_opt = torch.optim.AdamW(expected_model.parameters(), **hyperparams)
+    actual_opt = AdamW(actual_model.parameters(), **hyperparams)
+
+    def train_step(model, opt, it):
+        opt.zero_grad()
+        torch.manual_seed(it)
+        x = torch.randn(4, 7)
+        loss = model(x).pow(2).sum()
+        loss.backward()
+        if 5 <= it < 8:
+            # Parameters without gradients must be skipped, which regroups the flat buffers.
+            model[3].weight.grad = None
+        opt.step()
+
+    for it in range(10):
+        train_step(expected_model, expected_opt, it)
+        train_step(actual_model, actual_opt, it)
+    for expected, actual in zip(expected_model.parameters(), actual_model.parameters()):
+        numpy.testing.assert_allclose(actual.detach().numpy(), expected.detach().numpy(), atol=1e-6)
+
+    # Restoring the state into a fresh optimizer must continue the same trajectory.
+    reloaded_opt = AdamW(actual_model.parameters(), **hyperparams)
+    reloaded_opt.load_state_dict(actual_opt.state_dict())
+    for it in range(10, 15):
+        train_step(expected_model, expected_opt, it)
+        train_step(actual_model, reloaded_opt, it)
+    for expected, actual in zip(expected_model.parameters(), actual_model.parameters()):
+        numpy.testing.assert_allclose(actual.detach().numpy(), expected.detach().numpy(), atol=1e-6)
+
+
+@pytest.mark.parametrize("state_mode", ["bf16", "int8", "factored"])
+def test_adamw_state_modes_track_fp32(state_mode):
+    def train(model, opt, steps):
+        losses = []
+        for it in range(steps):
+            torch.manual_seed(1000 + it)
+            tokens = torch.randint(0, 8, (4, 17)).cumsum(dim=-1) % 64
+            loss = cross_entropy(model(tokens[:, :-1]).flatten(0, 1), tokens[:, 1:].flatten())
+            opt.zero_grad()
+            loss.backward()
+            opt.step()
+            losses.append(loss.item())
+        return losses
+
+    hyperparams = {"lr": 1e-2, "weight_decay": 0.01, "betas": (0.9, 0.95)}
+    torch.manual_seed(0)
+    reference_model = TransformerLM(64, 16, 32, 2, 4, 64, rope_theta=10000.0)
+    model = copy.deepcopy(reference_model)
+    reference_opt = AdamW(reference_model.parameters(), **hyperparams)
+    opt = AdamW(model.parameters(), state_mode=state_mode, **hyperparams)
+    reference_losses = train(reference_model, reference_opt, 40)
+    losses = train(model, opt, 40)
+
+    assert losses[-1] < 0.7 * losses[0]
+    numpy.testing.assert_allclose(losses, reference_losses, rtol=0.05)
+    assert opt.state_memory_bytes() < 0.55 * reference_opt.state_memory_bytes()
+
+    # A round trip through state_dict (as in a checkpoint) must not change the trajectory.
+    resumed_model = copy.deepcopy(reference_model)
+    resumed_model.load_state_dict(model.state_dict())
+    resumed_opt = AdamW(resumed_model.parameters(), state_mode=state_mode, **hyperparams)
+    resumed_opt.load_state_dict(opt.state_dict())
+    numpy.testing.assert_allclose(train(resumed_model, resumed_opt, 3), train(model, opt, 3), rtol=1e-5)
+
+
+def test_adamw_master_weights_keep_small_updates_of_bf16_params():
+    def train(model, opt, steps, start=0):
+        for it in range(start, start + steps):
+            # The same (bf16-representable) gradients for every run, so only the update arithmetic differs.
+            torch.manual_seed(it)
+            for p in model.parameters():
+                p.grad = torch.randn(p.shape).to(torch.bfloat16).to(p.dtype)
+            opt.step()
+
+    # Updates of ~1e-4 are below half a bf16 ulp for most weights, so plain bf16 parameters barely move.
+    hyperparams = {"lr": 1e-4, "weight_decay": 0.01, "betas": (0.9, 0.95)}
+    reference, plain, master = _make_mlp(), _make_mlp(torch.bfloat16), _make_mlp(torch.bfloat16)
+    reference_opt = AdamW(reference.parameters(), **hyperparams)
+    plain_opt = AdamW(plain.parameters(), **hyperparams)
+    master_opt = AdamW(master.parameters(), master_weights=True, **hyperparams)
+    for model, opt in ((reference, reference_opt), (plain, plain_opt), (master, master_opt)):
+        train(model, opt, 50)
+
+    def error(params):
+        return max((p.float() - q).abs().max().item() for p, q in zip(params, reference.parameters()))
+
+    master_params = [master_opt.state[p]["master_param"] for p in master.parameters()]
+    assert error(master_params) < 1e-6
+    assert error(plain.parameters()) > 1e-3
+    for p, m in zip(master.parameters(), master_params):
+        assert m.dtype == torch.float32
+        assert torch.equal(p, m.to(torch.bfloat16))
+
+    # The fp32 master weights survive a state_dict round trip instead of being rounded to the params' dtype.
+    resumed = _make_mlp(torch.bfloat16)
+    resumed.load_state_dict(master.state_dict())
+    resumed_opt = AdamW(resumed.parameters(), master_weights=True, **hyperparams)
+    resumed_opt.load_state_dict(master_opt.state_dict())
+    train(resumed, resumed_opt, 3, start=50)
+    train(master, master_opt, 3, start=50)
+    for p, q in zip(resumed_opt.state.values(), master_opt.state.values()):
+        assert torch.equal(p["master_param"], q["master_param"])
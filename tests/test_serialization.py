@@ -119,3 +119,81 @@ def test_checkpointing(tmp_path):
         )
     # compare the optimizer state dicts
     assert are_optimizers_equal(original_optimizer_state, new_optimizer_state)
+
+
+def test_checkpoint_manager_writes_in_background_and_rotates(tmp_path):
+    import io
+
+    from cs336_basics.checkpointing import CheckpointManager
+
+    torch.manual_seed(0)
+    model = _TestNet()
+    optimizer = get_adamw_cls()(model.parameters(), lr=1e-3)
+    (tmp_path / "checkpoint_best.pt").write_bytes(b"not managed")
+
+    with CheckpointManager(tmp_path, keep_last=2) as manager:
+        for it in range(1, 5):
+            model(torch.rand(100)).sum().backward()
+            optimizer.step()
+            expected_weight = model.fc1.weight.detach().clone()
+            manager.save(model, optimizer, it)
+            # The snapshot is taken before save() returns, so later updates must not leak into it.
+            with torch.no_grad():
+                model.fc1.weight.add_(1.0)
+        buffer = io.BytesIO()
+        manager.save(model, optimizer, 99, out=buffer).result()
+
+    assert sorted(p.name for p in tmp_path.glob("checkpoint_*.pt")) == [
+        "checkpoint_00000003.pt",
+        "checkpoint_00000004.pt",
+        "checkpoint_best.pt",
+    ]
+    assert not list(tmp_path.glob(".*.tmp"))
+    assert manager.latest() == tmp_path / "checkpoint_00000004.pt"
+
+    new_model = _TestNet()
+    new_optimizer = get_adamw_cls()(new_model.parameters(), lr=1e-3)
+    assert run_load_checkpoint(manager.latest(), new_model, new_optimizer) == 4
+    numpy.testing.assert_allclose(new_model.fc1.weight.detach().numpy(), expected_weight.numpy())
+    buffer.seek(0)
+    assert run_load_checkpoint(buffer, new_model, new_optimizer) == 99
+
+
+def test_tensor_archive_round_trip_is_lazy_and_preserves_structure(tmp_path):
+    from cs336_basics.checkpointing import read_checkpoint, save_checkpoint, write_checkpoint
+
+    state = {
+        "weights": {"a": torch.randn(3, 5), "b": torch.arange(7, dtype=torch.bfloat16), "scalar": torch.tensor(2.5)},
+        "state": {0: {"step": 3, "codes": torch.randint(-127, 128, (9,), dtype=torch.int8)}, 1: {}},
+        "betas": (0.9, 0.95),
+        "params": [0, 1],
+        "name": "run",
+        "extra": None,
+    }
+    torch_path, archive_path = tmp_path / "state.pt", tmp_path / "state.archive"
+    torch.save(state, torch_path)
+    write_checkpoint(torch.load(torch_path), archive_path, format="mmap")
+
+    loaded = read_checkpoint(archive_path)
+    assert loaded.keys() == state.keys()
+    assert loaded["betas"] == (0.9, 0.95) and loaded["params"] == [0, 1] and loaded["extra"] is None
+    assert list(loaded["state"]) == [0, 1] and loaded["state"][0]["step"] == 3
+    for key, expected in state["weights"].items():
+        assert loaded["weights"][key].dtype == expected.dtype
+        torch.testing.assert_close(loaded["weights"][key], expected)
+    torch.testing.assert_close(loaded["state"][0]["codes"], state["state"][0]["codes"])
+    # Tensors are views into the file mapping, not separately allocated copies.
+    assert loaded["weights"]["a"].untyped_storage().data_ptr() == loaded["weights"]["b"].untyped_storage().data_ptr()
+
+    torch.manual_seed(0)
+    model = _TestNet()
+    optimizer = get_adamw_cls()(model.parameters(), lr=1e-3)
+    model(torch.rand(100)).sum().backward()
+    optimizer.step()
+    save_checkpoint(model, optimizer, 7, tmp_path / "checkpoint.archive", format="mmap")
+    new_model = _TestNet()
+    new_optimizer = get_adamw_cls()(new_model.parameters(), lr=1e-3)
+    assert run_load_checkpoint(tmp_path / "checkpoint.archive", new_model, new_optimizer) == 7
+    for expected, actual in zip(model.parameters(), new_model.parameters()):
+        torch.testing.assert_close(actual, expected)
+    assert are_optimizers_equal(optimizer.state_dict(), new_optimizer.state_dict())
@@ -462,3 +462,27 @@ def _encode(tokenizer, text):
     for just this function. We set the memory limit to 1MB.
     """
     return tokenizer.encode(text)
+
+
+def test_encode_cache_is_bounded_and_does_not_change_ids():
+    from cs336_basics.tokenizer import Tokenizer
+
+    tokenizer = Tokenizer.from_files(VOCAB_PATH, MERGES_PATH, ["<|endoftext|>"], cache_size=8)
+    uncached = Tokenizer.from_files(VOCAB_PATH, MERGES_PATH, ["<|endoftext|>"], cache_size=0)
+    with open(FIXTURES_PATH / "tinystories_sample.txt") as f:
+        contents = f.read()
+    ids = tokenizer.encode(contents)
+    assert ids == uncached.encode(contents)
+    assert len(tokenizer._cache) == 8
+    assert 0 < tokenizer.cache_hit_rate < 1
+    assert uncached.cache_hit_rate == 0
+
+    # Every pre-token of a repeated word is a hit once it has been seen.
+    tokenizer.clear_cache()
+    tokenizer.encode(" the the the the")
+    assert (tokenizer.cache_hits, tokenizer.cache_misses) == (3, 1)
+
+    # A hit refreshes the entry, so the frequent " the" outlives the words seen once around it.
+    lru = Tokenizer.from_files(VOCAB_PATH, MERGES_PATH, cache_size=2)
+    lru.encode(" the a the b the c the")
+    assert (lru.cache_hits, lru.cache_misses) == (3, 4)
@@ -1,6 +1,8 @@
 import json
 import time
 
+import pytest
+
 from .adapters import run_train_bpe
 from .common import FIXTURES_PATH, gpt2_bytes_to_unicode
 
@@ -86,3 +88,122 @@ def test_train_bpe_special_tokens(snapshot):
             "merges": merges,
         },
     )
+
+
+def test_train_bpe_reports_phase_seconds_and_profile_events():
+    phase_seconds = {}
+    events = []
+    _, merges = run_train_bpe(
+        input_path=FIXTURES_PATH / "corpus.en",
+        vocab_size=300,
+        special_tokens=["<|endoftext|>"],
+        num_processes=2,
+        phase_seconds=phase_seconds,
+        profile=events.append,
+        profile_interval=10,
+    )
+    assert len(merges) == 300 - 257
+    assert set(phase_seconds) == {"chunking", "pretokenize", "merge_counts", "pair_counts", "merge_loop"}
+    assert all(seconds >= 0 for seconds in phase_seconds.values())
+
+    phase_events = [event for event in events if event["event"] == "phase"]
+    assert sum(event["seconds"] for event in phase_events) == pytest.approx(sum(phase_seconds.values()))
+    merge_events = [event for event in events if event["event"] == "merges"]
+    # One snapshot per 10 merges, plus one for the last 3.
+    assert [event["num_merges"] for event in merge_events] == [10, 20, 30, 40, 43]
+    assert all(event["heap_size"] >= event["pair_counts_size"] > 0 for event in merge_events)
+    assert all(event["max_affected_pre_tokens"] >= event["mean_affected_pre_tokens"] > 0 for event in merge_events)
+
+
+def test_train_bpe_sharded_pair_counts_match_single_process():
+    kwargs = {"input_path": FIXTURES_PATH / "corpus.en", "vocab_size": 400, "special_tokens": ["<|endoftext|>"]}
+    vocab, merges = run_train_bpe(**kwargs, num_processes=1)
+    events = []
+    sharded_vocab, sharded_merges = run_train_bpe(**kwargs, num_processes=3, profile=events.append)
+    assert sharded_merges == merges
+    assert sharded_vocab == vocab
+    (pair_counts_event,) = [event for event in events if event.get("phase") == "pair_counts"]
+    assert pair_counts_event["num_shards"] == 3
+
+
+def test_train_bpe_sampled_chunks_approximate_the_full_run(tmp_path):
+    from cs336_basics.bpe import merge_overlap
+
+    # corpus.en has no special tokens, so split it into documents of 10 lines for the sampler to pick from.
+    lines = (FIXTURES_PATH / "corpus.en").read_text(encoding="utf-8").splitlines(keepends=True)
+    input_path = tmp_path / "corpus.txt"
+    input_path.write_text("<|endoftext|>".join("".join(lines[i : i + 10]) for i in range(0, len(lines), 10)))
+    kwargs = {"input_path": input_path, "vocab_size": 350, "special_tokens": ["<|endoftext|>"], "num_processes": 1}
+    _, full_merges = run_train_bpe(**kwargs)
+    events = []
+    _, merges = run_train_bpe(**kwargs, sample_rate=0.25, seed=1, profile=events.append)
+    (pretokenize_event,) = [event for event in events if event.get("phase") == "pretokenize"]
+    assert 0.15 < pretokenize_event["sampled_fraction"] < 0.35
+    assert len(merges) == len(full_merges)
+    assert run_train_bpe(**kwargs, sample_rate=0.25, seed=1)[1] == merges
+    assert merge_overlap(merges, full_merges)["overlap_top_100pct"] > 0.8
+    assert merge_overlap(full_merges, full_merges)["common_prefix"] == len(full_merges)
+
+    with pytest.raises(ValueError, match="sample_rate"):
+        run_train_bpe(**kwargs, sample_rate=0.0)
+
+
+def test_train_bpe_pruning_bounds_pre_tokens_and_reports_guaranteed_merges(tmp_path):
+    import random
+
+    # Frequent pre-tokens from corpus.en, plus singletons that pruning drops.
+    rng = random.Random(0)
+    singletons = " ".join("".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(6)) for _ in range(2000))
+    input_path = tmp_path / "corpus.txt"
+    input_path.write_text((FIXTURES_PATH / "corpus.en").read_text(encoding="utf-8") * 3 + singletons)
+    kwargs = {"input_path": input_path, "vocab_size": 400, "special_tokens": ["<|endoftext|>"], "num_processes": 1}
+    _, full_merges = run_train_bpe(**kwargs)
+
+    events = []
+    _, merges = run_train_bpe(**kwargs, min_count=2, profile=events.append)
+    (pruning,) = [event for event in events if event["event"] == "pruning"]
+    assert pruning["pair_count_error_bound"] > 0
+    assert 0 < pruning["guaranteed_merges"] <= len(merges)
+    assert merges[: pruning["guaranteed_merges"]] == full_merges[: pruning["guaranteed_merges"]]
+
+    events = []
+    _, merges = run_train_bpe(**kwargs, max_pre_tokens=3000, profile=events.append)
+    (pruning,) = [event for event in events if event["event"] == "pruning"]
+    assert pruning["num_pre_tokens"] == 3000
+    assert len(merges) == len(full_merges)
+
+    # A rare special token is kept, so its bytes do not loosen the error bound.
+    input_path.write_text(" ab ab ab<|endoftext|> ab")
+    events = []
+    run_train_bpe(**{**kwargs, "vocab_size": 258}, min_count=2, profile=events.append)
+    (pruning,) = [event for event in events if event["event"] == "pruning"]
+    assert pruning["pair_count_error_bound"] == 0
+
+
+def test_train_bpe_extends_an_existing_vocab_with_stable_ids():
+    from cs336_basics.tokenizer import Tokenizer
+
+    kwargs = {"input_path": FIXTURES_PATH / "corpus.en", "special_tokens": ["<|endoftext|>"], "num_processes": 1}
+    small_vocab, small_merges = run_train_bpe(**kwargs, vocab_size=300)
+    vocab, merges = run_train_bpe(**kwargs, vocab_size=400)
+    # Replaying our own merges and carrying on learns what training from scratch would.
+    extended = run_train_bpe(**kwargs, vocab_size=400, initial_vocab=small_vocab, initial_merges=small_merges)
+    assert extended == (vocab, merges)
+
+    gpt2 = Tokenizer.from_files(FIXTURES_PATH / "gpt2_vocab.json", FIXTURES_PATH / "gpt2_merges.txt")
+    phase_seconds = {}
+    extended_vocab, extended_merges = run_train_bpe(
+        **kwargs,
+        vocab_size=len(gpt2.vocab) + 20,
+        initial_vocab=gpt2.vocab,
+        initial_merges=gpt2.merges,
+        phase_seconds=phase_seconds,
+    )
+    assert "replay" in phase_seconds
+    assert len(extended_vocab) == len(gpt2.vocab) + 20
+    assert all(extended_vocab[token_id] == token for token_id, token in gpt2.vocab.items())
+    assert extended_merges[: len(gpt2.merges)] == gpt2.merges
+    assert set(extended_vocab) - set(gpt2.vocab) == set(range(len(gpt2.vocab), len(gpt2.vocab) + 20))
+
+    with pytest.raises(ValueError, match="together"):
+        run_train_bpe(**kwargs, vocab_size=400, initial_vocab=small_vocab)